@@ -0,0 +1,55 @@
+"""進階打擊與投手數據（OBP、SLG、OPS、ISO、BABIP、K%、BB%、WHIP、K/9、FIP）。
+
+這些都是計數欄位的比值：計數在資料庫用 GROUP BY 加總（或直接讀 PlayerSeasonStats
+累計列），這裡只對每一列做幾次除法，整個球員名單跨多個賽季也只是每人一次的運算。
+分母為 0 的數據顯示 '-'。
+"""
+
+# FIP = (13×全壘打 + 3×(四壞+觸身) − 2×三振) / 局數 + 常數；常數讓 FIP 與防禦率同一個尺度
+FIP_CONSTANT = 3.10
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+def _fmt(value, fmt='%.3f'):
+    return '-' if value is None else fmt % value
+
+
+def _pct(value):
+    return '-' if value is None else '%.1f%%' % (value * 100)
+
+
+def add_batting_rates(line):
+    """batting_lines 的一列 -> 加上 avg / obp / slg / ops / iso / babip / k_pct / bb_pct。"""
+    ab, hit, hr = line['ab'], line['hit'], line['hr']
+    bb, hbp, sf, k = line['bb'], line['hbp'], line['sf'], line['k']
+    total_bases = hit + line['double'] + 2 * line['triple'] + 3 * hr
+    avg = _ratio(hit, ab)
+    obp = _ratio(hit + bb + hbp, ab + bb + hbp + sf)
+    slg = _ratio(total_bases, ab)
+    line['avg'] = "%.3f" % (avg or 0.0)
+    line['obp'] = _fmt(obp)
+    line['slg'] = _fmt(slg)
+    line['ops'] = _fmt(obp + slg if obp is not None and slg is not None else None)
+    line['iso'] = _fmt(_ratio(total_bases - hit, ab))
+    line['babip'] = _fmt(_ratio(hit - hr, ab - k - hr + sf))
+    line['k_pct'] = _pct(_ratio(k, line['pa']))
+    line['bb_pct'] = _pct(_ratio(bb, line['pa']))
+    return line
+
+
+def add_pitching_rates(line):
+    """pitching_lines 的一列 -> 加上 whip / k9 / fip / k_pct / bb_pct / strike_pct。"""
+    outs = line['innings_outs']
+    innings = outs / 3 if outs else 0
+    whip = _ratio(line['bb'] + line['hits'], innings)
+    fip = _ratio(13 * line['hr'] + 3 * (line['bb'] + line['hbp']) - 2 * line['k'], innings)
+    line['whip'] = _fmt(whip, '%.2f')
+    line['k9'] = _fmt(_ratio(9 * line['k'], innings), '%.2f')
+    line['fip'] = _fmt(fip + FIP_CONSTANT if fip is not None else None, '%.2f')
+    line['k_pct'] = _pct(_ratio(line['k'], line['batters']))
+    line['bb_pct'] = _pct(_ratio(line['bb'], line['batters']))
+    line['strike_pct'] = _pct(_ratio(line['strikes'], line['pitch_count']))
+    return line
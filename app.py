@@ -1,124 +1,106 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, send_file
-from models import db, Player, Game, GameBattingOrder, AtBatStat, DefenseStat
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
+from functools import wraps
+from flask import Flask, Response, render_template, request, redirect, url_for, send_file, jsonify, abort
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, Player, Game, GameBattingOrder, AtBatStat, DefenseStat, GameInningState, ExportJob
+from summary import GameSummary, atbat_runs, resolve_players
+import results
+from season_stats import tournaments, opponents, parse_date
+import rollups
+import live
+import play_log
+import ingest
+import metrics
+import workload
+import listing
+import spray
+import scouting
+import base_out
+from game_state import (get_inning_state, apply_atbat, apply_defense, get_pitcher_pitch_count,
+                        get_total_pitch_count, get_pitch_counts, delete_inning_state, rebuild_inning_state)
+import migrations
+import db_engine
+from cache import VersionedCache, shared_backend
+from excel_export import XLSX_MIMETYPE
+from export_jobs import start_season_export, open_game_workbook
 
 app = Flask(__name__)
 #app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///baseball.db'
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_engine.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SECRET_KEY'] = 'test_secret_key'
 db.init_app(app)
-
-OUT_RESULTS = {'三振': 1, '不死三振': 0, '雙殺': 2, '外飛': 1, '內滾': 1, '內飛': 1, '犧牲': 1, '犧飛': 1, '界飛': 1}
+db_engine.init_app(app, db)
+migrations.register_commands(app)
+metrics.init_app(app, db)
+
+# game_detail 的 HTML 依 Game.data_version 快取；已完成紀錄的比賽之後都直接讀快取
+box_score_cache = VersionedCache('box_score', maxsize=int(os.environ.get('BOX_SCORE_CACHE_SIZE', 128)),
+                                 shared=shared_backend())
+game_state_cache = VersionedCache('game_state', maxsize=64, shared=shared_backend())
+
+@app.errorhandler(StaleDataError)
+def game_conflict(e):
+    # 送出期間這場比賽已被其他裝置更新（Game.data_version 樂觀鎖），這次什麼都沒寫入，
+    # 回到紀錄頁看過最新狀態後重新送出即可
+    db.session.rollback()
+    return render_template('conflict.html', back_url=request.referrer or url_for('index')), 409
+
+def play_conflicts(view):
+    # 兩台裝置同時送出同一場的紀錄時，PlayEvent 的 (game_id, seq) 或半局狀態的唯一鍵可能先撞到
+    # （還沒輪到 Game.data_version 檢查），一樣整筆 rollback、回 409 衝突頁。
+    # 進攻、防守兩台平板各自紀錄時每次寫入都會遞增 data_version，很容易互相撞到；
+    # 表單送的是這個打席的結果而不是畫面上的版本，所以 POST 先 rollback 依最新狀態重做一次，
+    # 再撞到才回 409
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        attempts = 2 if request.method == 'POST' else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                return view(*args, **kwargs)
+            except (IntegrityError, StaleDataError) as e:
+                db.session.rollback()
+                if attempt == attempts:
+                    return game_conflict(e)
+    return wrapper
+
+def ensure_editable(game):
+    # 已完成紀錄的比賽已經加進賽季累計（rollups），直接修改會讓累計與紀錄對不上；
+    # 要修改請先「重新開啟紀錄」（扣回累計），完成紀錄時再依修改後的紀錄加回
+    if game.is_recorded:
+        abort(409, '這場比賽已完成紀錄，請先重新開啟紀錄再修改')
 
 def calculate_outs(game_id, inning, source='atbat'):
-    if source == 'atbat':
-        records = AtBatStat.query.filter_by(game_id=game_id, inning=inning).all()
-        outs = sum(OUT_RESULTS.get(r.result, 0) for r in records)
-        # 加入跑者出局數
-        outs += sum(1 for r in records if r.result == 'RUNNER_OUT')
-    else:
-        records = DefenseStat.query.filter_by(game_id=game_id, inning=inning).all()
-        outs = sum(OUT_RESULTS.get(r.result, 0) for r in records)
-        outs += sum(1 for r in records if r.result == 'RUNNER_OUT')
-    return outs
-
-def calculate_pitcher_stats(game_id):
-    stats = [
-        ds for ds in DefenseStat.query.filter_by(game_id=game_id).all()
-        if ds.pitcher_id is not None
-    ]
-    pitcher_groups = {}
-    for rec in stats:
-        pid = rec.pitcher_id
-        if pid not in pitcher_groups:
-            pitcher_groups[pid] = {
-                'name': Player.query.get(pid).name if pid else "",
-                'pitcher_id': pid,
-                'innings_outs': 0,          # 累出局數，最後自行轉為局數
-                'batters': 0,
-                'pitch_count': 0,
-                'strikes': 0,
-                'hits': 0,
-                'hr': 0,
-                'bb': 0,
-                'hbp': 0,
-                'k': 0,
-                'run': 0
-            }
-        if rec.result != 'RUNNER_OUT':
-            if rec.result not in ['防守失誤', '暴投']:
-                pitcher_groups[pid]['batters'] += 1
-        pitcher_groups[pid]['pitch_count'] += rec.pitch_count
-        pitcher_groups[pid]['strikes'] += rec.strike
-        pitcher_groups[pid]['run'] += rec.runs
-        # 判斷出局
-        if rec.result in ['三振', '內滾', '外飛', '雙殺', '內飛', '犧牲', '犧飛', '界飛']:
-            pitcher_groups[pid]['innings_outs'] += (2 if rec.result == '雙殺' else 1)
-        if rec.result == 'RUNNER_OUT':
-            pitcher_groups[pid]['innings_outs'] += 1
-        # 記錄安打 (可依你設計擴大)
-        if rec.result in ['內安', '一安', '二安', '三安', '全壘']:
-            pitcher_groups[pid]['hits'] += 1
-        if rec.result == '全壘':
-            pitcher_groups[pid]['hr'] += 1
-        if rec.result == '四壞':
-            pitcher_groups[pid]['bb'] += 1
-        if rec.result == '觸身':
-            pitcher_groups[pid]['hbp'] += 1
-        if rec.result == '三振':
-            pitcher_groups[pid]['k'] += 1
-        # 記錄每局被得分 (需額外資訊可擴展)
-    # 統計 Total
-    total = {
-        'name': "Total",
-        'innings_outs': 0, 'batters': 0, 'pitch_count': 0, 'strikes': 0, 'hits': 0, 'hr': 0,
-        'bb': 0, 'hbp': 0, 'k': 0, 'run': 0
-    }
-    for v in pitcher_groups.values():
-        for key in total.keys():
-            if key != 'name': total[key] += v[key]
-    # 將局數（出局數）轉換為 1 2/3 這樣格式
-    def format_ip(outs):
-        full = outs // 3
-        rem = outs % 3
-        return f"{full} {rem}/3" if rem else str(full)
-    for v in pitcher_groups.values():
-        v['ip'] = format_ip(v['innings_outs'])
-    total['ip'] = format_ip(total['innings_outs'])
-    return list(pitcher_groups.values()), total
+    # 出局數直接讀半局狀態（GameInningState），不再重掃整局紀錄
+    state = get_inning_state(game_id, inning, 'A' if source == 'atbat' else 'D')
+    return state.outs if state else 0
 
 def get_current_inning(game_id):
-    atbats = AtBatStat.query.filter_by(game_id=game_id).all()
-    if not atbats:
+    state = (GameInningState.query
+             .filter_by(game_id=game_id, half='A')
+             .order_by(GameInningState.inning.desc())
+             .first())
+    if state is None:
         return 1
-    inning_outs = {}
-    for ab in atbats:
-        inning_outs.setdefault(ab.inning, 0)
-        inning_outs[ab.inning] += OUT_RESULTS.get(ab.result, 0)
-    max_inning = max(inning_outs.keys())
-    if inning_outs[max_inning] < 3:
-        return max_inning
-    return max_inning + 1
+    if state.outs < 3:
+        return state.inning
+    return state.inning + 1
 
 @app.route('/')
 def index():
-    completed_games = Game.query.filter_by(is_recorded=True).all()
-    uncompleted_games = Game.query.filter_by(is_recorded=False).all()
-    return render_template('index.html',
-        completed_games=completed_games,
-        uncompleted_games=uncompleted_games
-    )
+    # 首頁只有選單，比賽列表在 games / record_match_select 分頁顯示
+    return render_template('index.html')
 
 
 @app.route('/add_game', methods=['GET', 'POST'])
 def add_game():
     if request.method == 'POST':
         tournament = request.form.get('tournament', '')
-        date = request.form['date']
+        date = parse_date(request.form['date'])
+        if date is None:
+            abort(400, '日期格式不正確')
         opponent = request.form['opponent']
         first_attack = request.form['first_attack']
         game = Game(tournament=tournament,date=date, opponent=opponent, team_score=0, opponent_score=0, first_attack=first_attack)
@@ -129,8 +111,14 @@ def add_game():
 
 @app.route('/players')
 def players():
-    player_list = Player.query.all()
-    return render_template('players.html', players=player_list)
+    player_list, next_cursor = listing.player_page(request.args.get('after'))
+    # 最近一個賽季的累計數據，只查這一頁的球員
+    season = next(iter(rollups.seasons()), None)
+    ids = [p.id for p in player_list]
+    batting = {b['player_id']: b for b in rollups.batting_stats('player', player_id=ids, season=season)} if season else {}
+    pitching = {p['pitcher_id']: p for p in rollups.pitching_stats('player', player_id=ids, season=season)} if season else {}
+    return render_template('players.html', players=player_list, season=season,
+        batting=batting, pitching=pitching, next_cursor=next_cursor)
 
 @app.route('/add_player', methods=['GET', 'POST'])
 def add_player():
@@ -151,27 +139,123 @@ def delete_player(id):
     db.session.commit()
     return redirect(url_for('players'))
 
+def form_bases():
+    # 紀錄頁可選的壘上跑者，沒選就是沒記錄
+    try:
+        return base_out.parse_bases(request.form.get('bases'))
+    except ValueError:
+        abort(400, f"不明的壘包狀態：{request.form.get('bases')}")
+
+def stat_filters():
+    # 賽季數據的篩選條件：賽季、日期區間、賽事
+    return {key: request.args.get(key) or None for key in ('season', 'start', 'end', 'tournament')}
+
+@app.route('/players/<int:player_id>/stats')
+def player_stats(player_id):
+    player = Player.query.get_or_404(player_id)
+    filters = stat_filters()
+    return render_template('player_stats.html',
+        player=player,
+        filters=filters,
+        tournaments=tournaments(),
+        seasons=rollups.seasons(),
+        batting_by_tournament=rollups.batting_stats('tournament', player_id=player_id, **filters),
+        batting_total=rollups.batting_stats(player_id=player_id, **filters)[0],
+        pitching_by_tournament=rollups.pitching_stats('tournament', player_id=player_id, **filters),
+        pitching_total=rollups.pitching_stats(player_id=player_id, **filters)[0],
+        spray=spray.spray_chart(player_id, **filters))
+
+@app.route('/leaderboard')
+def leaderboard():
+    filters = stat_filters()
+    batting = rollups.batting_stats('player', **filters)
+    pitching = rollups.pitching_stats('player', **filters)
+    players_by_id = resolve_players([b['player_id'] for b in batting] + [p['pitcher_id'] for p in pitching])
+    batting.sort(key=lambda b: (b['avg'], b['hit']), reverse=True)
+    pitching.sort(key=lambda p: (p['innings_outs'], p['k']), reverse=True)
+    return render_template('leaderboard.html',
+        filters=filters,
+        tournaments=tournaments(),
+        seasons=rollups.seasons(),
+        batting=batting,
+        pitching=pitching,
+        players_by_id=players_by_id)
+
+@app.route('/spray')
+def spray_page():
+    # 擊球落點：全隊或單一球員，可另外依對手篩選
+    filters = dict(stat_filters(), opponent=request.args.get('opponent') or None)
+    player_id = request.args.get('player_id', type=int)
+    player = Player.query.get(player_id) if player_id else None
+    return render_template('spray.html',
+        filters=filters,
+        player=player,
+        players=Player.query.order_by(Player.number).all(),
+        tournaments=tournaments(),
+        opponents=opponents(),
+        seasons=rollups.seasons(),
+        spray=spray.spray_chart(player.id if player else None, **filters))
+
+@app.route('/scouting')
+def scouting_page():
+    # 對手情蒐：歷次對戰中每位對手打者的結果，以及對我方各投手的分項
+    opponent = request.args.get('opponent') or None
+    report = scouting.scouting_report(opponent) if opponent else []
+    pitcher_ids = {vs['pitcher_id'] for line in report for vs in line['vs']}
+    return render_template('scouting.html',
+        opponent=opponent,
+        opponents=scouting.scouted_opponents(),
+        report=report,
+        players_by_id=resolve_players(pitcher_ids))
+
+@app.route('/run_expectancy')
+def run_expectancy():
+    # 24 種壘包／出局狀態的得分期望值，與球員 RE24
+    season = request.args.get('season') or None
+    table = base_out.run_expectancy(season)
+    re24 = base_out.player_re24(table, season)
+    players_by_id = resolve_players(re24)
+    lines = sorted(re24.items(), key=lambda item: item[1]['re24'], reverse=True)
+    return render_template('run_expectancy.html',
+        season=season,
+        seasons=rollups.seasons(),
+        table=table,
+        base_choices=base_out.BASE_CHOICES,
+        lines=lines,
+        players_by_id=players_by_id)
+
 @app.route('/games')
 def games():
-    games = Game.query.all()
-    return render_template('games.html', games=games)
+    filters = listing.game_filters(request.args)
+    games, next_cursor = listing.game_page(request.args.get('after'), **filters)
+    return render_template('games.html', games=games, next_cursor=next_cursor,
+        args={k: v for k, v in request.args.items() if k != 'after' and v},
+        tournaments=tournaments(), opponents=opponents())
 
 @app.route('/delete_game/<int:game_id>')
 def delete_game(game_id):
+    game = Game.query.get(game_id)
+    if game and game.is_recorded:
+        # 已完成的比賽先從賽季累計扣掉，再刪紀錄
+        rollups.apply_game(game, sign=-1)
     AtBatStat.query.filter_by(game_id=game_id).delete()
     GameBattingOrder.query.filter_by(game_id=game_id).delete()
     DefenseStat.query.filter_by(game_id=game_id).delete()
+    delete_inning_state(game_id)
+    play_log.delete_play_log(game_id)
     db.session.commit()
+    box_score_cache.invalidate(game_id)
     game = Game.query.get(game_id)
     if game:
         db.session.delete(game)
         db.session.commit()
+    live.game_deleted(game_id)
     return redirect(url_for('games'))
 
 @app.route('/set_batting_order/<int:game_id>', methods=['GET', 'POST'])
 def set_batting_order(game_id):
     game = Game.query.get_or_404(game_id)
-    players = Player.query.all()
+    players = Player.query.order_by(Player.number, Player.id).all()
     # 檢查是否已設定棒次
     ordered = GameBattingOrder.query.filter_by(game_id=game_id).count()
     if ordered > 0 and request.method == 'GET':
@@ -181,6 +265,7 @@ def set_batting_order(game_id):
         else:
             return redirect(url_for('record_defense', game_id=game_id, inning=1))
     if request.method == 'POST':
+        ensure_editable(game)
         GameBattingOrder.query.filter_by(game_id=game_id).delete()
         db.session.commit()
         for order in range(1, 10):
@@ -188,6 +273,7 @@ def set_batting_order(game_id):
             if pid:
                 gbo = GameBattingOrder(game_id=game_id, player_id=int(pid), order=order-1)
                 db.session.add(gbo)
+        game.bump_version()
         db.session.commit()
         # 進攻或防守
         if game.first_attack == 'A':
@@ -197,6 +283,7 @@ def set_batting_order(game_id):
     return render_template('set_batting_order.html', players=players, game=game)
 
 @app.route('/record_atbat/<int:game_id>/<int:order>/<int:inning>', methods=['GET', 'POST'])
+@play_conflicts
 def record_atbat(game_id, order, inning):
     batting_orders = GameBattingOrder.query.filter_by(game_id=game_id).order_by(GameBattingOrder.order).all()
     total = len(batting_orders)
@@ -212,17 +299,22 @@ def record_atbat(game_id, order, inning):
 
     inning = int(inning)
     current_batter = batting_orders[order]
-    result_types = ['三振', '不死三振', '四壞', '觸身', '內安', '一安', '二安', '三安', '全壘', '失誤', '雙殺', '犧牲', '犧飛', '界飛', '外飛', '內滾', '內飛', 'RUNNER_OUT']
+    result_types = results.BATTING_CHOICES
     outs = calculate_outs(game_id, inning)
     if request.method == 'POST':
+        ensure_editable(game)
+        before = play_log.capture(game)
         selected_result = request.form['result']
+        if selected_result not in results.ATBAT_RESULTS:
+            abort(400, f'不明的打擊結果：{selected_result}')
         rbis = int(request.form.get('rbis', 0))
         position = request.form.get('position', '')
+        bases = form_bases()
         note = request.form.get('note', '')
 
         if selected_result in ['對手失誤', '暴投']:
             runs = int(request.form.get('runs', 0))
-            game.team_score = (game.team_score or 0) + runs
+            game.add_runs(team=runs)
             
             # 建立進攻紀錄 (只建立這個！)
             # 將分數記在 note 欄位，讓 game_detail 可以讀取並加總我方得分
@@ -233,13 +325,18 @@ def record_atbat(game_id, order, inning):
                 result=selected_result,
                 inning=inning,
                 rbis=0,
-                note=str(runs) 
+                note=str(runs),
+                bases=bases
             )
             db.session.add(atbat)
+            apply_atbat(atbat)
 
             # 因為 DefenseStat 是用來算 "對手得分" 的，進攻時不能加！
             
+            play_log.record_event(game, 'atbat', before, inning=inning, atbat=atbat)
+            game.bump_version()
             db.session.commit()
+            live.publish(game)
             return redirect(url_for('record_atbat', game_id=game_id, order=order, inning=inning))
         
         atbat = AtBatStat(
@@ -250,23 +347,26 @@ def record_atbat(game_id, order, inning):
             inning=inning,
             rbis=rbis,
             position=position,
-            note=note
+            note=note,
+            bases=bases
         )
         db.session.add(atbat)
         if rbis > 0:
-            game.team_score = (game.team_score or 0) + rbis
+            game.add_runs(team=rbis)
+        outs = apply_atbat(atbat).outs
+        # 這個打席結束後「下一棒」；跑者出局不換打者
+        next_order = (order + 1) % total
+        if selected_result != 'RUNNER_OUT':
+            game.next_batter_order = next_order
+        play_log.record_event(game, 'atbat', before, inning=inning, atbat=atbat)
+        game.bump_version()
         db.session.commit()
-        outs = calculate_outs(game_id, inning)
+        live.publish(game)
 
         if selected_result == 'RUNNER_OUT':
         # 出局數+1，但不換下個打者
         # 直接重新顯示同一order和inning的頁面
             return redirect(url_for('record_atbat', game_id=game_id, order=order, inning=inning))
-        
-        # 這個打席結束後「下一棒」
-        next_order = (order + 1) % total
-        game.next_batter_order = next_order
-        db.session.commit()
 
         if outs >= 3:
             if game.first_attack == 'A':
@@ -285,12 +385,16 @@ def record_atbat(game_id, order, inning):
         is_top=(game.first_attack == 'A'),
         outs=outs,
         result_types=result_types,
+        out_counts=results.OUT_COUNTS,
+        zones=spray.ZONES,
+        base_choices=base_out.BASE_CHOICES,
         game_id=game_id,game=game,
         team_score=game.team_score,
         opponent_score=game.opponent_score,
         opponent=game.opponent)
 
 @app.route('/record_defense/<int:game_id>/<int:inning>', methods=['GET', 'POST'])
+@play_conflicts
 def record_defense(game_id, inning):
     pitchers = Player.query.all()
     game = Game.query.get_or_404(game_id)
@@ -306,11 +410,17 @@ def record_defense(game_id, inning):
             curr_pitcher_id = pitchers[0].id
 
     if request.method == 'POST':
+        ensure_editable(game)
+        before = play_log.capture(game)
+        atbat = None
         batter_name = request.form['batter_name']
         strike = int(request.form['strike'])
         ball = int(request.form['ball'])
         pitch_count = int(request.form['pitch_count'])
         result = request.form['result']
+        if result not in results.DEFENSE_RESULTS:
+            abort(400, f'不明的打席結果：{result}')
+        bases = form_bases()
 
         # 打席本身的失分（例如安打回來幾分）
         base_runs = int(request.form.get('runs', 0))
@@ -331,9 +441,10 @@ def record_defense(game_id, inning):
                 pitcher_id=curr_pitcher_id, batter_name=batter_name,
                 strike=strike, ball=ball,
                 pitch_count=pitch_count, result='防守失誤',
-                runs=runs
+                runs=runs, bases=bases
             )
             db.session.add(stat)
+            state = apply_defense(stat)
 
             # 一筆 AtBatStat 只用來標記「防守失誤」，不參與任何打擊統計
             atbat = AtBatStat(
@@ -354,21 +465,22 @@ def record_defense(game_id, inning):
                 pitcher_id=curr_pitcher_id, batter_name=batter_name,
                 strike=strike, ball=ball,
                 pitch_count=pitch_count, result=result,
-                runs=runs
+                runs=runs, bases=bases
             )
             db.session.add(stat)
+            state = apply_defense(stat)
 
         # 統一在這裡更新對手分數（包含自己失誤、暴投等所有情況）
-        game.opponent_score = (game.opponent_score or 0) + runs
+        game.add_runs(opponent=runs)
         game.current_pitcher_id = curr_pitcher_id
+        play_log.record_event(game, 'defense', before, inning=inning, atbat=atbat, defense=stat)
+        game.bump_version()
+        # 計算 outs
+        outs = state.outs
         db.session.commit()
+        live.publish(game)
         last_batter_name = batter_name
 
-        # 計算 outs
-        records = DefenseStat.query.filter_by(game_id=game_id, inning=inning).all()
-        outs = sum(OUT_RESULTS.get(r.result, 0) for r in records)
-        outs += sum(1 for r in records if r.result == 'RUNNER_OUT')
-
         # 如果是跑者出局，留在同頁不跳轉不換投手
         if result == 'RUNNER_OUT':
             return redirect(url_for('record_defense', game_id=game_id, inning=inning, pitcher_id=curr_pitcher_id))
@@ -387,18 +499,15 @@ def record_defense(game_id, inning):
     # ===== GET: 原本那段維持不變 =====
     pitcher_pitch_count = 0
     if curr_pitcher_id:
-        pitcher_pitch_count = sum(
-            r.pitch_count
-            for r in DefenseStat.query.filter_by(game_id=game_id).all()
-            if r.pitcher_id == curr_pitcher_id
-        )
-    records = DefenseStat.query.filter_by(game_id=game_id, inning=inning).all()
-    outs = sum(OUT_RESULTS.get(r.result, 0) for r in records)
-    outs += sum(1 for r in records if r.result == 'RUNNER_OUT')
+        pitcher_pitch_count = get_pitcher_pitch_count(game_id, curr_pitcher_id)
+    state = get_inning_state(game_id, inning, 'D')
+    outs = state.outs if state else 0
+    records = DefenseStat.query.filter_by(game_id=game_id, inning=inning).order_by(DefenseStat.id).all()
 
+    players_by_id = {p.id: p for p in pitchers}
     inning_records = []
     for r in records:
-        pitcher = Player.query.get(r.pitcher_id) if r.pitcher_id else None
+        pitcher = players_by_id.get(r.pitcher_id)
         inning_records.append({
             "pitcher": pitcher,
             "batter_name": r.batter_name,
@@ -412,13 +521,12 @@ def record_defense(game_id, inning):
             if rec['result'] == 'RUNNER_OUT':
                 rec['result'] = '跑者出局'
 
-    total_pitch_this_inning = sum(r.pitch_count for r in records)
-    total_pitch_all = sum(r.pitch_count for r in DefenseStat.query.filter_by(game_id=game_id).all())
-    curr_pitcher_inning_pitch_count = sum(
-        r.pitch_count
-        for r in DefenseStat.query.filter_by(game_id=game_id, inning=inning, pitcher_id=curr_pitcher_id).all()
-    )
-    curr_pitcher = Player.query.get(curr_pitcher_id) if curr_pitcher_id else None
+    total_pitch_this_inning = state.pitch_count if state else 0
+    total_pitch_all = get_total_pitch_count(game_id)
+    curr_pitcher_inning_pitch_count = 0
+    if curr_pitcher_id:
+        curr_pitcher_inning_pitch_count = get_pitcher_pitch_count(game_id, curr_pitcher_id, inning)
+    curr_pitcher = players_by_id.get(curr_pitcher_id)
 
     return render_template('record_defense.html',
                            game=game,
@@ -431,6 +539,8 @@ def record_defense(game_id, inning):
                            curr_pitcher_inning_pitch_count=curr_pitcher_inning_pitch_count,
                            total_pitch_this_inning=total_pitch_this_inning,
                            total_pitch_all=total_pitch_all,
+                           out_counts=results.OUT_COUNTS,
+                           base_choices=base_out.BASE_CHOICES,
                            outs=outs)
 
 @app.route('/choose_starting_pitcher/<int:game_id>', methods=['GET', 'POST'])
@@ -438,28 +548,56 @@ def choose_starting_pitcher(game_id):
     game = Game.query.get_or_404(game_id)
     pitchers = Player.query.all()
     if request.method == 'POST':
+        ensure_editable(game)
         pitcher_id = int(request.form['pitcher_id'])
         game.starting_pitcher_id = pitcher_id  # 可以加在 Game model 記錄
+        game.bump_version()
         db.session.commit()
         # 根據先攻/先守決定流程
         if game.first_attack == 'A':
             return redirect(url_for('record_atbat', game_id=game_id, order=0, inning=1))
         else:
             return redirect(url_for('record_defense', game_id=game_id, inning=1))
-    return render_template('choose_starting_pitcher.html', game=game, pitchers=pitchers)
+    return render_template('choose_starting_pitcher.html', game=game, pitchers=pitchers,
+                           workload=workload.workload_for_game(game, [p.id for p in pitchers]))
+
+@app.route('/undo/<int:game_id>')
+def undo_last_play(game_id):
+    # 撤銷最後一筆操作（打席、防守、換人、換投），狀態直接由事件記下的 before 還原
+    game = Game.query.get_or_404(game_id)
+    ensure_editable(game)
+    event = play_log.undo_last(game)
+    if event is None:
+        return redirect(url_for('set_batting_order', game_id=game_id))
+    game.bump_version()
+    db.session.commit()
+    live.publish(game)
+    if event.kind in ('atbat', 'switch_player'):
+        return redirect(url_for('record_atbat', game_id=game_id, order=game.next_batter_order or 0,
+                                inning=event.inning or get_current_inning(game_id)))
+    return redirect(url_for('record_defense', game_id=game_id, inning=event.inning,
+                            pitcher_id=game.current_pitcher_id))
 
 @app.route('/undo_atbat/<int:game_id>/<int:order>/<int:inning>')
 def undo_atbat(game_id, order, inning):
+    game = Game.query.get_or_404(game_id)
+    ensure_editable(game)
+    if play_log.last_event(game_id) is not None:
+        return undo_last_play(game_id)
+    # 沒有操作紀錄的舊比賽：刪掉該棒次最後一個打席
     atbat = (AtBatStat.query
              .filter_by(game_id=game_id, order=order, inning=inning)
              .order_by(AtBatStat.id.desc())
              .first())
     if atbat:
-        game = Game.query.get(game_id)
-        if atbat.rbis > 0 and game.team_score:
-            game.team_score = max(0, game.team_score - atbat.rbis)
+        runs = atbat_runs(atbat)
+        if runs > 0:
+            game.add_runs(team=-runs)
+        apply_atbat(atbat, sign=-1)
         db.session.delete(atbat)
+        game.bump_version()
         db.session.commit()
+        live.publish(game)
         prev_order = order - 1 if order > 0 else (len(GameBattingOrder.query.filter_by(game_id=game_id).all()) - 1)
         return redirect(url_for('record_atbat', game_id=game_id, order=prev_order, inning=inning))
     else:
@@ -467,6 +605,7 @@ def undo_atbat(game_id, order, inning):
         return redirect(url_for('record_atbat', game_id=game_id, order=prev_order, inning=inning))
 
 @app.route('/switch_player/<int:game_id>/<int:order>', methods=['GET', 'POST'])
+@play_conflicts
 def switch_player(game_id,order):
     #order = request.args.get('order') if request.method == 'GET' else request.form.get('order')
     batting_orders = GameBattingOrder.query.filter_by(game_id=game_id).order_by(GameBattingOrder.order).all()
@@ -482,392 +621,260 @@ def switch_player(game_id,order):
         new_player_id = int(request.form['new_player'])
         gbo = GameBattingOrder.query.filter_by(game_id=game_id, order=order).first()
         if gbo:
+            ensure_editable(gbo.game)
+            before = play_log.capture(gbo.game, lineup={order: gbo.player_id})
             gbo.player_id = new_player_id
+            play_log.record_event(gbo.game, 'switch_player', before, lineup={order: new_player_id})
+            gbo.game.bump_version()
             db.session.commit()
         return redirect(url_for('record_atbat', game_id=game_id, order=order, inning=get_current_inning(game_id)))
     return render_template('switch_player.html', batting_orders=batting_orders,
                            all_players=all_players, game_id=game_id, order=order)
 
 @app.route('/switch_pitcher/<int:game_id>/<int:inning>', methods=['GET', 'POST'])
+@play_conflicts
 def switch_pitcher(game_id, inning):
     pitchers = Player.query.all()
     game = Game.query.get_or_404(game_id)
     if request.method == 'POST':
+        ensure_editable(game)
         new_pitcher_id = int(request.form['pitcher_id'])
+        before = play_log.capture(game)
         game.current_pitcher_id = new_pitcher_id      # 關鍵！寫入Game紀錄
+        play_log.record_event(game, 'switch_pitcher', before, inning=inning)
+        game.bump_version()
         db.session.commit()
         # 換投後帶著新的投手ID跳回record_defense
         return redirect(url_for('record_defense', game_id=game_id, inning=inning, pitcher_id=new_pitcher_id))
-    return render_template('switch_pitcher.html', pitchers=pitchers, game_id=game_id, inning=inning)
-
-def get_stats_table(game_id):
-    atbats = [ab for ab in AtBatStat.query.filter_by(game_id=game_id).all() 
-        if not (ab.order == -1 and ab.note == '防守失誤') 
-        and ab.result not in ['對手失誤', '暴投']]
-    innings = sorted(set([a.inning for a in atbats]))
-    max_inning = max(innings) if innings else 9
-    groups = {}
-    total = {'ab': 0, 'hit': 0, 'hr': 0, 'rbi': 0, 'run': 0, 'inning_results': [0 for _ in range(max_inning)]}
-    for ab in atbats:
-        if ab.result == 'RUNNER_OUT':
-            continue
-        key = (ab.order, ab.player_id, ab.note or '', ab.position or '')
-        if key not in groups:
-            groups[key] = {
-                "order": ab.order,
-                "player": Player.query.get(ab.player_id),
-                "note":"",
-                "position": ab.position or "",
-                "results": [""] * max_inning,
-                "ab": 0, "hit": 0, "hr": 0, "rbi": 0
-            }
-        idx = ab.inning - 1
-        groups[key]["results"][idx] += ("/" if groups[key]["results"][idx] else "") + (ab.result or "")
-        if ab.result not in ['四壞', '觸身', '犧牲','犧飛']:
-            groups[key]["ab"] += 1
-            total['ab'] += 1
-        if ab.result in ['內安', '一安', '二安', '三安', '全壘']:
-            groups[key]["hit"] += 1
-            total['hit'] += 1
-        if ab.result == '全壘':
-            groups[key]["hr"] += 1
-            total['hr'] += 1
-        if ab.rbis:
-            groups[key]["rbi"] += ab.rbis
-            total['rbi'] += ab.rbis
-    stats_table = list(groups.values())
-    return stats_table, max_inning, total
+    return render_template('switch_pitcher.html', pitchers=pitchers, game_id=game_id, inning=inning,
+                           workload=workload.workload_for_game(game, [p.id for p in pitchers]))
 
 @app.route('/game_detail/<int:game_id>')
 def game_detail(game_id):
     game = Game.query.get_or_404(game_id)
-    stats_table, max_inning, total = get_stats_table(game_id)      # 打擊數據用
-    defense_stats = DefenseStat.query.filter_by(game_id=game_id).order_by(DefenseStat.inning, DefenseStat.id).all()
-    
-    # ====== 新增: 比分表的資料 =======
-    # 我方每局得分
-    team_scores_per_inning = [0] * max_inning
-    # 對方每局得分
-    opponent_scores_per_inning = [0] * max_inning
-
-    for i in range(1, max_inning+1):
-        # 本隊 RBIs (原本的邏輯)
-        rbi_runs = sum(
-            ab.rbis or 0 for ab in AtBatStat.query.filter_by(game_id=game_id, inning=i).all()
-        )
-        
-        # ★修正這裡：同時計算 '對手失誤' 和 '暴投' 的得分
-        # (讀取我們剛剛存在 note 裡面的分數)
-        error_extra_runs = sum(
-            int(ab.note) if ab.note and ab.result in ['對手失誤', '暴投'] else 0
-            for ab in AtBatStat.query.filter_by(game_id=game_id, inning=i).all()
-        )
-        
-        team_scores_per_inning[i-1] = rbi_runs + error_extra_runs
-
-        opponent_scores_per_inning[i-1] = sum(
-            ds.runs or 0
-            for ds in DefenseStat.query.filter_by(game_id=game_id, inning=i).all()
-        )
-
-
-
-    team_hits = sum(
-        ab.result in ['內安','一安','二安','三安','全壘'] for ab in AtBatStat.query.filter_by(game_id=game_id).all()
-    )
-    opponent_hits = sum(
-        ds.result in ['內安','一安','二安','三安','全壘'] for ds in DefenseStat.query.filter_by(game_id=game_id).all()
-    )
-    # 我方失誤 = '失誤'(下拉選單) + '防守失誤'(按鈕)
-    team_errors = sum(
-        1 for ds in DefenseStat.query.filter_by(game_id=game_id).all() 
-        if ds.result in ['失誤', '防守失誤']  # <--- 關鍵！一定要兩個都有
-    )
-
-    # 對手失誤：我在進攻時(AtBatStat)造成的 '對手失誤' + 下拉選單選的 '失誤'
-    opponent_errors = sum(
-        1 for ab in AtBatStat.query.filter_by(game_id=game_id).all()
-        if ab.result in ['失誤', '對手失誤']  # <--- 這裡加了 '對手失誤'
-        and (ab.note != '防守失誤') # 排除掉自己防守時的註記
-    )
-
-    defense_records = []
-    for r in defense_stats:
-        # 如果是 '防守失誤' (按鈕) 或 '暴投' (按鈕)，就不顯示在表格中
-        if r.result in ['防守失誤', '暴投']:
-            continue
-            
-        pitcher = Player.query.get(r.pitcher_id) if r.pitcher_id else None
-        defense_records.append({
-            "inning": r.inning,
-            "pitcher": pitcher,
-            "batter_name": r.batter_name,
-            "strike": r.strike,
-            "ball": r.ball,
-            "pitch_count": r.pitch_count,
-            "result": r.result
-        })
-    pitcher_stats, pitcher_total = calculate_pitcher_stats(game_id)   # 投手數據用
-
-    # ==== 新增投手每局用球數表格計算 ====
-    pitchers = {r.pitcher_id: Player.query.get(r.pitcher_id).name for r in defense_stats if r.pitcher_id}
-    innings = sorted(set([r.inning for r in defense_stats]))
-    pitcher_inning_data = []
-    for pid, pname in pitchers.items():
-        per_inning = []
-        for inn in innings:
-            count = sum(r.pitch_count for r in defense_stats if r.pitcher_id == pid and r.inning == inn)
-            per_inning.append(count if count != 0 else "")
-        pitcher_inning_data.append({
-            "name": pname,
-            "data": per_inning
-        })
-    # innings: 1,2,...N  pitcher_inning_data: list of {name, [n局,n局,...]}
-    
-    return render_template('game_detail.html',
+    html = box_score_cache.get(game.id, game.data_version)
+    if html is not None:
+        return html
+    summary = GameSummary.load(game)
+    html = render_template('game_detail.html',
         game=game,
-        stats_table=stats_table,
-        max_inning=max_inning,
-        total=total,                  # for 打擊
-        defense_records=defense_records,
-        pitcher_stats=pitcher_stats,
-        pitcher_total=pitcher_total,  # for 投手
-        pitcher_innings=innings,      # 表頭局數
-        pitcher_inning_data=pitcher_inning_data,  # 表格內容
-        team_scores_per_inning=team_scores_per_inning,
-        opponent_scores_per_inning=opponent_scores_per_inning,
-        team_hits=team_hits,
-        opponent_hits=opponent_hits,
-        team_errors=team_errors,
-        opponent_errors=opponent_errors,
+        stats_table=summary.stats_table,
+        max_inning=summary.max_inning,
+        total=summary.total,                  # for 打擊
+        defense_records=summary.defense_records,
+        pitcher_stats=summary.pitcher_stats,
+        pitcher_total=summary.pitcher_total,  # for 投手
+        pitcher_innings=summary.pitcher_innings,      # 表頭局數
+        pitcher_inning_data=summary.pitcher_inning_data,  # 表格內容
+        team_scores_per_inning=summary.team_scores_per_inning,
+        opponent_scores_per_inning=summary.opponent_scores_per_inning,
+        team_hits=summary.team_hits,
+        opponent_hits=summary.opponent_hits,
+        team_errors=summary.team_errors,
+        opponent_errors=summary.opponent_errors,
     )
+    box_score_cache.set(game.id, game.data_version, html, final=game.is_recorded)
+    return html
+
+@app.route('/games/<int:game_id>/live')
+def game_live_feed(game_id):
+    # 給觀眾的即時比分（SSE）；每筆紀錄 commit 後推送有變動的欄位
+    Game.query.get_or_404(game_id)
+    return Response(live.stream(app, game_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def player_json(player):
+    return {'id': player.id, 'name': player.name, 'number': player.number} if player else None
+
+def game_state_payload(game):
+    snapshot = live.get_snapshot(game.id, game.data_version)
+    order = game.next_batter_order or 0
+    gbo = GameBattingOrder.query.filter_by(game_id=game.id, order=order).first()
+    pitch_counts = get_pitch_counts(game.id)
+    players_by_id = resolve_players(list(pitch_counts) + [game.current_pitcher_id, gbo.player_id if gbo else None])
+    batter = players_by_id.get(gbo.player_id) if gbo else None
+    return {
+        'game_id': game.id,
+        'version': game.data_version,
+        'is_recorded': bool(game.is_recorded),
+        'opponent': game.opponent,
+        'team_score': game.team_score or 0,
+        'opponent_score': game.opponent_score or 0,
+        'inning': snapshot['inning'],
+        'half': 'top' if snapshot['top'] else 'bottom',
+        'offense': snapshot['offense'],
+        'outs': snapshot['outs'],
+        'batter': dict(player_json(batter), order=order + 1) if batter else None,
+        'pitcher': player_json(players_by_id.get(game.current_pitcher_id)),
+        'pitch_counts': [dict(player_json(players_by_id.get(pid)) or {'id': pid}, pitch_count=count)
+                         for pid, count in pitch_counts.items()],
+    }
 
-@app.route('/export_game_excel/<int:game_id>')
-def export_game_excel(game_id):
+@app.route('/api/games/<int:game_id>/state')
+def api_game_state(game_id):
+    # ETag 就是 data_version：沒有變動時只查一次版本號就回 304
+    version = live.current_version(game_id)
+    if version is None:
+        abort(404)
+    etag = f'game-{game_id}-v{version}'
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        payload = game_state_cache.get(game_id, version)
+        if payload is None:
+            game = db.session.get(Game, game_id)
+            payload = game_state_payload(game)
+            game_state_cache.set(game_id, game.data_version, payload, final=game.is_recorded)
+            etag = f'game-{game_id}-v{game.data_version}'
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/games/<int:game_id>/plays', methods=['POST'])
+def api_ingest_plays(game_id):
+    # 記錄員頁面離線累積的 play 一次上傳；同一個 id 重送只會被略過
     game = Game.query.get_or_404(game_id)
-    stats_table, max_inning, total = get_stats_table(game_id)
-    defense_stats = DefenseStat.query.filter_by(game_id=game_id).order_by(DefenseStat.inning, DefenseStat.id).all()
-    
-    # 準備資料（同 game_detail 路由）
-    team_scores_per_inning = [0] * max_inning
-    opponent_scores_per_inning = [0] * max_inning
-    for i in range(1, max_inning+1):
-        # 本隊打點
-        rbi_runs = sum(
-            ab.rbis or 0
-            for ab in AtBatStat.query.filter_by(game_id=game_id, inning=i).all()
-        )
-
-        # 對手失誤造成的額外得分（從 DefenseStat result='對手失誤' 抓）
-        error_extra_runs = sum(
-            ds.runs or 0
-            for ds in DefenseStat.query.filter_by(game_id=game_id, inning=i, result='對手失誤').all()
-        )
+    if game.is_recorded:
+        return jsonify({'error': '這場比賽已完成紀錄，請先重新開啟紀錄再修改', 'retry': False}), 409
+    data = request.get_json(silent=True) or {}
+    try:
+        applied, duplicates = ingest.ingest_plays(game, data.get('plays', []))
+        if applied:
+            game.bump_version()
+        db.session.commit()
+    except ingest.BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'index': e.index}), 422
+    except (IntegrityError, StaleDataError):
+        # 另一台裝置同時寫入同一場比賽（事件序號重複或 data_version 已變），整批重送即可；
+        # 每筆 play 都有 id，重送時已寫入的會被略過，其餘依最新狀態重新驗證
+        db.session.rollback()
+        return jsonify({'error': '比賽資料已被更新，請重新上傳', 'retry': True}), 409
+    if applied:
+        live.publish(game)
+    state = game_state_payload(game)
+    if state['offense']:
+        next_url = url_for('record_atbat', game_id=game_id, order=game.next_batter_order or 0, inning=state['inning'])
+    else:
+        next_url = url_for('record_defense', game_id=game_id, inning=state['inning'], pitcher_id=game.current_pitcher_id)
+    return jsonify({'applied': applied, 'duplicates': duplicates, 'state': state, 'next_url': next_url})
 
-        team_scores_per_inning[i-1] = rbi_runs + error_extra_runs
+@app.route('/games/<int:game_id>/scoreboard')
+def game_scoreboard(game_id):
+    game = Game.query.get_or_404(game_id)
+    return render_template('live.html', game=game)
 
-        # 對方每局得分仍然是所有 DefenseStat.runs
-        opponent_scores_per_inning[i-1] = sum(
-            ds.runs or 0
-            for ds in DefenseStat.query.filter_by(game_id=game_id, inning=i).all()
-        )
+@app.route('/metrics', endpoint='metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-    team_hits = sum(
-        ab.result in ['內安','一安','二安','三安','全壘'] for ab in AtBatStat.query.filter_by(game_id=game_id).all()
-    )
-    opponent_hits = sum(
-        ds.result in ['內安','一安','二安','三安','全壘'] for ds in DefenseStat.query.filter_by(game_id=game_id).all()
-    )
-    team_errors = sum(
-        ds.result == '失誤'
-        for ds in DefenseStat.query.filter_by(game_id=game_id).all()
-    )
-    opponent_errors = (sum(
-        ab.result == '失誤' and (ab.order is not None and ab.order != -1) and (ab.note is None or ab.note != '防守失誤')
-        for ab in AtBatStat.query.filter_by(game_id=game_id).all()
-    ) - sum(
-        ds.result == '失誤'
-        for ds in DefenseStat.query.filter_by(game_id=game_id).all()
-    )
-    )
-    
-    defense_records = []
-    for r in defense_stats:
-        pitcher = Player.query.get(r.pitcher_id) if r.pitcher_id else None
-        defense_records.append({
-            "inning": r.inning,
-            "pitcher": pitcher,
-            "batter_name": r.batter_name,
-            "strike": r.strike,
-            "ball": r.ball,
-            "pitch_count": r.pitch_count,
-            "result": r.result
-        })
-    
-    pitcher_stats, pitcher_total = calculate_pitcher_stats(game_id)
-    pitchers = {r.pitcher_id: Player.query.get(r.pitcher_id).name for r in defense_stats if r.pitcher_id}
-    innings = sorted(set([r.inning for r in defense_stats]))
-    pitcher_inning_data = []
-    for pid, pname in pitchers.items():
-        per_inning = []
-        for inn in innings:
-            count = sum(r.pitch_count for r in defense_stats if r.pitcher_id == pid and r.inning == inn)
-            per_inning.append(count if count != 0 else "")
-        pitcher_inning_data.append({
-            "name": pname,
-            "data": per_inning
-        })
-    
-    def format_ws(ws):
-        for row in ws.iter_rows():
-            for cell in row:
-                cell.font = Font(size=14)  # 想再大可設 16
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            ws.column_dimensions[column_letter].width = min(max_length + 6, 30) # 調整大一點
-        ws.row_dimensions[1].height = 28   # 第一列標題高度也可加高
-
-    # 建立 Workbook
-    wb = Workbook()
-    wb.remove(wb.active)  # 移除預設的 sheet
-    
-    # ===== Sheet 1: 比分表 =====
-    ws1 = wb.create_sheet("比分表")
-    ws1.append(['', *[str(i) for i in range(1, max_inning+1)], 'R', 'H', 'E'])
-    ws1.append(['元智大學', *team_scores_per_inning, game.team_score, team_hits, team_errors])
-    ws1.append([game.opponent, *opponent_scores_per_inning, game.opponent_score, opponent_hits, opponent_errors])
-
-    # ===== Sheet 2: 打擊成績 =====
-    ws2 = wb.create_sheet("打擊成績")
-    headers = ['棒次', '球員'] + [f'第{i}局' for i in range(1, max_inning+1)] + ['打數', '安打', '全壘打', '打點', '得分', '打擊率']
-    ws2.append(headers)
-    
-    for row in stats_table:
-        ws2.append([
-            row['order']+1,
-            row['player'].name,
-            *row['results'],
-            row['ab'], row['hit'], row['hr'], row['rbi'],
-            row.get('run', 0),
-            "%.3f" % (row['hit']/row['ab'] if row['ab'] else 0.0)
-        ])
-    
-    # 總計行
-    ws2.append(['總計', ''] + total.get('inning_results', [0]*max_inning) +
-              [total['ab'], total['hit'], total['hr'], total['rbi'], total.get('run', 0),
-               "%.3f" % (total['hit']/total['ab'] if total['ab'] else 0.0)])
-    
-    # ===== Sheet 3: 投手成績 =====
-    ws3 = wb.create_sheet("投手成績")
-    ws3.append(['投手', '投球局數', '面對打席', '投球數', '好球數', '安打', '全壘打', '四壞', '觸身', '三振', '失分'])
-    
-    for p in pitcher_stats:
-        ws3.append([
-            p['name'], p['ip'], p['batters'], p['pitch_count'], p['strikes'],
-            p['hits'], p['hr'], p['bb'], p['hbp'], p['k'], p['run']
-        ])
-    
-    ws3.append([
-        '總計', pitcher_total['ip'], pitcher_total['batters'], pitcher_total['pitch_count'],
-        pitcher_total['strikes'], pitcher_total['hits'], pitcher_total['hr'],
-        pitcher_total['bb'], pitcher_total['hbp'], pitcher_total['k'], pitcher_total['run']
-    ])
-    
-    # ===== Sheet 4: 投手每局用球數 =====
-    ws4 = wb.create_sheet("投手每局用球數")
-    ws4.append(['投手'] + [f'第{inn}局' for inn in innings])
-    
-    for pitcher in pitcher_inning_data:
-        ws4.append([pitcher['name']] + pitcher['data'])
-    # 加總計行到 ws4
-    totals = []
-    for i in range(len(innings)):
-        # 取所有投手的某局用球數，如果不是數字（空字串），轉成0
-        values = [(int(p['data'][i]) if str(p['data'][i]).isdigit() else 0) for p in pitcher_inning_data]
-        totals.append(sum(values))
-    ws4.append(['總計'] + totals)
-    # ===== Sheet 5: 防守打席紀錄 =====
-    ws5 = wb.create_sheet("防守打席紀錄")
-    ws5.append(['局數', '投手', '對方打者', '好球', '壞球', '球數', '結果'])
-    
-    for d in defense_records:
-        result = '跑者出局' if d['result'] == 'RUNNER_OUT' else d['result']
-        ws5.append([
-            d['inning'],
-            d['pitcher'].name if d['pitcher'] else '',
-            d['batter_name'],
-            d['strike'],
-            d['ball'],
-            d['pitch_count'],
-            result
-        ])
-    
-    # 防守總計行
-    ws5.append([
-        '總計', '', '',
-        sum(d['strike'] for d in defense_records),
-        sum(d['ball'] for d in defense_records),
-        sum(d['pitch_count'] for d in defense_records),
-        '-'
-    ])
-    
-    # 寬度調整（方便閱讀）
-    for ws in [ws1, ws2, ws3, ws4, ws5]:
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # 加在 append資料後、回傳前
-    for ws in [ws1, ws2, ws3, ws4, ws5]:
-        format_ws(ws)
-
-    ws1.column_dimensions['A'].width = 22  # 這一行放在 for loop後或前都可以
-    for col in ws2.columns:
-        col_letter = col[0].column_letter
-        ws2.column_dimensions[col_letter].width = 18   # 可以設 16~22
-
-    for col in ws3.columns:
-        col_letter = col[0].column_letter
-        ws3.column_dimensions[col_letter].width = 15   # 可以設 16~22
-    # 回傳檔案
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+@app.route('/export_game_excel/<int:game_id>')
+def export_game_excel(game_id):
+    game = Game.query.get_or_404(game_id)
+    # 依 data_version 快取；快取沒有時由暫存檔分段送出
+    try:
+        output = open_game_workbook(game)
+    except TimeoutError:
+        return Response('匯出檔產生中，請稍後再試', status=503, headers={'Retry-After': '10'})
     return send_file(
         output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        mimetype=XLSX_MIMETYPE,
         as_attachment=True,
-        download_name=f'{game.tournament} vs {game.opponent}.xlsx'
+        download_name=f'{game.tournament} vs {game.opponent}.xlsx',
+        etag=f'game-{game.id}-v{game.data_version}-xlsx'
+    )
+
+@app.route('/export_season', methods=['GET', 'POST'])
+def export_season():
+    if request.method == 'POST':
+        job = start_season_export(
+            tournament=request.form.get('tournament') or None,
+            start=request.form.get('start') or None,
+            end=request.form.get('end') or None,
+            fmt='zip' if request.form.get('fmt') == 'zip' else 'xlsx')
+        return redirect(url_for('export_job', job_id=job.id))
+    return render_template('export_season.html', tournaments=tournaments())
+
+@app.route('/export_jobs/<job_id>')
+def export_job(job_id):
+    job = ExportJob.query.get_or_404(job_id)
+    return render_template('export_job.html', job=job)
+
+@app.route('/export_jobs/<job_id>/status')
+def export_job_status(job_id):
+    job = ExportJob.query.get_or_404(job_id)
+    return jsonify(status=job.status, done=job.done, total=job.total, error=job.error,
+                   download_url=url_for('export_job_download', job_id=job.id) if job.status == 'done' else None)
+
+@app.route('/export_jobs/<job_id>/download')
+def export_job_download(job_id):
+    job = ExportJob.query.get_or_404(job_id)
+    if job.status != 'done' or not os.path.exists(job.file_path):
+        abort(404)
+    return send_file(
+        job.file_path,
+        mimetype='application/zip' if job.file_path.endswith('.zip') else XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=job.download_name
     )
 
 @app.route('/record_match_select')
 def record_match_select():
-    games = Game.query.filter_by(is_recorded=False).all()
-    return render_template('record_match_select.html', games=games)
+    games, next_cursor = listing.game_page(request.args.get('after'), recorded=False)
+    return render_template('record_match_select.html', games=games, next_cursor=next_cursor)
 
 @app.route('/finish_record/<int:game_id>', methods=['POST'])
 def finish_record(game_id):
     game = Game.query.get_or_404(game_id)
+    if not game.is_recorded:
+        # 只在第一次完成時加進賽季累計，重複送出不會重算
+        rollups.apply_game(game)
     game.is_recorded = True
+    game.bump_version()
     db.session.commit()
+    live.publish(game)
     return redirect(url_for('index'))
 
+@app.route('/reopen_record/<int:game_id>', methods=['POST'])
+def reopen_record(game_id):
+    # 修改已完成的比賽：先從賽季累計扣掉，再次完成紀錄時依修改後的紀錄重新加回
+    game = Game.query.get_or_404(game_id)
+    if game.is_recorded:
+        rollups.apply_game(game, sign=-1)
+        game.is_recorded = False
+        game.bump_version()
+        db.session.commit()
+        live.publish(game)
+    return redirect(url_for('set_batting_order', game_id=game_id))
+
+@app.cli.command('rebuild-inning-state')
+def rebuild_inning_state_command():
+    """由既有的打席/防守紀錄補建所有比賽的半局狀態。"""
+    for game in Game.query.all():
+        rebuild_inning_state(game.id)
+    db.session.commit()
+
+@app.cli.command('verify-play-log')
+def verify_play_log_command():
+    """用快照與 PlayEvent 重播每場比賽，檢查結果與目前的比分／棒次是否一致。"""
+    for game in Game.query.all():
+        state = play_log.replay_state(game.id)
+        if state is None:
+            continue
+        current = play_log.capture(game)
+        current['lineup'] = {str(o.order): o.player_id for o in GameBattingOrder.query.filter_by(game_id=game.id)}
+        status = 'ok' if state == current else 'MISMATCH %s != %s' % (state, current)
+        print(f'game {game.id}: {status}')
+
+@app.cli.command('rebuild-season-stats')
+def rebuild_season_stats_command():
+    """由所有已完成紀錄的比賽重算球員賽季累計（PlayerSeasonStats）。"""
+    rollups.rebuild_rollups()
+    db.session.commit()
+
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        migrations.upgrade()
 #    app.run(debug=True)        
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""壘包／出局狀態（base-out state）與得分期望值（RE24）。
+
+紀錄頁可以選擇記下每個打席開始時的壘上跑者（AtBatStat.bases / DefenseStat.bases，
+1=一壘、2=二壘、4=三壘 的位元和，NULL 為沒記錄），出局數由同半局前面的結果累加，
+狀態編號為 出局數 × 8 + 壘包，共 24 種。只有每一筆都記了壘包、而且打滿三出局的半局才納入：
+
+- 得分期望值 RE[狀態]：從這個狀態到半局結束平均再得幾分，我方與對手的進攻半局都算；
+- 球員 RE24：每個打席 RE(下一個狀態) − RE(開始狀態) + 這個打席的得分，三出局時結束狀態為 0。
+
+RE24 對狀態是線性的，所以 finish_record 時只要把該場每個狀態的次數／得分加進
+BaseOutStats，並記下每位打者在各狀態開始與結束幾次（PlayerBaseOutStats），
+矩陣之後再變也不用重算任何一個打席；刪除比賽時扣回，時機同 PlayerSeasonStats。
+"""
+from itertools import groupby
+from sqlalchemy import func
+from models import db, Game, AtBatStat, DefenseStat, BaseOutStats, PlayerBaseOutStats
+from results import BY_CODE
+from season_stats import filter_games, GAME_SEASON
+from summary import atbat_runs
+
+# 紀錄頁的選項：(壘包, 名稱)
+BASE_CHOICES = [(0, '壘上無人'), (1, '一壘'), (2, '二壘'), (3, '一、二壘'),
+                (4, '三壘'), (5, '一、三壘'), (6, '二、三壘'), (7, '滿壘')]
+STATES = 24
+
+
+def parse_bases(value):
+    """表單或 API 的壘包值 -> 0~7；空白回傳 None（沒記錄），其他值丟 ValueError。"""
+    if value is None or str(value).strip() == '':
+        return None
+    bases = int(value)
+    if not 0 <= bases <= 7:
+        raise ValueError(f'壘包必須是 0~7：{value}')
+    return bases
+
+
+def _plays(**filters):
+    """[(season, game_id, inning, half, [(bases, result_code, runs, player_id), ...]), ...]，每個半局依紀錄順序。"""
+    season = GAME_SEASON.label('season')
+    atbats = (db.session.query(season, AtBatStat.game_id, AtBatStat.inning, AtBatStat.bases,
+                               AtBatStat.result_code, AtBatStat.rbis, AtBatStat.note, AtBatStat.player_id)
+              .join(Game, Game.id == AtBatStat.game_id)
+              .filter(AtBatStat.player_id.isnot(None))   # 排除「防守失誤」的標記列
+              .order_by(AtBatStat.game_id, AtBatStat.inning, AtBatStat.id))
+    defenses = (db.session.query(season, DefenseStat.game_id, DefenseStat.inning, DefenseStat.bases,
+                                 DefenseStat.result_code, DefenseStat.runs)
+                .join(Game, Game.id == DefenseStat.game_id)
+                .order_by(DefenseStat.game_id, DefenseStat.inning, DefenseStat.id))
+    halves = []
+    for (season_, game_id, inning), rows in groupby(filter_games(atbats, **filters), key=lambda r: r[:3]):
+        halves.append((int(season_ or 0), game_id, inning, 'A',
+                       [(r.bases, r.result_code, atbat_runs(r), r.player_id) for r in rows]))
+    for (season_, game_id, inning), rows in groupby(filter_games(defenses, **filters), key=lambda r: r[:3]):
+        halves.append((int(season_ or 0), game_id, inning, 'D',
+                       [(r.bases, r.result_code, r.runs or 0, None) for r in rows]))
+    return halves
+
+
+def half_inning_states(plays):
+    """一個半局 -> 每一筆的開始狀態；沒記壘包或沒打滿三出局回傳 None。"""
+    if any(bases is None for bases, _, _, _ in plays):
+        return None
+    states, outs = [], 0
+    for bases, code, _, _ in plays:
+        if outs >= 3:
+            return None
+        states.append(outs * 8 + bases)
+        outs += BY_CODE[code or 0].outs
+    return states if outs >= 3 else None
+
+
+def _accumulate(halves):
+    """-> ({(season, state): [次數, 得分]}, {(player_id, season, state): [開始, 結束, 得分]})"""
+    matrix, players = {}, {}
+    for season, _, _, half, plays in halves:
+        states = half_inning_states(plays)
+        if states is None:
+            continue
+        remaining = sum(runs or 0 for _, _, runs, _ in plays)
+        for i, (state, (_, code, runs, player_id)) in enumerate(zip(states, plays)):
+            cell = matrix.setdefault((season, state), [0, 0])
+            cell[0] += 1
+            cell[1] += remaining
+            remaining -= runs or 0
+            if half == 'A' and BY_CODE[code or 0].is_pa:
+                line = players.setdefault((player_id, season, state), [0, 0, 0])
+                line[0] += 1
+                line[2] += runs or 0
+                if i + 1 < len(states):
+                    players.setdefault((player_id, season, states[i + 1]), [0, 0, 0])[1] += 1
+    return matrix, players
+
+
+def _apply(matrix, players, sign):
+    seasons = {season for season, _ in matrix}
+    if not seasons:
+        return
+    cells = {(r.season, r.state): r for r in BaseOutStats.query.filter(BaseOutStats.season.in_(seasons))}
+    for key, (occurrences, runs) in matrix.items():
+        row = cells.get(key)
+        if row is None:
+            row = cells[key] = BaseOutStats(season=key[0], state=key[1], occurrences=0, runs=0)
+            db.session.add(row)
+        row.occurrences += sign * occurrences
+        row.runs += sign * runs
+    rows = {(r.player_id, r.season, r.state): r for r in PlayerBaseOutStats.query.filter(
+        PlayerBaseOutStats.player_id.in_({player_id for player_id, _, _ in players}),
+        PlayerBaseOutStats.season.in_(seasons))}
+    for key, (starts, ends, runs) in players.items():
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = PlayerBaseOutStats(player_id=key[0], season=key[1], state=key[2],
+                                                 starts=0, ends=0, runs=0)
+            db.session.add(row)
+        row.starts += sign * starts
+        row.ends += sign * ends
+        row.runs += sign * runs
+    if sign < 0:
+        for row in cells.values():
+            if not row.occurrences:
+                db.session.delete(row)
+        for row in rows.values():
+            if not row.starts and not row.ends:
+                db.session.delete(row)
+
+
+def apply_game(game, sign=1):
+    """把一場比賽加進（sign=-1 時扣掉）狀態累計，需由呼叫端 commit。"""
+    _apply(*_accumulate(_plays(game_id=game.id)), sign)
+
+
+def rebuild():
+    """由所有已完成紀錄的比賽重新計算，需由呼叫端 commit。"""
+    BaseOutStats.query.delete()
+    PlayerBaseOutStats.query.delete()
+    _apply(*_accumulate(_plays(recorded=True)), 1)
+
+
+def run_expectancy(season=None):
+    """[狀態] -> (RE, 次數)，沒有資料的狀態 RE 為 None。"""
+    query = db.session.query(BaseOutStats.state, func.sum(BaseOutStats.occurrences), func.sum(BaseOutStats.runs))
+    if season:
+        query = query.filter(BaseOutStats.season == int(season))
+    table = [(None, 0)] * STATES
+    for state, occurrences, runs in query.group_by(BaseOutStats.state):
+        if occurrences:
+            table[state] = (runs / occurrences, occurrences)
+    return table
+
+
+def player_re24(table, season=None):
+    """{player_id: {'pa': 有狀態的打席數, 'runs': 打席得分, 're24': 值}}，table 為 run_expectancy() 的結果。"""
+    query = db.session.query(PlayerBaseOutStats.player_id, PlayerBaseOutStats.state,
+                             func.sum(PlayerBaseOutStats.starts), func.sum(PlayerBaseOutStats.ends),
+                             func.sum(PlayerBaseOutStats.runs))
+    if season:
+        query = query.filter(PlayerBaseOutStats.season == int(season))
+    lines = {}
+    for player_id, state, starts, ends, runs in query.group_by(PlayerBaseOutStats.player_id,
+                                                               PlayerBaseOutStats.state):
+        line = lines.setdefault(player_id, {'pa': 0, 'runs': 0, 're24': 0.0})
+        line['pa'] += starts
+        line['runs'] += runs
+        line['re24'] += runs + (ends - starts) * (table[state][0] or 0.0)
+    return lines
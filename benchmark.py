@@ -0,0 +1,307 @@
+"""模擬賽季資料與效能檢查。
+
+產生數百場比賽（含延長賽、頻繁換投）的 SQLite 資料庫，再用 Flask test client
+量測各個頁面的回應時間與 SQL 數量。每個路由都有固定的 SQL 上限（QUERY_BUDGETS），
+不會隨比賽長度增加；寫出 N+1 查詢時數量會超過上限，程式以 exit code 1 結束。
+
+    python benchmark.py                      # 300 場，暫存資料庫
+    python benchmark.py --games 500 --db instance/bench.db --keep
+    python benchmark.py --db instance/bench.db --skip-generate   # 沿用已產生的資料
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+# 每個路由一次 request 最多可以執行的 SQL 數
+QUERY_BUDGETS = {
+    'game_detail': 6,
+    'game_detail (cached)': 1,
+    'export_game_excel': 6,
+    'export_game_excel (cached)': 1,
+    'api state': 10,
+    'api state (304)': 1,
+    'record_atbat GET': 8,
+    'record_atbat POST': 16,
+    'record_defense GET': 10,
+    'record_defense POST': 18,
+    'api plays (10)': 45,
+    'leaderboard': 6,
+    'games': 3,
+    'games (page 2)': 3,
+    'record_match_select': 1,
+    'players': 4,
+    'player_stats': 9,
+    'spray': 6,
+    'scouting': 3,
+    'run_expectancy': 4,
+}
+
+TOURNAMENTS = ['大專棒球聯賽', '大專盃', '校長盃', '友誼賽']
+OPPONENTS = ['國立體大', '台灣體大', '輔仁大學', '文化大學', '台北市大', '中原大學', '開南大學', '清華大學']
+# (結果, 權重)
+BATTING_RESULTS = [('三振', 20), ('四壞', 9), ('觸身', 1), ('內滾', 18), ('內飛', 7), ('界飛', 3),
+                   ('外飛', 15), ('內安', 2), ('一安', 14), ('二安', 4), ('三安', 1), ('全壘', 2),
+                   ('失誤', 2), ('雙殺', 2), ('犧牲', 1), ('犧飛', 1)]
+
+
+def _pick(rng):
+    results, weights = zip(*BATTING_RESULTS)
+    return rng.choices(results, weights)[0]
+
+
+# 簡化的跑者推進（安打推進的壘數），只為了讓壘包／出局狀態有資料
+ADVANCE = {'內安': 1, '一安': 1, '失誤': 1, '二安': 2, '三安': 3}
+
+
+def _advance(bases, result):
+    if result == '全壘':
+        return 0
+    if result in ADVANCE:
+        n = ADVANCE[result]
+        return ((bases << n) | (1 << (n - 1))) & 7
+    if result in ('四壞', '觸身'):
+        # 只有被迫的跑者前進
+        return bases | 1 if not bases & 1 else bases | 3 if not bases & 2 else 7
+    if result == '雙殺':
+        return bases & ~1
+    return bases
+
+
+def _half(rng, outs_of, make_play):
+    """產生一個半局的 play，直到三出局。"""
+    plays, outs, bases = [], 0, 0
+    while outs < 3:
+        roll = rng.random()
+        if roll < 0.02:
+            result = 'RUNNER_OUT'
+        elif roll < 0.04:
+            result = 'EXTRA'   # 對手失誤／暴投之類的額外得分
+        else:
+            result = _pick(rng)
+            if result == '雙殺' and outs == 2:
+                result = '內滾'
+        play = make_play(result)
+        play['bases'] = bases
+        outs += outs_of(play['result'])
+        bases = _advance(bases, play['result'])
+        plays.append(play)
+    return plays
+
+
+def generate_game_plays(rng, pitchers, innings):
+    from results import count_outs, kind_of
+    plays = []
+    pitcher = rng.choice(pitchers)
+
+    def atbat(result):
+        if result == 'EXTRA':
+            return {'type': 'atbat', 'result': rng.choice(['對手失誤', '暴投']), 'runs': 1}
+        rbis = rng.choice([0, 0, 1, 1, 2]) if kind_of(result).is_hit else 0
+        if result == '全壘':
+            rbis = max(1, rbis)
+        return {'type': 'atbat', 'result': result, 'rbis': rbis, 'position': rng.choice(['LF', 'CF', 'RF', 'SS', '2B'])}
+
+    def defense(result):
+        if result == 'EXTRA':
+            result = rng.choice(['自己失誤', '暴投'])
+        pitch_count = rng.randint(1, 8)
+        strike = rng.randint(0, min(pitch_count, 3))
+        return {'type': 'defense', 'result': result, 'pitcher_id': pitcher,
+                'batter_name': '打者%d' % rng.randint(1, 9), 'strike': strike,
+                'ball': min(pitch_count - strike, 4), 'pitch_count': pitch_count,
+                'runs': rng.choice([0, 0, 1, 1, 2]) if kind_of(result).is_hit else 0,
+                'err_runs': 1 if result == '暴投' else 0}
+
+    for inning in range(1, innings + 1):
+        # 第四局之後常常換投
+        if inning >= 4 and rng.random() < 0.4:
+            pitcher = rng.choice(pitchers)
+        offense = [dict(p, inning=inning) for p in _half(rng, count_outs, atbat)]
+        defense_plays = [dict(p, inning=inning) for p in _half(rng, count_outs, defense)]
+        plays.append((offense, defense_plays))
+    return plays
+
+
+def generate_season(app, games=300, seed=1, seasons=(2024, 2025)):
+    """在目前的資料庫加入 games 場已完成紀錄的比賽。"""
+    from models import db, Player, Game, GameBattingOrder
+    from ingest import ingest_plays, MAX_BATCH
+    import rollups
+
+    rng = random.Random(seed)
+    with app.app_context():
+        if Player.query.count() < 25:
+            for number in range(1, 31):
+                db.session.add(Player(name='球員%d' % number, number=number,
+                                      position=rng.choice(['P', 'C', 'IF', 'OF'])))
+            db.session.commit()
+        player_ids = [p.id for p in Player.query.all()]
+        pitchers = player_ids[:8]
+
+        for n in range(games):
+            season = seasons[n * len(seasons) // games]
+            first_attack = rng.choice(['A', 'D'])
+            game = Game(tournament=rng.choice(TOURNAMENTS), opponent=rng.choice(OPPONENTS),
+                        date=date(season, rng.randint(3, 12), rng.randint(1, 28)),
+                        team_score=0, opponent_score=0, first_attack=first_attack, is_recorded=False)
+            db.session.add(game)
+            db.session.flush()
+            for order, player_id in enumerate(rng.sample(player_ids, 9)):
+                db.session.add(GameBattingOrder(game_id=game.id, player_id=player_id, order=order))
+            db.session.flush()
+
+            innings = 9 if rng.random() > 0.12 else rng.randint(10, 13)   # 約一成延長賽
+            plays = []
+            for offense, defense in generate_game_plays(rng, pitchers, innings):
+                plays += offense + defense if first_attack == 'A' else defense + offense
+            for i, play in enumerate(plays):
+                play['id'] = 'bench-%d-%d' % (game.id, i)
+            for start in range(0, len(plays), MAX_BATCH):
+                ingest_plays(game, plays[start:start + MAX_BATCH])
+            game.is_recorded = True
+            db.session.commit()
+            if (n + 1) % 50 == 0:
+                print(f'  {n + 1}/{games} 場')
+        rollups.rebuild_rollups()
+        db.session.commit()
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def run_benchmarks(app, samples=20, seed=1):
+    import app as app_module
+    import live
+    import export_jobs
+    from models import db, Game, Player
+
+    rng = random.Random(seed)
+    results = {}
+    client = app.test_client()
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+        game_ids = [gid for (gid,) in db.session.query(Game.id).filter(Game.is_recorded.is_(True))]
+        player_ids = [pid for (pid,) in db.session.query(Player.id)]
+        # 寫入用的比賽，避免動到已完成的資料
+        live_game = Game(tournament='benchmark', opponent='benchmark', date=date(2099, 1, 1),
+                         team_score=0, opponent_score=0, first_attack='A', is_recorded=False)
+        db.session.add(live_game)
+        db.session.commit()
+        live_id = live_game.id
+    client.post(f'/set_batting_order/{live_id}', data={f'order_{i}': player_ids[i - 1] for i in range(1, 10)})
+    sample = rng.sample(game_ids, min(samples, len(game_ids)))
+
+    def measure(name, method, url, **kwargs):
+        counter.count = 0
+        start = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        assert response.status_code in (200, 302, 304), (name, url, response.status_code)
+        entry = results.setdefault(name, {'ms': [], 'queries': 0})
+        entry['ms'].append(elapsed)
+        entry['queries'] = max(entry['queries'], counter.count)
+        return response
+
+    for gid in sample:
+        app_module.box_score_cache.invalidate(gid)
+        export_jobs.workbook_cache.invalidate(gid)
+        measure('game_detail', 'get', f'/game_detail/{gid}')
+        measure('game_detail (cached)', 'get', f'/game_detail/{gid}')
+        measure('export_game_excel', 'get', f'/export_game_excel/{gid}')
+        measure('export_game_excel (cached)', 'get', f'/export_game_excel/{gid}')
+        app_module.game_state_cache.invalidate(gid)
+        live.snapshot_cache.invalidate(gid)
+        response = measure('api state', 'get', f'/api/games/{gid}/state')
+        measure('api state (304)', 'get', f'/api/games/{gid}/state',
+                headers={'If-None-Match': response.headers['ETag']})
+        measure('player_stats', 'get', f'/players/{rng.choice(player_ids)}/stats')
+    for _ in range(5):
+        response = measure('games', 'get', '/games?recorded=1')
+        after = response.get_data(as_text=True).partition('after=')[2].partition('&')[0].partition('"')[0]
+        measure('games (page 2)', 'get', f'/games?recorded=1&after={after}')
+        measure('record_match_select', 'get', '/record_match_select')
+        measure('players', 'get', '/players')
+        measure('leaderboard', 'get', '/leaderboard')
+        measure('leaderboard', 'get', '/leaderboard?start=2025-01-01&end=2025-12-31')
+        measure('spray', 'get', '/spray')
+        measure('scouting', 'get', f'/scouting?opponent={rng.choice(OPPONENTS)}')
+        measure('run_expectancy', 'get', '/run_expectancy?season=2025')
+        measure('spray', 'get', f'/spray?player_id={rng.choice(player_ids)}&opponent={rng.choice(OPPONENTS)}')
+
+    for i in range(samples):
+        inning = i + 1
+        measure('record_atbat GET', 'get', f'/record_atbat/{live_id}/0/{inning}')
+        measure('record_atbat POST', 'post', f'/record_atbat/{live_id}/0/{inning}',
+                data={'result': rng.choice(['一安', '三振', '外飛']), 'rbis': 0})
+        measure('record_defense GET', 'get', f'/record_defense/{live_id}/{inning}')
+        measure('record_defense POST', 'post', f'/record_defense/{live_id}/{inning}',
+                data={'batter_name': 'X', 'strike': 2, 'ball': 1, 'pitch_count': 4,
+                      'result': rng.choice(['一安', '三振', '內滾']), 'runs': 0,
+                      'pitcher_id': rng.choice(player_ids)})
+        plays = [{'id': f'bench-live-{i}-{k}', 'type': 'atbat' if k % 2 else 'defense', 'inning': 100 + i,
+                  'result': '一安', 'pitch_count': 3} for k in range(10)]
+        measure('api plays (10)', 'post', f'/api/games/{live_id}/plays', json={'plays': plays})
+    return results
+
+
+def report(results):
+    failed = []
+    print(f"{'route':<24}{'n':>5}{'p50 ms':>10}{'max ms':>10}{'SQL':>6}{'budget':>8}")
+    for name, budget in QUERY_BUDGETS.items():
+        entry = results.get(name)
+        if entry is None:
+            continue
+        status = ''
+        if entry['queries'] > budget:
+            status = '  OVER BUDGET'
+            failed.append(name)
+        print(f"{name:<24}{len(entry['ms']):>5}{statistics.median(entry['ms']):>10.1f}"
+              f"{max(entry['ms']):>10.1f}{entry['queries']:>6}{budget:>8}{status}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=300)
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='SQLite 檔案路徑（預設用暫存檔）')
+    parser.add_argument('--keep', action='store_true', help='結束後保留資料庫')
+    parser.add_argument('--skip-generate', action='store_true', help='不產生資料，直接量測 --db')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    os.environ.setdefault('EXPORT_DIR', os.path.join(os.path.dirname(path), 'exports'))
+    from app import app
+    import migrations
+    app.config['TESTING'] = True
+    with app.app_context():
+        migrations.upgrade()
+    if not args.skip_generate:
+        print(f'產生 {args.games} 場比賽到 {path}')
+        start = time.perf_counter()
+        generate_season(app, args.games, args.seed)
+        print(f'完成，{time.perf_counter() - start:.1f} 秒')
+    failed = report(run_benchmarks(app, args.samples, args.seed))
+    if not args.keep and not args.db:
+        os.remove(path)
+    if failed:
+        print('超過 SQL 上限：' + ', '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""依比賽 data_version 失效的快取。
+
+每個比賽只存一份結果，並記下產生時的 data_version；任何寫入都會讓
+Game.data_version +1，之後讀取時版本對不上就當作沒有快取。
+
+本機用有上限的 LRU；設定 CACHE_REDIS_URL 時另外寫一份到 Redis，
+讓多個 gunicorn worker 共用（需要另外安裝 redis 套件）。
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# 比賽進行中的結果很快就會過期，放在共用快取裡只留一段時間
+LIVE_TTL = 600
+
+
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+def shared_backend():
+    url = os.environ.get('CACHE_REDIS_URL')
+    return RedisBackend(url) if url else None
+
+
+class VersionedCache:
+    def __init__(self, namespace, maxsize=128, shared=None):
+        self.namespace = namespace
+        self.local = LRUCache(maxsize)
+        self.shared = shared
+
+    def _key(self, game_id):
+        return f'{self.namespace}:{game_id}'
+
+    def get(self, game_id, version):
+        entry = self.local.get(game_id)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(self._key(game_id))
+            if entry is not None:
+                self.local.set(game_id, entry)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def set(self, game_id, version, value, final=False):
+        """final=True（已完成紀錄的比賽）在共用快取裡不設過期時間。"""
+        entry = (version, value)
+        self.local.set(game_id, entry)
+        if self.shared is not None:
+            self.shared.set(self._key(game_id), entry, ttl=None if final else LIVE_TTL)
+
+    def invalidate(self, game_id):
+        self.local.delete(game_id)
+        if self.shared is not None:
+            self.shared.delete(self._key(game_id))
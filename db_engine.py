@@ -0,0 +1,74 @@
+"""資料庫連線池設定。
+
+DB_PROFILE 選一組連線池預設值（沒設定時是 default，沿用 SQLAlchemy 原本的設定；
+web：gunicorn 每個 worker 一個 pool；small：worker 很多、Postgres 連線數有限時），
+個別數值可以再用環境變數覆寫：
+
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT / DB_POOL_RECYCLE / DB_POOL_PRE_PING
+    DB_STATEMENT_TIMEOUT_MS      Postgres 單一 SQL 的執行上限
+
+SQLite 每條連線都會設定 journal_mode（預設 WAL，記錄員寫入時觀眾仍可讀取）、
+synchronous 與 busy_timeout，可用 SQLITE_JOURNAL_MODE / SQLITE_SYNCHRONOUS /
+SQLITE_BUSY_TIMEOUT_MS 調整。
+"""
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+PROFILES = {
+    'default': {},
+    # pre_ping 丟掉閒置後被資料庫關掉的連線；LIFO 讓多出來的連線閒置到被 recycle 回收
+    'web': {'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 10, 'pool_recycle': 1800,
+            'pool_pre_ping': True, 'pool_use_lifo': True},
+    'small': {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 10, 'pool_recycle': 900,
+              'pool_pre_ping': True, 'pool_use_lifo': True},
+}
+POOL_ENV = {'pool_size': ('DB_POOL_SIZE', int), 'max_overflow': ('DB_MAX_OVERFLOW', int),
+            'pool_timeout': ('DB_POOL_TIMEOUT', float), 'pool_recycle': ('DB_POOL_RECYCLE', int),
+            'pool_pre_ping': ('DB_POOL_PRE_PING', lambda v: v.lower() in ('1', 'true', 'yes'))}
+
+
+def engine_options(url, environ=os.environ):
+    """依 DB_PROFILE 與環境變數組出 SQLALCHEMY_ENGINE_OPTIONS。"""
+    profile = environ.get('DB_PROFILE') or 'default'
+    if profile not in PROFILES:
+        raise ValueError(f'DB_PROFILE 必須是 {", ".join(PROFILES)} 之一：{profile}')
+    options = dict(PROFILES[profile])
+    for key, (name, convert) in POOL_ENV.items():
+        if environ.get(name):
+            options[key] = convert(environ[name])
+
+    if not url:
+        return options
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # 記憶體資料庫只有一條連線，不能設定連線池大小
+        return {}
+    timeout = environ.get('DB_STATEMENT_TIMEOUT_MS')
+    if timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+    return options
+
+
+def sqlite_pragmas(environ=os.environ):
+    return [('journal_mode', environ.get('SQLITE_JOURNAL_MODE', 'WAL')),
+            ('synchronous', environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+            ('busy_timeout', int(environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)))]
+
+
+def init_app(app, db):
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        pragmas = sqlite_pragmas()
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+            cursor.close()
+
+    # gunicorn --preload 時 fork 出來的 worker 不能沿用父行程的連線
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
@@ -0,0 +1,151 @@
+"""比賽數據匯出成 Excel。
+
+用 openpyxl 的 write-only workbook：列直接寫進檔案，不在記憶體裡保留整張表的
+Cell 物件；字型／置中用同一個 NamedStyle，欄寬在加入資料時順便算好。
+"""
+from tempfile import SpooledTemporaryFile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, NamedStyle
+from openpyxl.utils import get_column_letter
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CELL_STYLE = 'yzu_cell'
+# 檔案小於這個大小時留在記憶體，超過才寫到暫存檔
+SPOOL_SIZE = 1024 * 1024
+
+
+class SheetBuffer:
+    """先收集一張表的列並算出欄寬，寫入 write-only sheet 時欄寬必須在第一列之前設定。"""
+
+    def __init__(self, title, width=None, first_width=None):
+        self.title = title
+        self.width = width                # 整張表固定欄寬
+        self.first_width = first_width    # 只固定第一欄
+        self.rows = []
+        self.lengths = []
+
+    def append(self, row):
+        for i, value in enumerate(row):
+            if i == len(self.lengths):
+                self.lengths.append(0)
+            if value:
+                self.lengths[i] = max(self.lengths[i], len(str(value)))
+        self.rows.append(row)
+
+    def column_widths(self):
+        widths = [self.width or min(length + 6, 30) for length in self.lengths]
+        if self.first_width and widths:
+            widths[0] = self.first_width
+        return widths
+
+    def write(self, wb):
+        ws = wb.create_sheet(self.title)
+        for i, width in enumerate(self.column_widths(), 1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+        ws.row_dimensions[1].height = 28   # 第一列標題高度也可加高
+        for row in self.rows:
+            cells = []
+            for value in row:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = CELL_STYLE
+                cells.append(cell)
+            ws.append(cells)
+
+
+def new_workbook():
+    wb = Workbook(write_only=True)
+    wb.add_named_style(NamedStyle(name=CELL_STYLE, font=Font(size=14),  # 想再大可設 16
+                                  alignment=Alignment(horizontal="center", vertical="center")))
+    return wb
+
+
+def game_sheets(summary, prefix=''):
+    """一場比賽的五張表；prefix 用在多場比賽放同一個檔案時區分工作表名稱。"""
+    game = summary.game
+    max_inning = summary.max_inning
+
+    # ===== Sheet 1: 比分表 =====
+    ws1 = SheetBuffer(prefix + "比分表", first_width=22)
+    ws1.append(['', *[str(i) for i in range(1, max_inning+1)], 'R', 'H', 'E'])
+    ws1.append(['元智大學', *summary.team_scores_per_inning, game.team_score,
+                summary.team_hits, summary.team_errors])
+    ws1.append([game.opponent, *summary.opponent_scores_per_inning, game.opponent_score,
+                summary.opponent_hits, summary.opponent_errors])
+
+    # ===== Sheet 2: 打擊成績 =====
+    ws2 = SheetBuffer(prefix + "打擊成績", width=18)   # 可以設 16~22
+    ws2.append(['棒次', '球員'] + [f'第{i}局' for i in range(1, max_inning+1)] +
+               ['打數', '安打', '全壘打', '打點', '得分', '打擊率'])
+    for row in summary.stats_table:
+        ws2.append([
+            row['order']+1,
+            row['player'].name if row['player'] else '',
+            *row['results'],
+            row['ab'], row['hit'], row['hr'], row['rbi'],
+            row.get('run', 0),
+            "%.3f" % (row['hit']/row['ab'] if row['ab'] else 0.0)
+        ])
+    # 總計行
+    total = summary.total
+    ws2.append(['總計', ''] + total.get('inning_results', [0]*max_inning) +
+               [total['ab'], total['hit'], total['hr'], total['rbi'], total.get('run', 0),
+                "%.3f" % (total['hit']/total['ab'] if total['ab'] else 0.0)])
+
+    # ===== Sheet 3: 投手成績 =====
+    ws3 = SheetBuffer(prefix + "投手成績", width=15)
+    ws3.append(['投手', '投球局數', '面對打席', '投球數', '好球數', '安打', '全壘打', '四壞', '觸身', '三振', '失分'])
+    for p in summary.pitcher_stats + [dict(summary.pitcher_total, name='總計')]:
+        ws3.append([
+            p['name'], p['ip'], p['batters'], p['pitch_count'], p['strikes'],
+            p['hits'], p['hr'], p['bb'], p['hbp'], p['k'], p['run']
+        ])
+
+    # ===== Sheet 4: 投手每局用球數 =====
+    ws4 = SheetBuffer(prefix + "投手每局用球數")
+    innings = summary.pitcher_innings
+    ws4.append(['投手'] + [f'第{inn}局' for inn in innings])
+    totals = [0] * len(innings)
+    for pitcher in summary.pitcher_inning_data:
+        ws4.append([pitcher['name']] + pitcher['data'])
+        for i, count in enumerate(pitcher['data']):
+            totals[i] += count or 0
+    ws4.append(['總計'] + totals)
+
+    # ===== Sheet 5: 防守打席紀錄 =====
+    ws5 = SheetBuffer(prefix + "防守打席紀錄")
+    ws5.append(['局數', '投手', '對方打者', '好球', '壞球', '球數', '結果'])
+    strikes = balls = pitches = 0
+    for d in summary.defense_records:
+        ws5.append([
+            d['inning'],
+            d['pitcher'].name if d['pitcher'] else '',
+            d['batter_name'],
+            d['strike'],
+            d['ball'],
+            d['pitch_count'],
+            '跑者出局' if d['result'] == 'RUNNER_OUT' else d['result']
+        ])
+        strikes += d['strike']
+        balls += d['ball']
+        pitches += d['pitch_count']
+    # 防守總計行
+    ws5.append(['總計', '', '', strikes, balls, pitches, '-'])
+
+    return [ws1, ws2, ws3, ws4, ws5]
+
+
+def save_game_workbook(summary, target):
+    """把單場比賽的 .xlsx 寫到 target（檔名或檔案物件）。"""
+    wb = new_workbook()
+    for sheet in game_sheets(summary):
+        sheet.write(wb)
+    wb.save(target)
+
+
+def write_game_workbook(summary):
+    """回傳已寫好 .xlsx 的檔案物件（指標在開頭），交給 send_file 分段送出。"""
+    output = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    save_game_workbook(summary, output)
+    output.seek(0)
+    return output
@@ -0,0 +1,225 @@
+"""整個賽事／日期區間的背景匯出。
+
+request 只建立一筆 ExportJob 就回傳，實際工作在 thread pool 裡跑，
+各場比賽的 GameSummary 再平行整理（每個 thread 有自己的 app context 與 session），
+所以 40 場的賽季也不會卡住 gunicorn worker 到逾時。狀態存在資料庫，
+檔案放在 instance/exports（可用 EXPORT_DIR 指定），任何一個 worker 都能回答查詢與下載。
+
+單場的 .xlsx 依 Game.data_version 快取：比賽沒有變動時重複下載直接回傳快取。
+快取沒有時交給 workbook_executor（最多 WORKBOOK_WORKERS 個 thread）寫進 export 目錄的暫存檔，
+request 只等結果再分段送出，不把整個檔案放在記憶體；同一場同一版本同時下載的人共用同一個
+暫存檔，最後一個送完才刪除。只有不超過 GAME_EXPORT_CACHE_MAX_BYTES 的檔案才放進快取，
+所以快取最多佔 GAME_EXPORT_CACHE_SIZE × GAME_EXPORT_CACHE_MAX_BYTES（預設 32 × 1 MB）。
+"""
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import current_app
+from models import db, Game, ExportJob
+from summary import GameSummary
+from excel_export import SheetBuffer, new_workbook, game_sheets, write_game_workbook, save_game_workbook, SPOOL_SIZE
+from season_stats import filter_games
+from cache import VersionedCache, shared_backend
+
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 4))
+# 匯出檔保留一天
+EXPORT_RETENTION = 24 * 3600
+
+# 同時最多跑兩個匯出工作，每個工作再用 EXPORT_WORKERS 個 thread 整理各場比賽
+job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='export-job')
+game_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export-game')
+# 單場下載另外用一個小 pool，不會排在賽季匯出後面；同時產生的單場檔案數不超過這個數
+workbook_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('WORKBOOK_WORKERS', 2)),
+                                       thread_name_prefix='export-workbook')
+workbook_cache = VersionedCache('game_xlsx', maxsize=int(os.environ.get('GAME_EXPORT_CACHE_SIZE', 32)),
+                                shared=shared_backend())
+# 超過這個大小的 .xlsx 不放進快取，每次下載都重新產生
+WORKBOOK_CACHE_MAX_BYTES = int(os.environ.get('GAME_EXPORT_CACHE_MAX_BYTES', SPOOL_SIZE))
+# (game_id, data_version) -> 產生中或送出中的 _SharedWorkbook
+_inflight = {}
+_inflight_lock = threading.Lock()
+# 等待單場 .xlsx 產生的上限（秒）
+WORKBOOK_TIMEOUT = 60
+
+
+def export_dir(app):
+    path = os.environ.get('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def remove_old_exports(path):
+    cutoff = time.time() - EXPORT_RETENTION
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        if os.path.getmtime(file_path) < cutoff:
+            os.remove(file_path)
+
+
+def safe_filename(name):
+    return re.sub(r'[\\/:*?"<>|]', '_', name)
+
+
+def _cache_workbook(game, data):
+    if len(data) <= WORKBOOK_CACHE_MAX_BYTES:
+        workbook_cache.set(game.id, game.data_version, data, final=game.is_recorded)
+
+
+def game_workbook_bytes(game):
+    """回傳單場比賽的 .xlsx 內容（賽季 zip 匯出用）；同一個 data_version 只產生一次。"""
+    data = workbook_cache.get(game.id, game.data_version)
+    if data is None:
+        with write_game_workbook(GameSummary.load(game)) as output:
+            data = output.read()
+        _cache_workbook(game, data)
+    return data
+
+
+class _SharedWorkbook:
+    """同一場同一版本的單場 .xlsx 暫存檔：future 完成時是檔案路徑，readers 為還沒送完的下載數。"""
+
+    def __init__(self, key, future):
+        self.key = key
+        self.future = future
+        self.readers = 0
+
+
+class _WorkbookReader(io.FileIO):
+    # send_file 送完會 close()，這時才放掉對暫存檔的引用
+    def __init__(self, shared):
+        super().__init__(shared.future.result(), 'rb')
+        self._shared = shared
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            _release(self._shared)
+
+
+def _remove_file(future):
+    if future.exception() is None and os.path.exists(future.result()):
+        os.remove(future.result())
+
+
+def _release(shared):
+    with _inflight_lock:
+        shared.readers -= 1
+        if shared.readers:
+            return
+        if _inflight.get(shared.key) is shared:
+            del _inflight[shared.key]
+    # 最後一個下載結束（或都等到逾時）：檔案產生完就刪掉
+    shared.future.add_done_callback(_remove_file)
+
+
+def _build_workbook_file(app, game_id):
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        fd, path = tempfile.mkstemp(prefix=f'game-{game_id}-', suffix='.xlsx', dir=export_dir(app))
+        with os.fdopen(fd, 'wb') as output:
+            save_game_workbook(GameSummary.load(game), output)
+        if os.path.getsize(path) <= WORKBOOK_CACHE_MAX_BYTES:
+            with open(path, 'rb') as f:
+                _cache_workbook(game, f.read())
+        return path
+
+
+def open_game_workbook(game):
+    """export_game_excel 用：回傳交給 send_file 的檔案物件。
+
+    快取有就包成 BytesIO；沒有就在 workbook_executor 產生（同一場同一版本共用一份），
+    等待超過 WORKBOOK_TIMEOUT 秒丟 TimeoutError。
+    """
+    data = workbook_cache.get(game.id, game.data_version)
+    if data is not None:
+        return io.BytesIO(data)
+    key = (game.id, game.data_version)
+    with _inflight_lock:
+        shared = _inflight.get(key)
+        if shared is None:
+            future = workbook_executor.submit(_build_workbook_file, current_app._get_current_object(), game.id)
+            shared = _inflight[key] = _SharedWorkbook(key, future)
+        shared.readers += 1
+    try:
+        shared.future.result(timeout=WORKBOOK_TIMEOUT)
+        return _WorkbookReader(shared)
+    except BaseException:
+        _release(shared)
+        raise
+
+
+def start_season_export(tournament=None, start=None, end=None, fmt='xlsx'):
+    job = ExportJob(id=uuid.uuid4().hex, status='pending', total=0, done=0,
+                    params=json.dumps({'tournament': tournament, 'start': start, 'end': end, 'fmt': fmt}))
+    db.session.add(job)
+    db.session.commit()
+    job_executor.submit(run_season_export, current_app._get_current_object(), job.id)
+    return job
+
+
+def _summarize_game(app, game_id, index, fmt):
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        info = [index, game.date.isoformat(), game.tournament, game.opponent, game.team_score, game.opponent_score]
+        if fmt == 'zip':
+            name = safe_filename(f'{index:02d} {game.date} {game.tournament} vs {game.opponent}.xlsx')
+            return info, (name, game_workbook_bytes(game))
+        return info, game_sheets(GameSummary.load(game), prefix=f'{index}.')
+
+
+def run_season_export(app, job_id):
+    with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        params = json.loads(job.params)
+        fmt = params.pop('fmt')
+        try:
+            query = filter_games(db.session.query(Game.id), **params).order_by(Game.date, Game.id)
+            game_ids = [gid for (gid,) in query]
+            job.status = 'running'
+            job.total = len(game_ids)
+            db.session.commit()
+
+            futures = {game_executor.submit(_summarize_game, app, gid, index, fmt): index
+                       for index, gid in enumerate(game_ids, 1)}
+            results = {}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                job.done += 1
+                db.session.commit()
+            ordered = [results[index] for index in sorted(results)]
+
+            path = export_dir(app)
+            remove_old_exports(path)
+            job.file_path = os.path.join(path, f'{job.id}.{fmt}')
+            if fmt == 'zip':
+                with zipfile.ZipFile(job.file_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                    for info, (name, data) in ordered:
+                        zf.writestr(name, data)
+            else:
+                wb = new_workbook()
+                schedule = SheetBuffer('賽程')
+                schedule.append(['#', '日期', '賽事', '對手', '元智大學', '對手得分'])
+                for info, sheets in ordered:
+                    schedule.append(info)
+                schedule.write(wb)
+                for info, sheets in ordered:
+                    for sheet in sheets:
+                        sheet.write(wb)
+                wb.save(job.file_path)
+            label = params['tournament'] or '全部賽事'
+            if params['start'] or params['end']:
+                label += f" {params['start'] or ''}~{params['end'] or ''}"
+            job.download_name = safe_filename(f'{label}.{fmt}')
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            job.status = 'error'
+            job.error = str(e)
+        db.session.commit()
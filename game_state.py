@@ -0,0 +1,117 @@
+from sqlalchemy.exc import IntegrityError
+from models import db, AtBatStat, DefenseStat, GameInningState, GameInningPitcher
+from summary import atbat_runs
+from results import BY_CODE
+
+
+def get_inning_state(game_id, inning, half):
+    return GameInningState.query.filter_by(game_id=game_id, inning=inning, half=half).first()
+
+
+def _get_or_create(model, defaults, **keys):
+    """依唯一鍵 keys 取得一列，沒有就新增。
+
+    新增在 savepoint 裡先 flush：另一個 request 同時新增了同一列（IntegrityError）時
+    只撤銷這個 savepoint，改讀對方寫入的那一列，不影響這個 transaction 其他的寫入。
+    """
+    row = model.query.filter_by(**keys).first()
+    if row is not None:
+        return row
+    try:
+        with db.session.begin_nested():
+            row = model(**keys, **defaults)
+            db.session.add(row)
+    except IntegrityError:
+        row = model.query.filter_by(**keys).one()
+    return row
+
+
+def _inning_state_for_update(game_id, inning, half):
+    return _get_or_create(GameInningState, dict(outs=0, runs=0, hits=0, pitch_count=0),
+                          game_id=game_id, inning=inning, half=half)
+
+
+def accumulate_atbat(state, ab, sign):
+    kind = BY_CODE[ab.result_code]
+    state.outs += sign * kind.outs
+    state.runs += sign * atbat_runs(ab)
+    state.hits += sign * kind.is_hit
+
+
+def accumulate_defense(state, ds, sign):
+    kind = BY_CODE[ds.result_code]
+    state.outs += sign * kind.outs
+    state.runs += sign * (ds.runs or 0)
+    state.pitch_count += sign * (ds.pitch_count or 0)
+    state.hits += sign * kind.is_hit
+
+
+def apply_atbat(ab, sign=1):
+    """把一筆 AtBatStat 加進（sign=-1 時扣掉）進攻半局狀態，需由呼叫端 commit。"""
+    state = _inning_state_for_update(ab.game_id, ab.inning, 'A')
+    accumulate_atbat(state, ab, sign)
+    return state
+
+
+def apply_defense(ds, sign=1):
+    """把一筆 DefenseStat 加進（sign=-1 時扣掉）防守半局狀態與投手用球數，需由呼叫端 commit。"""
+    state = _inning_state_for_update(ds.game_id, ds.inning, 'D')
+    accumulate_defense(state, ds, sign)
+    if ds.pitcher_id:
+        row = _get_or_create(GameInningPitcher, dict(pitch_count=0),
+                             game_id=ds.game_id, inning=ds.inning, pitcher_id=ds.pitcher_id)
+        row.pitch_count += sign * (ds.pitch_count or 0)
+    return state
+
+
+def get_pitcher_pitch_count(game_id, pitcher_id, inning=None):
+    query = db.session.query(db.func.coalesce(db.func.sum(GameInningPitcher.pitch_count), 0)) \
+        .filter_by(game_id=game_id, pitcher_id=pitcher_id)
+    if inning is not None:
+        query = query.filter_by(inning=inning)
+    return query.scalar()
+
+
+def get_total_pitch_count(game_id):
+    return db.session.query(db.func.coalesce(db.func.sum(GameInningState.pitch_count), 0)) \
+        .filter_by(game_id=game_id, half='D').scalar()
+
+
+def get_pitch_counts(game_id):
+    # 本場每位投手的總用球數 {pitcher_id: 球數}
+    rows = (db.session.query(GameInningPitcher.pitcher_id, db.func.sum(GameInningPitcher.pitch_count))
+            .filter_by(game_id=game_id)
+            .group_by(GameInningPitcher.pitcher_id))
+    return {pitcher_id: count or 0 for pitcher_id, count in rows}
+
+
+def delete_inning_state(game_id):
+    GameInningState.query.filter_by(game_id=game_id).delete()
+    GameInningPitcher.query.filter_by(game_id=game_id).delete()
+
+
+def rebuild_inning_state(game_id):
+    """由 AtBatStat / DefenseStat 重新計算整場的半局狀態（舊資料補建用），需由呼叫端 commit。"""
+    delete_inning_state(game_id)
+    states = {}
+    pitchers = {}
+
+    def state_for(inning, half):
+        if (inning, half) not in states:
+            states[(inning, half)] = GameInningState(game_id=game_id, inning=inning, half=half,
+                                                     outs=0, runs=0, hits=0, pitch_count=0)
+        return states[(inning, half)]
+
+    for ab in AtBatStat.query.filter_by(game_id=game_id).all():
+        # 防守失誤的註記只是標記用，不屬於進攻半局
+        if ab.order == -1 and ab.note == '防守失誤':
+            continue
+        accumulate_atbat(state_for(ab.inning, 'A'), ab, 1)
+    for ds in DefenseStat.query.filter_by(game_id=game_id).all():
+        accumulate_defense(state_for(ds.inning, 'D'), ds, 1)
+        if ds.pitcher_id:
+            key = (ds.inning, ds.pitcher_id)
+            pitchers[key] = pitchers.get(key, 0) + (ds.pitch_count or 0)
+    db.session.add_all(states.values())
+    db.session.add_all(GameInningPitcher(game_id=game_id, inning=inning, pitcher_id=pid, pitch_count=count)
+                       for (inning, pid), count in pitchers.items())
@@ -0,0 +1,215 @@
+"""記錄員離線累積的 play 批次上傳。
+
+一批 play 依序驗證（棒次、半局是否已三出局、結果代碼），全部通過才在同一個
+transaction 裡寫入：半局狀態與投手用球數在記憶體累加，AtBatStat / DefenseStat /
+PlayEvent 各用一次 executemany 寫入（Postgres 會合併成多列 VALUES；SQLite 因為
+RETURNING 不保證順序，取回 id 的兩張表仍是逐列 INSERT）。
+
+每筆 play 帶著用戶端產生的 id（存在 PlayEvent.client_id），重送同一筆只會被略過，
+網路斷線重試不會重複記錄。
+"""
+from sqlalchemy import insert
+from models import (db, Player, AtBatStat, DefenseStat, GameBattingOrder,
+                    GameInningState, GameInningPitcher, PlayEvent)
+from game_state import accumulate_atbat, accumulate_defense
+from results import ATBAT_RESULTS, DEFENSE_RESULTS
+from base_out import parse_bases
+import play_log
+
+# 單一批次的上限，避免一個 request 寫入太久
+MAX_BATCH = 200
+
+
+class BatchError(ValueError):
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+def _int(play, key, index, default=0):
+    value = play.get(key, default)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise BatchError(index, f'{key} 必須是整數')
+    if value < 0:
+        raise BatchError(index, f'{key} 不可為負數')
+    return value
+
+
+def _bases(play, index):
+    # 壘上跑者可省略（沒記錄）
+    try:
+        return parse_bases(play.get('bases'))
+    except (TypeError, ValueError):
+        raise BatchError(index, 'bases 必須是 0~7')
+
+
+class _Batch:
+    """一批 play 寫入期間的半局狀態與投手用球數，每種列只查一次。"""
+
+    def __init__(self, game):
+        self.game = game
+        self.states = {(s.inning, s.half): s for s in GameInningState.query.filter_by(game_id=game.id)}
+        self.pitchers = {(r.inning, r.pitcher_id): r for r in GameInningPitcher.query.filter_by(game_id=game.id)}
+
+    def state(self, inning, half):
+        key = (inning, half)
+        if key not in self.states:
+            self.states[key] = GameInningState(game_id=self.game.id, inning=inning, half=half,
+                                               outs=0, runs=0, hits=0, pitch_count=0)
+            db.session.add(self.states[key])
+        return self.states[key]
+
+    def add_pitches(self, inning, pitcher_id, count):
+        key = (inning, pitcher_id)
+        if key not in self.pitchers:
+            self.pitchers[key] = GameInningPitcher(game_id=self.game.id, inning=inning,
+                                                   pitcher_id=pitcher_id, pitch_count=0)
+            db.session.add(self.pitchers[key])
+        self.pitchers[key].pitch_count += count
+
+
+def ingest_plays(game, plays):
+    """驗證並寫入一批 play，回傳 (新寫入的 id, 已寫過而略過的 id)；需由呼叫端 commit。
+
+    任何一筆不合法就丟出 BatchError，呼叫端 rollback 後整批都不會寫入。
+    """
+    if not isinstance(plays, list):
+        raise BatchError(None, 'plays 必須是陣列')
+    if len(plays) > MAX_BATCH:
+        raise BatchError(None, f'一次最多 {MAX_BATCH} 筆')
+    ids = []
+    for index, play in enumerate(plays):
+        if not isinstance(play, dict) or not isinstance(play.get('id'), str) or not play['id']:
+            raise BatchError(index, '每筆 play 都需要字串 id')
+        if play['id'] in ids:
+            raise BatchError(index, f"id 重複：{play['id']}")
+        ids.append(play['id'])
+    if not ids:
+        return [], []
+
+    seen = {cid for (cid,) in db.session.query(PlayEvent.client_id)
+            .filter(PlayEvent.game_id == game.id, PlayEvent.client_id.in_(ids))}
+    lineup = {o.order: o.player_id for o in GameBattingOrder.query.filter_by(game_id=game.id)}
+    if not lineup:
+        raise BatchError(None, '請先設定棒次順序')
+    player_ids = {pid for (pid,) in db.session.query(Player.id)}
+    batch = _Batch(game)
+    last = play_log.last_event(game.id)
+    seq = last.seq if last else 0
+
+    pending = []   # (play, 事件, AtBatStat, DefenseStat)
+    scores = (game.team_score or 0, game.opponent_score or 0)
+    # 逐筆驗證時比分先在記憶體累加，給事件紀錄的 before/after 用；中途不能 autoflush
+    # （_snapshot 會查詢），比分最後才以 SQL 累加寫回
+    with db.session.no_autoflush:
+        for index, play in enumerate(plays):
+            if play['id'] in seen:
+                continue
+            kind = play.get('type')
+            inning = _int(play, 'inning', index)
+            if inning < 1:
+                raise BatchError(index, 'inning 必須大於 0')
+            before = play_log.capture(game)
+            atbat = defense = None
+
+            if kind == 'atbat':
+                result = play.get('result')
+                if result not in ATBAT_RESULTS:
+                    raise BatchError(index, f'不明的打擊結果：{result}')
+                state = batch.state(inning, 'A')
+                if state.outs >= 3:
+                    raise BatchError(index, f'第{inning}局進攻已經三出局')
+                order = game.next_batter_order or 0
+                if play.get('order') is not None and _int(play, 'order', index) != order:
+                    raise BatchError(index, f'棒次不符：目前輪到第{order + 1}棒')
+                if order not in lineup:
+                    raise BatchError(index, f'第{order + 1}棒沒有球員')
+                if result in ('對手失誤', '暴投'):
+                    runs = _int(play, 'runs', index)
+                    atbat = AtBatStat(game_id=game.id, player_id=lineup[order], order=order, result=result,
+                                      inning=inning, rbis=0, note=str(runs), bases=_bases(play, index))
+                    game.team_score = (game.team_score or 0) + runs
+                else:
+                    rbis = _int(play, 'rbis', index)
+                    atbat = AtBatStat(game_id=game.id, player_id=lineup[order], order=order, result=result,
+                                      inning=inning, rbis=rbis, position=play.get('position', ''),
+                                      note=play.get('note', ''), bases=_bases(play, index))
+                    game.team_score = (game.team_score or 0) + rbis
+                    if result != 'RUNNER_OUT':
+                        game.next_batter_order = (order + 1) % len(lineup)
+                accumulate_atbat(state, atbat, 1)
+
+            elif kind == 'defense':
+                result = play.get('result')
+                if result not in DEFENSE_RESULTS:
+                    raise BatchError(index, f'不明的打席結果：{result}')
+                state = batch.state(inning, 'D')
+                if state.outs >= 3:
+                    raise BatchError(index, f'第{inning}局防守已經三出局')
+                pitcher_id = play.get('pitcher_id') or game.current_pitcher_id
+                if pitcher_id is None:
+                    raise BatchError(index, '尚未設定投手')
+                if pitcher_id not in player_ids:
+                    raise BatchError(index, f'找不到投手：{pitcher_id}')
+                runs = _int(play, 'runs', index) + _int(play, 'err_runs', index)
+                pitch_count = _int(play, 'pitch_count', index)
+                defense = DefenseStat(game_id=game.id, inning=inning, pitcher_id=pitcher_id,
+                                      batter_name=str(play.get('batter_name', ''))[:32],
+                                      strike=_int(play, 'strike', index), ball=_int(play, 'ball', index),
+                                      pitch_count=pitch_count,
+                                      result='防守失誤' if result == '自己失誤' else result, runs=runs,
+                                      bases=_bases(play, index))
+                if result == '自己失誤':
+                    # 與 record_defense 相同：另存一筆只做標記的 AtBatStat
+                    atbat = AtBatStat(game_id=game.id, player_id=None, order=-1, result='失誤',
+                                      inning=inning, rbis=0, position='', note='防守失誤')
+                game.opponent_score = (game.opponent_score or 0) + runs
+                game.current_pitcher_id = pitcher_id
+                accumulate_defense(state, defense, 1)
+                batch.add_pitches(inning, pitcher_id, pitch_count)
+
+            else:
+                raise BatchError(index, f'不明的 play 類型：{kind}')
+
+            seq += 1
+            event = play_log.build_event(game, seq, kind, before, inning=inning, client_id=play['id'])
+            pending.append((play, event, atbat, defense))
+
+    team_runs, opponent_runs = (game.team_score or 0) - scores[0], (game.opponent_score or 0) - scores[1]
+    game.team_score, game.opponent_score = scores
+    game.add_runs(team=team_runs, opponent=opponent_runs)
+
+    # 先批次寫入紀錄取得 id，再一次寫入指向它們的事件
+    atbat_ids = iter(_bulk_insert(AtBatStat, [a for _, _, a, _ in pending if a is not None], returning=True))
+    defense_ids = iter(_bulk_insert(DefenseStat, [d for _, _, _, d in pending if d is not None], returning=True))
+    for _, event, atbat, defense in pending:
+        event.atbat_id = next(atbat_ids) if atbat is not None else None
+        event.defense_id = next(defense_ids) if defense is not None else None
+    _bulk_insert(PlayEvent, [event for _, event, _, _ in pending])
+    return [play['id'] for play, _, _, _ in pending], [cid for cid in ids if cid in seen]
+
+
+def _bulk_insert(model, objects, returning=False):
+    """用 executemany 一次寫入多筆（不經過 ORM 逐筆 flush）；returning=True 時依序回傳新 id。"""
+    if not objects:
+        return []
+    rows = []
+    for obj in objects:
+        row = {}
+        for column in model.__table__.columns:
+            value = getattr(obj, column.key)
+            # 沒有給值的欄位交給欄位預設值（例如 created_at）
+            if column.primary_key or (value is None and column.default is not None):
+                continue
+            row[column.key] = value
+        rows.append(row)
+    table = model.__table__
+    if returning:
+        stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        return db.session.scalars(stmt, rows).all()
+    db.session.execute(insert(table), rows)
+    return []
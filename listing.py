@@ -0,0 +1,58 @@
+"""比賽與球員列表的 keyset 分頁。
+
+列表不用 OFFSET，而是記下上一頁最後一列的排序鍵（cursor），下一頁從那之後接著讀，
+配合 (篩選欄位, date, id) 的索引，不論累積幾個賽季，每一頁都只讀 PAGE_SIZE 列。
+"""
+from sqlalchemy import tuple_
+from models import Game, Player
+from season_stats import filter_games, parse_date
+
+PAGE_SIZE = 30
+
+
+def _game_cursor(game):
+    return f'{game.date.isoformat()}.{game.id}'
+
+
+def _parse_game_cursor(cursor):
+    # 'YYYY-MM-DD.id'；格式不對就當作第一頁
+    day, _, game_id = (cursor or '').partition('.')
+    day = parse_date(day)
+    if day is None or not game_id.isdigit():
+        return None
+    return day, int(game_id)
+
+
+def game_page(after=None, size=PAGE_SIZE, **filters):
+    """由新到舊的比賽列表，回傳 (這一頁的比賽, 下一頁的 cursor 或 None)。
+
+    filters 與 filter_games 相同：tournament、opponent、start、end、recorded。
+    """
+    query = filter_games(Game.query, **filters)
+    key = _parse_game_cursor(after)
+    if key is not None:
+        query = query.filter(tuple_(Game.date, Game.id) < key)
+    games = query.order_by(Game.date.desc(), Game.id.desc()).limit(size + 1).all()
+    next_cursor = _game_cursor(games[size - 1]) if len(games) > size else None
+    return games[:size], next_cursor
+
+
+def player_page(after=None, size=PAGE_SIZE):
+    """依背號排序的球員列表，cursor 為 '背號.id'。"""
+    query = Player.query
+    number, _, player_id = (after or '').partition('.')
+    if number.lstrip('-').isdigit() and player_id.isdigit():
+        query = query.filter(tuple_(Player.number, Player.id) > (int(number), int(player_id)))
+    players = query.order_by(Player.number, Player.id).limit(size + 1).all()
+    next_cursor = f'{players[size - 1].number}.{players[size - 1].id}' if len(players) > size else None
+    return players[:size], next_cursor
+
+
+def game_filters(args):
+    """比賽列表網址參數 -> filter_games 的條件；recorded 為 '1' / '0' / 空白（全部）。"""
+    recorded = {'1': True, '0': False}.get(args.get('recorded', ''))
+    return {'tournament': args.get('tournament') or None,
+            'opponent': args.get('opponent') or None,
+            'start': args.get('start') or None,
+            'end': args.get('end') or None,
+            'recorded': recorded}
@@ -0,0 +1,219 @@
+"""比賽即時比分推播（Server-Sent Events）。
+
+記錄員 commit 一筆打席／防守紀錄後呼叫 publish()，同一個 worker 裡所有等待中的
+/games/<id>/live 連線會被叫醒；快照（比分、局數、出局數、最後一個 play）每個
+data_version 只整理一次並放進 VersionedCache，幾百個觀眾共用同一份。
+其他 worker 寫入的紀錄則在 POLL_INTERVAL 逾時時讀 data_version 發現。
+
+每條連線會佔住一個 thread，部署時 gunicorn 要用 gthread 或 gevent worker。
+"""
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+from models import db, Game, Player, AtBatStat, DefenseStat, GameInningState
+from cache import VersionedCache, shared_backend
+
+# 沒有新紀錄時多久檢查一次 data_version 並送出 keep-alive
+POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', 15))
+
+snapshot_cache = VersionedCache('live', maxsize=64, shared=shared_backend())
+_build_locks = {}   # game_id -> [lock, 使用中的 request 數]
+_build_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _build_lock(game_id):
+    # 每場比賽各自一把鎖：同一場的快照只整理一次，不同場不會互相等；沒有人用時就移除
+    with _build_locks_guard:
+        entry = _build_locks.setdefault(game_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _build_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _build_locks[game_id]
+
+
+class Broadcaster:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._versions = {}   # game_id -> 最新發布的 data_version
+        self._waiting = {}    # game_id -> 等待中的連線數
+        self._closed = set()  # 已完成紀錄或已刪除的比賽，最後一條等待中的連線離開後移除
+
+    def publish(self, game_id, version, final=False):
+        with self._cond:
+            self._versions[game_id] = version
+            if final:
+                self._closed.add(game_id)
+            else:
+                self._closed.discard(game_id)   # 重新開啟紀錄
+            self._prune(game_id)
+            self._cond.notify_all()
+
+    def close(self, game_id):
+        # 比賽已刪除：叫醒等待中的連線，它們讀不到比賽就會結束
+        self.publish(game_id, math.inf, final=True)
+
+    def _prune(self, game_id):
+        if game_id in self._closed and not self._waiting.get(game_id):
+            self._closed.discard(game_id)
+            self._versions.pop(game_id, None)
+
+    def wait(self, game_id, version, timeout):
+        """等到有比 version 新的發布（data_version 只會增加），逾時回傳 None。"""
+        with self._cond:
+            self._waiting[game_id] = self._waiting.get(game_id, 0) + 1
+            try:
+                if self._cond.wait_for(lambda: self._versions.get(game_id, 0) > version, timeout):
+                    return self._versions[game_id]
+            finally:
+                self._waiting[game_id] -= 1
+                if not self._waiting[game_id]:
+                    del self._waiting[game_id]
+                    self._prune(game_id)
+        return None
+
+
+broadcaster = Broadcaster()
+
+
+def publish(game):
+    # 完成紀錄後不會再有新版本，等待中的連線收到這一版就結束
+    broadcaster.publish(game.id, game.data_version, final=bool(game.is_recorded))
+
+
+def game_deleted(game_id):
+    broadcaster.close(game_id)
+
+
+def _last_play(game):
+    # 沒有時間戳記，用 (局數, 上/下半, id) 判斷進攻與防守紀錄哪一筆較晚
+    atbat = (AtBatStat.query.filter(AtBatStat.game_id == game.id, AtBatStat.order >= 0)
+             .order_by(AtBatStat.inning.desc(), AtBatStat.id.desc()).first())
+    defense = (DefenseStat.query.filter(DefenseStat.game_id == game.id)
+               .order_by(DefenseStat.inning.desc(), DefenseStat.id.desc()).first())
+    first = game.first_attack or 'A'
+    candidates = []
+    if atbat:
+        candidates.append(((atbat.inning, 'A' != first), 'A', atbat))
+    if defense:
+        candidates.append(((defense.inning, 'D' != first), 'D', defense))
+    if not candidates:
+        return None, None
+    _, half, play = max(candidates, key=lambda c: c[0])
+    if half == 'A':
+        player = db.session.get(Player, play.player_id) if play.player_id else None
+        text = '%s %s' % (player.name if player else '', play.result)
+    else:
+        text = '%s %s' % (play.batter_name or '', play.result)
+    if play.result == 'RUNNER_OUT':
+        text = '跑者出局'
+    return half, {'inning': play.inning, 'half': half, 'text': text.strip()}
+
+
+def build_snapshot(game):
+    states = GameInningState.query.filter_by(game_id=game.id).all()
+    max_inning = max([s.inning for s in states] + [1])
+    line = {'A': [0] * max_inning, 'D': [0] * max_inning}
+    outs = {}
+    for s in states:
+        line[s.half][s.inning - 1] = s.runs
+        outs[(s.inning, s.half)] = s.outs
+    half, last = _last_play(game)
+    first = game.first_attack or 'A'
+    if last is None:
+        inning, half, current_outs = 1, first, 0
+    else:
+        inning, current_outs = last['inning'], outs.get((last['inning'], half), 0)
+        if current_outs >= 3:
+            # 這個半局已結束，顯示下一個半局
+            if half == first:
+                half = 'D' if half == 'A' else 'A'
+            else:
+                inning, half = inning + 1, first
+            current_outs = 0
+    return {
+        'version': game.data_version,
+        'final': bool(game.is_recorded),
+        'opponent': game.opponent,
+        'team_score': game.team_score or 0,
+        'opponent_score': game.opponent_score or 0,
+        'inning': inning,
+        'top': half == first,
+        'offense': half == 'A',
+        'outs': current_outs,
+        'team_line': line['A'],
+        'opponent_line': line['D'],
+        'last_play': last,
+    }
+
+
+def get_snapshot(game_id, version=None):
+    """version 是 publish 帶來的版本，快取命中時不必查資料庫。"""
+    if version is not None:
+        snapshot = snapshot_cache.get(game_id, version)
+        if snapshot is not None:
+            return snapshot
+    with _build_lock(game_id):
+        game = db.session.get(Game, game_id)
+        if game is None:
+            return None
+        snapshot = snapshot_cache.get(game_id, game.data_version)
+        if snapshot is None:
+            snapshot = build_snapshot(game)
+            snapshot_cache.set(game_id, game.data_version, snapshot, final=game.is_recorded)
+        return snapshot
+
+
+def current_version(game_id):
+    return db.session.query(Game.data_version).filter(Game.id == game_id).scalar()
+
+
+def _event(name, data, event_id=None):
+    text = ''
+    if event_id is not None:
+        text += 'id: %s\n' % event_id
+    return text + 'event: %s\ndata: %s\n\n' % (name, json.dumps(data, ensure_ascii=False))
+
+
+def stream(app, game_id):
+    """SSE 產生器：先送完整快照，之後只送有變動的欄位。
+
+    每次讀資料庫都開新的 app context，連線閒置時不佔用資料庫連線。
+    """
+    sent = None
+    with app.app_context():
+        version = current_version(game_id)
+    while True:
+        if sent is None or version != sent['version']:
+            with app.app_context():
+                snapshot = get_snapshot(game_id, version)
+            if snapshot is None:
+                yield _event('end', {})
+                return
+            if sent is None:
+                yield _event('snapshot', snapshot, snapshot['version'])
+            else:
+                delta = {k: v for k, v in snapshot.items() if sent.get(k) != v}
+                if delta:
+                    yield _event('update', delta, snapshot['version'])
+            sent = snapshot
+            version = snapshot['version']
+            if snapshot['final']:
+                yield _event('end', {})
+                return
+        published = broadcaster.wait(game_id, version, POLL_INTERVAL)
+        if published is None:
+            yield ': keep-alive\n\n'
+            with app.app_context():
+                published = current_version(game_id)
+            if published is None:
+                yield _event('end', {})
+                return
+        version = published
@@ -0,0 +1,146 @@
+"""本機壓力測試：記錄員持續寫入時，觀眾頁面的讀取吞吐量。
+
+每個 writer 在自己的比賽裡一筆一筆上傳 play（/api/games/<id>/plays），
+reader 同時讀即時比分 API、box score 與排行榜。每個執行緒用自己的 Flask test client，
+資料庫連線設定與正式環境相同（db_engine.py）。--devices 讓每場比賽有多台裝置同時上傳，
+收到 409（樂觀鎖衝突）就重送，結束後檢查比分與紀錄是否一致。
+
+    python loadtest.py                                   # WAL（預設）
+    SQLITE_JOURNAL_MODE=DELETE python loadtest.py        # 對照：沒有 WAL
+    python loadtest.py --readers 16 --writers 4 --seconds 20
+    python loadtest.py --writers 2 --devices 3           # 每場比賽 3 台裝置同時記錄
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date
+
+
+def run(app, game_ids, live_ids, readers, writers, seconds, seed=1, devices=1):
+    stop = time.perf_counter() + seconds
+    results = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0, 'conflict': 0}
+    lock = threading.Lock()
+
+    def record(kind, elapsed, ok):
+        with lock:
+            results[kind].append(elapsed)
+            if not ok:
+                errors[kind] += 1
+
+    def reader(n):
+        rng = random.Random(seed + n)
+        client = app.test_client()
+        while time.perf_counter() < stop:
+            url = rng.choice([f'/api/games/{rng.choice(live_ids)}/state',
+                              f'/api/games/{rng.choice(live_ids)}/state',
+                              f'/game_detail/{rng.choice(game_ids)}',
+                              '/leaderboard'])
+            start = time.perf_counter()
+            ok = client.get(url).status_code == 200
+            record('read', time.perf_counter() - start, ok)
+
+    def writer(n):
+        client = app.test_client()
+        game_id = live_ids[n // devices]
+        seq = 0
+        while time.perf_counter() < stop:
+            seq += 1
+            # 一安不會出局，半局永遠不會結束；每筆都得 1 分，最後用來核對比分
+            play = {'id': f'load-{n}-{seq}', 'type': 'atbat' if seq % 2 else 'defense',
+                    'inning': 1, 'result': '一安', 'pitch_count': 3, 'rbis': 1, 'runs': 1}
+            start = time.perf_counter()
+            status = client.post(f'/api/games/{game_id}/plays', json={'plays': [play]}).status_code
+            while status == 409:
+                with lock:
+                    errors['conflict'] += 1
+                status = client.post(f'/api/games/{game_id}/plays', json={'plays': [play]}).status_code
+            record('write', time.perf_counter() - start, status == 200)
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers * devices)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def report(results, errors, seconds):
+    print(f"{'':<8}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for kind, times in results.items():
+        if not times:
+            continue
+        times = sorted(times)
+        p95 = times[int(len(times) * 0.95) - 1] if len(times) >= 20 else times[-1]
+        print(f"{kind:<8}{len(times):>10}{len(times) / seconds:>10.1f}{statistics.median(times) * 1000:>10.1f}"
+              f"{p95 * 1000:>10.1f}{errors[kind]:>8}")
+    print(f"409 衝突後重送 {errors['conflict']} 次")
+
+
+def check_scores(app, live_ids):
+    """比分必須等於紀錄加總：有多台裝置同時寫入時，漏掉的更新會在這裡出現。"""
+    from models import db, Game, AtBatStat, DefenseStat
+    with app.app_context():
+        for game_id in live_ids:
+            game = db.session.get(Game, game_id)
+            team = db.session.query(db.func.coalesce(db.func.sum(AtBatStat.rbis), 0)).filter_by(game_id=game_id).scalar()
+            opponent = db.session.query(db.func.coalesce(db.func.sum(DefenseStat.runs), 0)).filter_by(game_id=game_id).scalar()
+            status = 'ok' if (game.team_score, game.opponent_score) == (team, opponent) else 'MISMATCH'
+            print(f'game {game_id}: {game.team_score}:{game.opponent_score}，紀錄 {team}:{opponent} {status}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2, help='至少 1')
+    parser.add_argument('--devices', type=int, default=1, help='每場比賽同時上傳的裝置數')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--games', type=int, default=30, help='預先產生的已完成比賽數')
+    parser.add_argument('--db', help='SQLite 檔案路徑（預設用暫存檔）')
+    args = parser.parse_args()
+
+    tmpdir = None if args.db else tempfile.mkdtemp()
+    path = os.path.abspath(args.db) if args.db else os.path.join(tmpdir, 'load.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    from app import app
+    from models import db, Game, Player, GameBattingOrder
+    import benchmark
+    import migrations
+    app.config['TESTING'] = True
+    with app.app_context():
+        migrations.upgrade()
+        mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+    if not args.db:
+        benchmark.generate_season(app, args.games)
+
+    with app.app_context():
+        game_ids = [gid for (gid,) in db.session.query(Game.id).filter(Game.is_recorded.is_(True))]
+        player_ids = [pid for (pid,) in db.session.query(Player.id).limit(9)]
+        live_ids = []
+        for n in range(args.writers):
+            game = Game(tournament='loadtest', opponent='loadtest', date=date(2099, 1, 1),
+                        team_score=0, opponent_score=0, first_attack='A', is_recorded=False)
+            db.session.add(game)
+            db.session.flush()
+            db.session.add_all(GameBattingOrder(game_id=game.id, player_id=pid, order=i)
+                               for i, pid in enumerate(player_ids))
+            live_ids.append(game.id)
+        db.session.commit()
+
+    print(f'journal_mode={mode}, {args.readers} readers / {args.writers} writers × {args.devices} devices, '
+          f'{args.seconds:g} 秒')
+    results, errors = run(app, game_ids, live_ids, args.readers, args.writers, args.seconds, devices=args.devices)
+    report(results, errors, args.seconds)
+    check_scores(app, live_ids)
+    if tmpdir:
+        shutil.rmtree(tmpdir)   # 連同 WAL 的 -wal / -shm 檔
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""每個 request 的 SQL 數量、資料庫時間、樣板渲染時間與總回應時間。
+
+用 SQLAlchemy 的 cursor 事件與 Flask 的樣板 signal 量測，依 endpoint 累積成
+histogram，由 /metrics 以 Prometheus 文字格式輸出（數值存在各個 worker 的記憶體，
+Prometheus 會分別抓取每個 worker）。
+
+設定 SLOW_REQUEST_MS 時，超過這個時間的 request 會寫一筆 warning log，
+附上最慢的幾個 SQL。
+"""
+import os
+import threading
+import time
+from flask import g, request, has_app_context, before_render_template, template_rendered
+from sqlalchemy import event
+
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0)) or None
+# 每個 request 保留最慢的幾個 SQL
+SLOWEST_KEPT = 3
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}   # labels -> [各 bucket 次數..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(key, list(series)) for key, series in items]
+        for key, series in items:
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in key)
+            sep = ',' if labels else ''
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {series[-1]}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_seconds = Histogram('yzu_http_request_duration_seconds', 'Request latency by endpoint.', SECONDS_BUCKETS)
+db_seconds = Histogram('yzu_db_time_seconds', 'Total SQL time per request.', SECONDS_BUCKETS)
+db_statements = Histogram('yzu_db_statements_per_request', 'SQL statements executed per request.', COUNT_BUCKETS)
+template_seconds = Histogram('yzu_template_render_seconds', 'Template render time per request.', SECONDS_BUCKETS)
+HISTOGRAMS = [request_seconds, db_seconds, db_statements, template_seconds]
+
+
+def _request_stats():
+    # 只統計 request 內的 SQL；背景匯出等沒有 request 的工作不計
+    if not has_app_context():
+        return None
+    return g.get('_metrics')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats() is not None:
+        conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats()
+    starts = conn.info.get('_metrics_start')
+    if stats is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats['statements'] += 1
+    stats['db_time'] += elapsed
+    slowest = stats['slowest']
+    slowest.append((elapsed, statement))
+    slowest.sort(key=lambda s: s[0], reverse=True)
+    del slowest[SLOWEST_KEPT:]
+
+
+def _handle_error(context):
+    # 執行失敗的 SQL 不會觸發 after_cursor_execute，把開始時間丟掉
+    starts = context.connection.info.get('_metrics_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        stats['render_start'].append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and stats['render_start']:
+        stats['render_time'] += time.perf_counter() - stats['render_start'].pop()
+
+
+def _start_request():
+    g._metrics = {'start': time.perf_counter(), 'statements': 0, 'db_time': 0.0,
+                  'slowest': [], 'render_time': 0.0, 'render_start': []}
+
+
+def _finish_request(exc):
+    stats = g.pop('_metrics', None)
+    endpoint = request.endpoint or 'unknown'
+    if stats is None or endpoint in ('metrics', 'static'):
+        return
+    elapsed = time.perf_counter() - stats['start']
+    request_seconds.observe(elapsed, endpoint=endpoint, method=request.method)
+    db_seconds.observe(stats['db_time'], endpoint=endpoint)
+    db_statements.observe(stats['statements'], endpoint=endpoint)
+    if stats['render_time']:
+        template_seconds.observe(stats['render_time'], endpoint=endpoint)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        from flask import current_app
+        lines = [f'slow request {request.method} {request.full_path.rstrip("?")} ({endpoint}): '
+                 f'{elapsed * 1000:.0f} ms, {stats["statements"]} SQL / {stats["db_time"] * 1000:.0f} ms, '
+                 f'template {stats["render_time"] * 1000:.0f} ms']
+        for seconds, statement in stats['slowest']:
+            lines.append(f'  {seconds * 1000:.1f} ms: {" ".join(statement.split())}')
+        current_app.logger.warning('\n'.join(lines))
+
+
+def init_app(app, db):
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(db.engine, 'handle_error', _handle_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.before_request(_start_request)
+    app.teardown_request(_finish_request)
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,238 @@
+"""資料庫版本管理。
+
+db.create_all() 只會建立不存在的資料表，不會修改既有的表（加欄位、加索引）。
+upgrade() 會先補上 model 新增的欄位，再用 schema_version 表記錄目前版本，
+依序執行尚未套用的 migration（索引、資料轉換），
+SQLite（instance/baseball.db）與 Postgres 都可以原地升級：
+
+    flask --app app upgrade-db
+
+每個 migration 都要能重複執行（先檢查再建立），因為全新的資料庫
+會先由 create_all() 建好最新的結構。
+"""
+import datetime
+import sqlite3
+from sqlalchemy import inspect, text
+from models import db, Game, AtBatStat, DefenseStat, PlayEvent, GameInningPitcher
+
+
+def get_version():
+    db.session.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    version = db.session.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+    return version or 0
+
+
+def set_version(version):
+    db.session.execute(text('DELETE FROM schema_version'))
+    db.session.execute(text('INSERT INTO schema_version (version) VALUES (:v)'), {'v': version})
+
+
+def create_indexes(model, *names):
+    """建立 model 上的索引（已存在的略過）；有給 names 時只建立這幾個，每個 migration 只負責自己加的索引。"""
+    conn = db.session.connection()
+    for index in model.__table__.indexes:
+        if not names or index.name in names:
+            index.create(bind=conn, checkfirst=True)
+
+
+def add_column(table, column):
+    conn = db.session.connection()
+    preparer = conn.dialect.identifier_preparer
+    ddl = '%s %s' % (preparer.quote(column.name), column.type.compile(dialect=conn.dialect))
+    if column.server_default is not None:
+        default = column.server_default.arg
+        ddl += ' DEFAULT %s' % (default.text if hasattr(default, 'text') else "'%s'" % default)
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    conn.execute(text('ALTER TABLE %s ADD COLUMN %s' % (preparer.quote(table.name), ddl)))
+
+
+def add_missing_columns():
+    """替既有的表補上 model 裡新增的欄位；新欄位必須可為 NULL 或有 server_default。"""
+    inspector = inspect(db.session.connection())
+    for table in db.metadata.sorted_tables:
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                add_column(table, column)
+
+
+def _backfill_inning_state():
+    from game_state import rebuild_inning_state
+    for game in Game.query.all():
+        rebuild_inning_state(game.id)
+
+
+def _backfill_season_stats():
+    from rollups import rebuild_rollups
+    rebuild_rollups()
+
+
+def _backfill_spray_stats():
+    from spray import rebuild
+    rebuild()
+
+
+def _backfill_scouting():
+    from scouting import rebuild
+    rebuild()
+
+
+def _workload_indexes():
+    create_indexes(Game, 'ix_game_date')
+    create_indexes(GameInningPitcher, 'ix_game_inning_pitcher_pitcher_game')
+
+
+def normalize_game_dates():
+    """把 game.date 統一成 YYYY-MM-DD（舊資料是自由輸入的字串），格式認不得就停止升級。
+
+    每次 upgrade 都會先跑，之後的 migration 才能用 Date 型別讀取 Game。
+    """
+    from season_stats import parse_date
+    conn = db.session.connection()
+    invalid = []
+    for game_id, value in conn.execute(text('SELECT id, date FROM game')).fetchall():
+        parsed = parse_date(value)
+        if parsed is None:
+            invalid.append(f'{game_id}: {value!r}')
+        elif str(value) != parsed.isoformat():
+            conn.execute(text('UPDATE game SET date = :date WHERE id = :id'),
+                         {'date': parsed.isoformat(), 'id': game_id})
+    if invalid:
+        raise ValueError('無法辨識的比賽日期，請先手動修正：' + ', '.join(invalid))
+
+
+def _has_column(table, name):
+    return name in {c['name'] for c in inspect(db.session.connection()).get_columns(table.name)}
+
+
+def backfill_result_codes():
+    """舊資料的結果存在中文字串欄位 result：換成 results.py 的代碼寫進 result_code。
+
+    每次 upgrade 都會先跑（之後的 migration 會用代碼統計）；result 欄位刪掉後就不用做事。
+    """
+    from results import CODES
+    conn = db.session.connection()
+    for model in (AtBatStat, DefenseStat):
+        table = model.__table__
+        if not _has_column(table, 'result'):
+            continue
+        for label, code in CODES.items():
+            conn.execute(text(f'UPDATE {table.name} SET result_code = :code '
+                              f'WHERE result = :label AND result_code = 0'), {'code': code, 'label': label})
+        unknown = [r for (r,) in conn.execute(text(f"SELECT DISTINCT result FROM {table.name} "
+                                                   f"WHERE result_code = 0 AND result IS NOT NULL AND result != ''"))]
+        if unknown:
+            raise ValueError(f'{table.name} 有無法對應代碼的結果，請先加進 results.py：' + ', '.join(unknown))
+
+
+def _drop_result_strings():
+    conn = db.session.connection()
+    if conn.dialect.name == 'sqlite' and sqlite3.sqlite_version_info < (3, 35):
+        return   # 舊版 SQLite 不支援 DROP COLUMN；留著不用也不影響
+    for model in (AtBatStat, DefenseStat):
+        if _has_column(model.__table__, 'result'):
+            conn.execute(text(f'ALTER TABLE {model.__table__.name} DROP COLUMN result'))
+
+
+def convert_game_date_column():
+    """Postgres 上把 game.date 從 VARCHAR 改成 DATE。
+
+    每次 upgrade 都在 normalize_game_dates() 之後、migration 之前跑：之後的 migration
+    （例如 4 的 PlayerSeasonStats）會用 EXTRACT(YEAR FROM game.date) 分賽季，字串欄位會直接出錯。
+    SQLite 的欄位型別不影響儲存（Date 本來就存成 YYYY-MM-DD 字串），不需要重建表。
+    """
+    conn = db.session.connection()
+    if conn.dialect.name != 'postgresql':
+        return
+    column = next(c for c in inspect(conn).get_columns('game') if c['name'] == 'date')
+    if column['type'].python_type is not datetime.date:
+        conn.execute(text('ALTER TABLE game ALTER COLUMN date TYPE DATE USING date::date'))
+
+
+def _game_date_column():
+    # 欄位型別已經由 convert_game_date_column() 改好，這裡只補比賽列表的索引
+    create_indexes(Game, 'ix_game_recorded_date', 'ix_game_tournament_date', 'ix_game_opponent_date')
+
+
+def _stat_indexes():
+    create_indexes(AtBatStat, 'ix_at_bat_stat_game_inning', 'ix_at_bat_stat_game_order_inning_id')
+    create_indexes(DefenseStat, 'ix_defense_stat_game_inning', 'ix_defense_stat_game_pitcher_inning')
+
+
+def _season_stat_indexes():
+    create_indexes(AtBatStat, 'ix_at_bat_stat_player_game')
+    create_indexes(DefenseStat, 'ix_defense_stat_pitcher_game')
+
+
+# (版本, 說明, 函式)，只能往後加，不要改已發佈的版本
+MIGRATIONS = [
+    (1, 'backfill GameInningState / GameInningPitcher', _backfill_inning_state),
+    (2, 'composite indexes on at_bat_stat / defense_stat', _stat_indexes),
+    (3, 'player / pitcher indexes for season stats', _season_stat_indexes),
+    (4, 'backfill PlayerSeasonStats', _backfill_season_stats),
+    (5, 'unique client id index on play_event', lambda: create_indexes(PlayEvent)),
+    (6, 'game date / pitcher workload indexes', _workload_indexes),
+    (7, 'game.date as DATE, game listing indexes', _game_date_column),
+    (8, 'drop result strings (replaced by result_code)', _drop_result_strings),
+    (9, 'rebuild PlayerSeasonStats with batting counters for advanced stats', _backfill_season_stats),
+    (10, 'backfill PlayerSprayStats', _backfill_spray_stats),
+    (11, 'backfill OpponentBatterStats', _backfill_scouting),
+]
+
+
+def upgrade():
+    # 先建立尚不存在的資料表（新表會直接帶最新的索引與欄位），再補既有表缺的欄位，
+    # 之後的 migration 才能放心用目前的 model 讀寫
+    db.create_all()
+    add_missing_columns()
+    normalize_game_dates()
+    convert_game_date_column()
+    backfill_result_codes()
+    current = get_version()
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f'migrating to {version}: {description}')
+        migrate()
+        set_version(version)
+        db.session.commit()
+    db.session.commit()
+
+
+def hot_queries(game_id=1, pitcher_id=1, inning=1, order=0):
+    # 主要頁面會用到的查詢（game_detail / export_game_excel / record_defense / undo_atbat）
+    return [
+        ('game_detail: at-bats', AtBatStat.query.filter_by(game_id=game_id).order_by(AtBatStat.id)),
+        ('game_detail: defense', DefenseStat.query.filter_by(game_id=game_id)
+            .order_by(DefenseStat.inning, DefenseStat.id)),
+        ('record_defense: inning records', DefenseStat.query.filter_by(game_id=game_id, inning=inning)
+            .order_by(DefenseStat.id)),
+        ('pitcher by game', DefenseStat.query.filter_by(game_id=game_id, pitcher_id=pitcher_id)),
+        ('undo_atbat', AtBatStat.query.filter_by(game_id=game_id, order=order, inning=inning)
+            .order_by(AtBatStat.id.desc()).limit(1)),
+    ]
+
+
+def explain(query):
+    dialect = db.session.get_bind().dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + sql)).fetchall()
+    return [str(row[-1]) for row in rows]
+
+
+def register_commands(app):
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """套用所有尚未執行的資料庫 migration。"""
+        upgrade()
+        print(f'schema version: {get_version()}')
+
+    @app.cli.command('explain-queries')
+    def explain_queries_command():
+        """印出主要頁面查詢的 query plan（升級前後各跑一次比較）。"""
+        for name, query in hot_queries():
+            print(f'== {name}')
+            for line in explain(query):
+                print(f'   {line}')
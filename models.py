@@ -1,4 +1,6 @@
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from results import code_of, label_of
 
 db = SQLAlchemy()
 
@@ -10,7 +12,7 @@ class Player(db.Model):
 
 class Game(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.Date, nullable=False)
     opponent = db.Column(db.String(100), nullable=False)
     team_score = db.Column(db.Integer, nullable=True)
     opponent_score = db.Column(db.Integer, nullable=True)
@@ -19,7 +21,37 @@ class Game(db.Model):
     is_recorded = db.Column(db.Boolean, default=False)
     tournament = db.Column(db.String)
     next_batter_order = db.Column(db.Integer, default=0)
-    
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 每次寫入比賽資料就 +1，快取用
+    __table_args__ = (
+        db.Index('ix_game_date', 'date'),   # 依日期區間查詢（投手休息天數等）
+        # 比賽列表依 (date, id) 由新到舊 keyset 分頁，常用的篩選條件放在最前面
+        db.Index('ix_game_recorded_date', 'is_recorded', 'date', 'id'),
+        db.Index('ix_game_tournament_date', 'tournament', 'date', 'id'),
+        db.Index('ix_game_opponent_date', 'opponent', 'date', 'id'),
+    )
+    # 樂觀鎖：UPDATE game 一律帶 WHERE data_version = 讀到的值，期間被其他裝置改過就丟
+    # StaleDataError（呼叫端回 409 讓前端重送），不需要鎖住整列；版本由 bump_version 遞增
+    __mapper_args__ = {'version_id_col': data_version, 'version_id_generator': False}
+
+    def bump_version(self):
+        # 用 SQL 運算式遞增，多個 worker 同時寫入也不會互相蓋掉
+        self.data_version = Game.data_version + 1
+
+    def add_runs(self, team=0, opponent=0):
+        # 比分在資料庫裡累加（team_score = team_score + n），不依賴這個 request 讀到的舊值；
+        # flush 之後屬性會過期，下次讀取時重新 SELECT
+        if team:
+            self.team_score = _plus_runs(Game.team_score, team)
+        if opponent:
+            self.opponent_score = _plus_runs(Game.opponent_score, opponent)
+
+def _plus_runs(column, runs):
+    score = db.func.coalesce(column, 0) + runs
+    if runs > 0:
+        return score
+    # 撤銷時扣分，在 SQL 裡夾在 0 以上（舊資料的比分可能比紀錄少）
+    return db.case((score < 0, 0), else_=score)
+
 class GameBattingOrder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
@@ -28,18 +60,34 @@ class GameBattingOrder(db.Model):
     player = db.relationship('Player')
     game = db.relationship('Game')
 
-class AtBatStat(db.Model):
+class ResultMixin:
+    # 結果只存代碼（見 results.py），result 屬性照舊用中文名稱讀寫
+    @property
+    def result(self):
+        return label_of(self.result_code)
+
+    @result.setter
+    def result(self, label):
+        self.result_code = code_of(label)
+
+class AtBatStat(ResultMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     game_id = db.Column(db.Integer, db.ForeignKey('game.id'))
     player_id = db.Column(db.Integer, db.ForeignKey('player.id'))
     order = db.Column(db.Integer)
-    result = db.Column(db.String(20))
+    result_code = db.Column(db.SmallInteger, nullable=False, default=0, server_default='0')
     inning = db.Column(db.Integer)
     rbis = db.Column(db.Integer, default=0)
     position = db.Column(db.String(20))
     note = db.Column(db.String(50))
+    bases = db.Column(db.SmallInteger)   # 打席開始時的壘上跑者（base_out.py），NULL 為沒記錄
+    __table_args__ = (
+        db.Index('ix_at_bat_stat_game_inning', 'game_id', 'inning'),
+        db.Index('ix_at_bat_stat_game_order_inning_id', 'game_id', 'order', 'inning', 'id'),  # undo_atbat
+        db.Index('ix_at_bat_stat_player_game', 'player_id', 'game_id'),  # 賽季/生涯數據
+    )
     
-class DefenseStat(db.Model):
+class DefenseStat(ResultMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     game_id = db.Column(db.Integer, db.ForeignKey('game.id'))
     inning = db.Column(db.Integer)
@@ -48,5 +96,160 @@ class DefenseStat(db.Model):
     strike = db.Column(db.Integer)
     ball = db.Column(db.Integer)
     pitch_count = db.Column(db.Integer)
-    result = db.Column(db.String(24))        # 打席結果
+    result_code = db.Column(db.SmallInteger, nullable=False, default=0, server_default='0')   # 打席結果
     runs = db.Column(db.Integer, default=0)  # 失分
+    bases = db.Column(db.SmallInteger)   # 打席開始時的壘上跑者（base_out.py），NULL 為沒記錄
+    __table_args__ = (
+        db.Index('ix_defense_stat_game_inning', 'game_id', 'inning'),
+        db.Index('ix_defense_stat_game_pitcher_inning', 'game_id', 'pitcher_id', 'inning'),
+        db.Index('ix_defense_stat_pitcher_game', 'pitcher_id', 'game_id'),  # 賽季/生涯數據
+    )
+
+class GameInningState(db.Model):
+    # 每個半局的即時狀態，隨每筆紀錄在同一個 transaction 內更新
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    inning = db.Column(db.Integer, nullable=False)
+    half = db.Column(db.String(1), nullable=False)  # 'A': 我方進攻(AtBatStat), 'D': 我方防守(DefenseStat)
+    outs = db.Column(db.Integer, default=0)
+    runs = db.Column(db.Integer, default=0)
+    hits = db.Column(db.Integer, default=0)
+    pitch_count = db.Column(db.Integer, default=0)
+    __table_args__ = (db.UniqueConstraint('game_id', 'inning', 'half'),)
+
+class GameInningPitcher(db.Model):
+    # 每位投手每局的用球數（防守半局）
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    inning = db.Column(db.Integer, nullable=False)
+    pitcher_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    pitch_count = db.Column(db.Integer, default=0)
+    __table_args__ = (
+        db.UniqueConstraint('game_id', 'inning', 'pitcher_id'),
+        db.Index('ix_game_inning_pitcher_pitcher_game', 'pitcher_id', 'game_id'),   # 跨場次用球量
+    )
+
+class ExportJob(db.Model):
+    # 背景匯出工作；狀態存在資料庫，任何一個 worker 都能回答查詢
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending / running / done / error
+    params = db.Column(db.Text)          # JSON：賽事、日期區間、格式
+    total = db.Column(db.Integer, default=0)
+    done = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    file_path = db.Column(db.String(255))
+    download_name = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PlayerSeasonStats(db.Model):
+    # 已完成紀錄比賽的累計數據（finish_record 時加入、刪除比賽時扣回）
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False)
+    tournament = db.Column(db.String, nullable=False, default='')
+    # 打擊
+    games = db.Column(db.Integer, default=0)
+    pa = db.Column(db.Integer, default=0)
+    ab = db.Column(db.Integer, default=0)
+    hit = db.Column(db.Integer, default=0)
+    hr = db.Column(db.Integer, default=0)
+    rbi = db.Column(db.Integer, default=0)
+    # 進階數據用的打擊計數（之後才加的欄位，需要 server_default）
+    doubles = db.Column(db.Integer, default=0, server_default='0')
+    triples = db.Column(db.Integer, default=0, server_default='0')
+    walks = db.Column(db.Integer, default=0, server_default='0')
+    hit_by_pitch = db.Column(db.Integer, default=0, server_default='0')
+    strikeouts = db.Column(db.Integer, default=0, server_default='0')
+    sac_flies = db.Column(db.Integer, default=0, server_default='0')
+    # 投球
+    pitching_games = db.Column(db.Integer, default=0)
+    innings_outs = db.Column(db.Integer, default=0)
+    batters = db.Column(db.Integer, default=0)
+    pitch_count = db.Column(db.Integer, default=0)
+    strikes = db.Column(db.Integer, default=0)
+    hits_allowed = db.Column(db.Integer, default=0)
+    hr_allowed = db.Column(db.Integer, default=0)
+    bb = db.Column(db.Integer, default=0)
+    hbp = db.Column(db.Integer, default=0)
+    k = db.Column(db.Integer, default=0)
+    runs_allowed = db.Column(db.Integer, default=0)
+    __table_args__ = (db.UniqueConstraint('player_id', 'season', 'tournament'),)
+
+class PlayerSprayStats(db.Model):
+    # 已完成紀錄比賽的擊球落點累計（每位打者每個守備區一列，時機同 PlayerSeasonStats）
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False)
+    tournament = db.Column(db.String, nullable=False, default='')
+    zone = db.Column(db.String(2), nullable=False)   # spray.ZONES 的代號：P、C、1B……RF
+    hits = db.Column(db.Integer, default=0)
+    outs = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Integer, default=0)
+    __table_args__ = (db.UniqueConstraint('player_id', 'season', 'tournament', 'zone'),)
+
+class OpponentBatterStats(db.Model):
+    # 對手打者面對我方每位投手的累計（已完成紀錄的比賽，finish_record 時加入、刪除比賽時扣回）
+    id = db.Column(db.Integer, primary_key=True)
+    opponent = db.Column(db.String(100), nullable=False)
+    batter_name = db.Column(db.String(32), nullable=False)
+    pitcher_id = db.Column(db.Integer, nullable=False, default=0)   # 沒記投手的打席為 0
+    pa = db.Column(db.Integer, default=0)
+    ab = db.Column(db.Integer, default=0)
+    hits = db.Column(db.Integer, default=0)
+    hr = db.Column(db.Integer, default=0)
+    bb = db.Column(db.Integer, default=0)
+    hbp = db.Column(db.Integer, default=0)
+    k = db.Column(db.Integer, default=0)
+    outs = db.Column(db.Integer, default=0)
+    pitches = db.Column(db.Integer, default=0)
+    strikes = db.Column(db.Integer, default=0)
+    balls = db.Column(db.Integer, default=0)
+    runs = db.Column(db.Integer, default=0)
+    # 情蒐頁只查單一對手，(opponent, batter_name) 在最前面
+    __table_args__ = (db.UniqueConstraint('opponent', 'batter_name', 'pitcher_id'),)
+
+class BaseOutStats(db.Model):
+    # 得分期望值矩陣的累計：每個賽季每個壘包／出局狀態出現幾次、之後到半局結束共得幾分
+    id = db.Column(db.Integer, primary_key=True)
+    season = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.Integer, nullable=False)   # 出局數 × 8 + 壘包
+    occurrences = db.Column(db.Integer, default=0)
+    runs = db.Column(db.Integer, default=0)
+    __table_args__ = (db.UniqueConstraint('season', 'state'),)
+
+class PlayerBaseOutStats(db.Model):
+    # 我方打者在各狀態開始／結束的打席數與打席得分，RE24 = 得分 + Σ(結束 − 開始) × RE[狀態]
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    season = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.Integer, nullable=False)
+    starts = db.Column(db.Integer, default=0)
+    ends = db.Column(db.Integer, default=0)
+    runs = db.Column(db.Integer, default=0)   # 在這個狀態開始的打席得分
+    __table_args__ = (db.UniqueConstraint('player_id', 'season', 'state'),)
+
+class PlayEvent(db.Model):
+    # 每場比賽依序記錄的操作（打席、防守、換人、換投）；undo 只刪最後一筆
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)     # 同一場比賽內從 1 開始遞增
+    kind = db.Column(db.String(16), nullable=False)  # atbat / defense / switch_player / switch_pitcher
+    inning = db.Column(db.Integer)
+    atbat_id = db.Column(db.Integer)                 # 這筆操作新增的 AtBatStat（含防守失誤的標記列）
+    defense_id = db.Column(db.Integer)               # 這筆操作新增的 DefenseStat
+    before = db.Column(db.Text, nullable=False)      # JSON：操作前的比賽狀態，undo 直接還原
+    after = db.Column(db.Text, nullable=False)       # JSON：操作後的比賽狀態，重播用
+    client_id = db.Column(db.String(64))             # 批次上傳時用戶端產生的 id，重送時用來略過
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.UniqueConstraint('game_id', 'seq'),
+        db.Index('ix_play_event_game_client', 'game_id', 'client_id', unique=True),
+    )
+
+class GameSnapshot(db.Model):
+    # 每 SNAPSHOT_EVERY 筆 PlayEvent 存一份完整狀態，重播時只需從最近的快照往後套用
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.Text, nullable=False)
+    __table_args__ = (db.UniqueConstraint('game_id', 'seq'),)
@@ -0,0 +1,118 @@
+"""比賽操作紀錄（PlayEvent）與快照（GameSnapshot）。
+
+每個寫入比賽狀態的操作都新增一筆 PlayEvent，記下操作前後的狀態
+（比分、下一棒、目前投手、被換掉的棒次），以及它新增的 AtBatStat / DefenseStat。
+
+- undo：刪掉最後一筆事件、還原 before、扣回它新增的紀錄，查詢數固定，不必重掃整場。
+- 重播：每 SNAPSHOT_EVERY 筆存一份完整快照，任一時間點的狀態
+  = 該點之前最近的快照 + 之後的事件。
+"""
+import json
+from models import db, AtBatStat, DefenseStat, GameBattingOrder, PlayEvent, GameSnapshot
+from game_state import apply_atbat, apply_defense
+
+SNAPSHOT_EVERY = 20
+GAME_FIELDS = ('team_score', 'opponent_score', 'next_batter_order', 'current_pitcher_id')
+
+
+def capture(game, lineup=None):
+    """目前的比賽狀態；lineup 為這次會變動的棒次 {order: player_id}。"""
+    state = {field: getattr(game, field) for field in GAME_FIELDS}
+    if lineup:
+        state['lineup'] = {str(order): player_id for order, player_id in lineup.items()}
+    return state
+
+
+def merge(state, delta):
+    for key, value in delta.items():
+        if key == 'lineup':
+            state.setdefault('lineup', {}).update(value)
+        else:
+            state[key] = value
+    return state
+
+
+def _snapshot(game, seq, overrides=None):
+    state = capture(game)
+    state['lineup'] = {str(o.order): o.player_id
+                       for o in GameBattingOrder.query.filter_by(game_id=game.id)}
+    if overrides:
+        merge(state, overrides)
+    db.session.add(GameSnapshot(game_id=game.id, seq=seq, state=json.dumps(state)))
+
+
+def last_event(game_id):
+    return (PlayEvent.query.filter_by(game_id=game_id)
+            .order_by(PlayEvent.seq.desc()).first())
+
+
+def build_event(game, seq, kind, before, inning=None, lineup=None, client_id=None):
+    """建立第 seq 筆事件（尚未加入 session），需要時順便存快照。"""
+    if seq == 1:
+        # 第一筆事件之前的狀態當作快照 0
+        _snapshot(game, 0, before)
+    event = PlayEvent(game_id=game.id, seq=seq, kind=kind, inning=inning, client_id=client_id,
+                      before=json.dumps(before), after=json.dumps(capture(game, lineup)))
+    if seq % SNAPSHOT_EVERY == 0:
+        _snapshot(game, seq)
+    return event
+
+
+def record_event(game, kind, before, inning=None, atbat=None, defense=None, lineup=None):
+    """在修改完 Game 與新增紀錄之後、commit 之前呼叫；before 是修改前 capture() 的結果。"""
+    db.session.flush()
+    last = last_event(game.id)
+    event = build_event(game, last.seq + 1 if last else 1, kind, before, inning=inning, lineup=lineup)
+    event.atbat_id = atbat.id if atbat else None
+    event.defense_id = defense.id if defense else None
+    db.session.add(event)
+    return event
+
+
+def undo_last(game):
+    """撤銷最後一筆事件並回傳它；沒有事件時回傳 None。需由呼叫端 commit。"""
+    event = last_event(game.id)
+    if event is None:
+        return None
+    before = json.loads(event.before)
+    for field in GAME_FIELDS:
+        if field in before:
+            setattr(game, field, before[field])
+    for order, player_id in before.get('lineup', {}).items():
+        GameBattingOrder.query.filter_by(game_id=game.id, order=int(order)).update({'player_id': player_id})
+    if event.atbat_id:
+        atbat = db.session.get(AtBatStat, event.atbat_id)
+        if atbat:
+            if event.kind == 'atbat':
+                apply_atbat(atbat, sign=-1)
+            db.session.delete(atbat)
+    if event.defense_id:
+        defense = db.session.get(DefenseStat, event.defense_id)
+        if defense:
+            apply_defense(defense, sign=-1)
+            db.session.delete(defense)
+    GameSnapshot.query.filter_by(game_id=game.id, seq=event.seq).delete()
+    db.session.delete(event)
+    return event
+
+
+def replay_state(game_id, seq=None):
+    """由最近的快照加上之後的事件重建第 seq 筆事件後的狀態（預設為最新）。"""
+    snapshots = GameSnapshot.query.filter_by(game_id=game_id)
+    if seq is not None:
+        snapshots = snapshots.filter(GameSnapshot.seq <= seq)
+    snapshot = snapshots.order_by(GameSnapshot.seq.desc()).first()
+    if snapshot is None:
+        return None
+    state = json.loads(snapshot.state)
+    events = PlayEvent.query.filter(PlayEvent.game_id == game_id, PlayEvent.seq > snapshot.seq)
+    if seq is not None:
+        events = events.filter(PlayEvent.seq <= seq)
+    for event in events.order_by(PlayEvent.seq):
+        merge(state, json.loads(event.after))
+    return state
+
+
+def delete_play_log(game_id):
+    PlayEvent.query.filter_by(game_id=game_id).delete()
+    GameSnapshot.query.filter_by(game_id=game_id).delete()
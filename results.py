@@ -0,0 +1,89 @@
+"""打席結果代碼表。
+
+AtBatStat / DefenseStat 只存一個小整數 result_code，名稱與分類（安打、壘打數、
+出局數、是否算打數……）都由這裡的 RESULTS 決定，單場統計、賽季 SQL、半局狀態與
+批次上傳都查同一張表。代碼一旦發佈就不能改也不能重複使用，新結果只能往後加。
+"""
+from collections import namedtuple
+
+Result = namedtuple('Result', 'code label bases outs is_pa is_ab is_bb is_hbp is_k is_sf is_error is_hit is_hr')
+
+
+def _result(code, label, bases=0, outs=0, pa=True, ab=True, bb=False, hbp=False, k=False, sf=False, error=False):
+    return Result(code, label, bases, outs, pa, pa and ab, bb, hbp, k, sf, error, bases > 0, bases == 4)
+
+
+UNKNOWN = _result(0, None, pa=False)
+
+RESULTS = [
+    _result(1, '三振', outs=1, k=True),
+    _result(2, '不死三振'),
+    _result(3, '四壞', ab=False, bb=True),
+    _result(4, '觸身', ab=False, hbp=True),
+    _result(5, '內安', bases=1),
+    _result(6, '一安', bases=1),
+    _result(7, '二安', bases=2),
+    _result(8, '三安', bases=3),
+    _result(9, '全壘', bases=4),
+    _result(10, '失誤', error=True),
+    _result(11, '雙殺', outs=2),
+    _result(12, '犧牲', outs=1, ab=False),
+    _result(13, '犧飛', outs=1, ab=False, sf=True),
+    _result(14, '界飛', outs=1),
+    _result(15, '外飛', outs=1),
+    _result(16, '內滾', outs=1),
+    _result(17, '內飛', outs=1),
+    # 以下不是打者本身的打席
+    _result(18, 'RUNNER_OUT', outs=1, pa=False),
+    _result(19, '對手失誤', pa=False, error=True),
+    _result(20, '暴投', pa=False),
+    _result(21, '防守失誤', pa=False, error=True),
+]
+
+# 依代碼索引的分類表：BY_CODE[code]，code 0 為沒有結果的舊資料
+BY_CODE = [UNKNOWN] * (max(r.code for r in RESULTS) + 1)
+for _r in RESULTS:
+    BY_CODE[_r.code] = _r
+CODES = {r.label: r.code for r in RESULTS}
+
+# 記錄頁的下拉選單（按鈕另外送出 對手失誤／暴投／自己失誤）
+BATTING_CHOICES = [r.label for r in RESULTS[:18]]
+ATBAT_RESULTS = BATTING_CHOICES + ['對手失誤', '暴投']
+DEFENSE_RESULTS = BATTING_CHOICES + ['自己失誤', '暴投']
+# 記錄頁即時計算出局數用
+OUT_COUNTS = {r.label: r.outs for r in RESULTS if r.outs}
+# 得分記在 note 裡的結果
+NOTE_RUNS_CODES = frozenset([CODES['對手失誤'], CODES['暴投']])
+# 用按鈕記錄、不列在防守打席紀錄裡的結果
+BUTTON_CODES = frozenset([CODES['對手失誤'], CODES['暴投'], CODES['防守失誤']])
+
+
+def codes(flag):
+    """某個分類為真的代碼，給 SQL 的 IN (...) 用。"""
+    return [r.code for r in RESULTS if getattr(r, flag)]
+
+
+def code_of(label):
+    if label is None:
+        return 0
+    try:
+        return CODES[label]
+    except KeyError:
+        raise ValueError(f'不明的結果：{label}')
+
+
+def label_of(code):
+    return BY_CODE[code or 0].label
+
+
+def classify(code):
+    return BY_CODE[code or 0]
+
+
+def kind_of(label):
+    # 不在表裡的名稱（例如表單的 '自己失誤'）當作沒有分類
+    return classify(CODES.get(label))
+
+
+def count_outs(label):
+    return kind_of(label).outs
@@ -0,0 +1,153 @@
+"""球員賽季累計數據（PlayerSeasonStats）。
+
+比賽 finish_record 之後數據就不再變動，這時把該場每位球員的打擊／投球數據
+加進 (球員, 賽季, 賽事) 的累計列；刪除已完成的比賽時再扣回。
+排行榜與球員列表直接讀累計列，不用每次從 AtBatStat / DefenseStat 重算。
+"""
+from sqlalchemy import func
+from models import db, Game, AtBatStat, DefenseStat, PlayerSeasonStats
+from season_stats import batting_lines, pitching_lines, GAME_SEASON
+from summary import format_ip
+from advanced_stats import add_batting_rates, add_pitching_rates
+import base_out
+import scouting
+import spray
+
+# batting_lines / pitching_lines 的欄位 -> PlayerSeasonStats 欄位
+BATTING_FIELDS = {'games': 'games', 'pa': 'pa', 'ab': 'ab', 'hit': 'hit', 'hr': 'hr', 'rbi': 'rbi',
+                  'double': 'doubles', 'triple': 'triples', 'bb': 'walks', 'hbp': 'hit_by_pitch',
+                  'k': 'strikeouts', 'sf': 'sac_flies'}
+PITCHING_FIELDS = {'games': 'pitching_games', 'innings_outs': 'innings_outs', 'batters': 'batters',
+                   'pitch_count': 'pitch_count', 'strikes': 'strikes', 'hits': 'hits_allowed',
+                   'hr': 'hr_allowed', 'bb': 'bb', 'hbp': 'hbp', 'k': 'k', 'run': 'runs_allowed'}
+
+
+def season_of(date):
+    # Game.date（或 GAME_SEASON 算出的年份）取年份當賽季；格式不對就歸在 0
+    try:
+        return int(str(date)[:4])
+    except (TypeError, ValueError):
+        return 0
+
+
+def _add(rows, key, fields, line, sign):
+    row = rows.get(key)
+    if row is None:
+        player_id, season, tournament = key
+        row = PlayerSeasonStats(player_id=player_id, season=season, tournament=tournament,
+                                **{column: 0 for column in list(BATTING_FIELDS.values()) + list(PITCHING_FIELDS.values())})
+        db.session.add(row)
+        rows[key] = row
+    for name, column in fields.items():
+        setattr(row, column, getattr(row, column) + sign * line[name])
+
+
+def apply_game(game, sign=1):
+    """把一場比賽加進（sign=-1 時扣掉）累計數據，需由呼叫端 commit。"""
+    spray.apply_game(game, sign)
+    scouting.apply_game(game, sign)
+    base_out.apply_game(game, sign)
+    season, tournament = season_of(game.date), game.tournament or ''
+    batting = batting_lines((AtBatStat.player_id,), game_id=game.id)
+    pitching = pitching_lines((DefenseStat.pitcher_id,), game_id=game.id)
+    player_ids = {b['player_id'] for b in batting} | {p['pitcher_id'] for p in pitching}
+    if not player_ids:
+        return
+    rows = {(r.player_id, r.season, r.tournament): r
+            for r in PlayerSeasonStats.query.filter(PlayerSeasonStats.player_id.in_(player_ids),
+                                                    PlayerSeasonStats.season == season,
+                                                    PlayerSeasonStats.tournament == tournament)}
+    for line in batting:
+        _add(rows, (line['player_id'], season, tournament), BATTING_FIELDS, line, sign)
+    for line in pitching:
+        _add(rows, (line['pitcher_id'], season, tournament), PITCHING_FIELDS, line, sign)
+    if sign < 0:
+        for row in rows.values():
+            if not row.games and not row.pitching_games:
+                db.session.delete(row)
+
+
+def rebuild_rollups():
+    """由所有已完成紀錄的比賽重新計算累計數據，需由呼叫端 commit。"""
+    PlayerSeasonStats.query.delete()
+    spray.rebuild()
+    scouting.rebuild()
+    base_out.rebuild()
+    rows = {}
+    season = GAME_SEASON.label('season')
+    for line in batting_lines((AtBatStat.player_id, season, Game.tournament), recorded=True):
+        _add(rows, (line['player_id'], season_of(line['season']), line['tournament'] or ''),
+             BATTING_FIELDS, line, 1)
+    for line in pitching_lines((DefenseStat.pitcher_id, season, Game.tournament), recorded=True):
+        _add(rows, (line['pitcher_id'], season_of(line['season']), line['tournament'] or ''),
+             PITCHING_FIELDS, line, 1)
+
+
+def _sum(column):
+    return func.coalesce(func.sum(column), 0)
+
+
+def _filter(query, player_id=None, season=None, tournament=None):
+    if isinstance(player_id, (list, tuple)):
+        query = query.filter(PlayerSeasonStats.player_id.in_(player_id))
+    elif player_id is not None:
+        query = query.filter(PlayerSeasonStats.player_id == player_id)
+    if season:
+        query = query.filter(PlayerSeasonStats.season == int(season))
+    if tournament:
+        query = query.filter(PlayerSeasonStats.tournament == tournament)
+    return query
+
+
+def rollup_batting_lines(group_by=(), **filters):
+    """跟 batting_lines 同樣格式，但從累計列加總。"""
+    query = db.session.query(*group_by, *[_sum(getattr(PlayerSeasonStats, column)).label(name)
+                                          for name, column in BATTING_FIELDS.items()])
+    query = _filter(query, **filters).filter(PlayerSeasonStats.games > 0)
+    if group_by:
+        query = query.group_by(*group_by)
+    return [add_batting_rates(row._asdict()) for row in query.all()]
+
+
+def rollup_pitching_lines(group_by=(), **filters):
+    """跟 pitching_lines 同樣格式，但從累計列加總。"""
+    query = db.session.query(*group_by, *[_sum(getattr(PlayerSeasonStats, column)).label(name)
+                                          for name, column in PITCHING_FIELDS.items()])
+    query = _filter(query, **filters).filter(PlayerSeasonStats.pitching_games > 0)
+    if group_by:
+        query = query.group_by(*group_by)
+    lines = []
+    for row in query.all():
+        line = row._asdict()
+        line['ip'] = format_ip(line['innings_outs'])
+        lines.append(add_pitching_rates(line))
+    return lines
+
+
+def seasons():
+    return [s for (s,) in db.session.query(PlayerSeasonStats.season).distinct()
+            .order_by(PlayerSeasonStats.season.desc())]
+
+
+# 頁面用的分組：有日期區間時累計列切不出來，只能回頭查原始紀錄（仍只算已完成的比賽）
+_RAW_GROUPS = {'batting': {'player': (AtBatStat.player_id,), 'tournament': (Game.tournament,)},
+               'pitching': {'player': (DefenseStat.pitcher_id,), 'tournament': (Game.tournament,)}}
+_ROLLUP_GROUPS = {'batting': {'player': (PlayerSeasonStats.player_id,),
+                              'tournament': (PlayerSeasonStats.tournament,)},
+                  'pitching': {'player': (PlayerSeasonStats.player_id.label('pitcher_id'),),
+                               'tournament': (PlayerSeasonStats.tournament,)}}
+
+
+def batting_stats(group=None, player_id=None, start=None, end=None, **filters):
+    """group：None（合計）、'player' 或 'tournament'。"""
+    if start or end:
+        return batting_lines(_RAW_GROUPS['batting'].get(group, ()), player_id=player_id,
+                             start=start, end=end, recorded=True, **filters)
+    return rollup_batting_lines(_ROLLUP_GROUPS['batting'].get(group, ()), player_id=player_id, **filters)
+
+
+def pitching_stats(group=None, player_id=None, start=None, end=None, **filters):
+    if start or end:
+        return pitching_lines(_RAW_GROUPS['pitching'].get(group, ()), player_id=player_id,
+                              start=start, end=end, recorded=True, **filters)
+    return rollup_pitching_lines(_ROLLUP_GROUPS['pitching'].get(group, ()), player_id=player_id, **filters)
@@ -0,0 +1,120 @@
+"""對手情蒐：依 DefenseStat.batter_name 統計對手打者的歷次對戰。
+
+已完成紀錄的比賽在 finish_record 時把該場每位打者（對我方每位投手）的數據加進
+OpponentBatterStats，刪除比賽時扣回；情蒐頁只用 opponent 查累計列
+（(opponent, batter_name, pitcher_id) 唯一索引），不論累積幾年的比賽都只讀這個對手的幾十列。
+"""
+from sqlalchemy import case, func
+from models import db, Game, DefenseStat, OpponentBatterStats
+from results import RESULTS, codes
+from season_stats import filter_games
+
+COUNTS = ('pa', 'ab', 'hits', 'hr', 'bb', 'hbp', 'k', 'outs', 'pitches', 'strikes', 'balls', 'runs')
+OUT_CODES = [r.code for r in RESULTS if r.is_pa and r.outs]
+
+
+def _count(codes_):
+    return func.coalesce(func.sum(case((DefenseStat.result_code.in_(codes_), 1), else_=0)), 0)
+
+
+def _sum(column):
+    return func.coalesce(func.sum(column), 0)
+
+
+def batter_lines(group_by=(), **filters):
+    """由原始紀錄加總對手打者的數據：[{group_by..., batter_name, pitcher_id, pa, ab, ...}]。"""
+    query = (db.session.query(
+                *group_by,
+                DefenseStat.batter_name,
+                func.coalesce(DefenseStat.pitcher_id, 0).label('pitcher_id'),
+                func.count(DefenseStat.id).label('pa'),
+                _count(codes('is_ab')).label('ab'),
+                _count(codes('is_hit')).label('hits'),
+                _count(codes('is_hr')).label('hr'),
+                _count(codes('is_bb')).label('bb'),
+                _count(codes('is_hbp')).label('hbp'),
+                _count(codes('is_k')).label('k'),
+                _count(OUT_CODES).label('outs'),
+                _sum(DefenseStat.pitch_count).label('pitches'),
+                _sum(DefenseStat.strike).label('strikes'),
+                _sum(DefenseStat.ball).label('balls'),
+                _sum(DefenseStat.runs).label('runs'))
+             .join(Game, Game.id == DefenseStat.game_id)
+             .filter(DefenseStat.batter_name.isnot(None), DefenseStat.batter_name != '',
+                     DefenseStat.result_code.in_(codes('is_pa'))))
+    query = filter_games(query, **filters)
+    return [row._asdict() for row in
+            query.group_by(*group_by, DefenseStat.batter_name, func.coalesce(DefenseStat.pitcher_id, 0))]
+
+
+def _add(rows, key, line, sign):
+    row = rows.get(key)
+    if row is None:
+        opponent, batter_name, pitcher_id = key
+        row = OpponentBatterStats(opponent=opponent, batter_name=batter_name, pitcher_id=pitcher_id,
+                                  **{name: 0 for name in COUNTS})
+        db.session.add(row)
+        rows[key] = row
+    for name in COUNTS:
+        setattr(row, name, getattr(row, name) + sign * line[name])
+
+
+def apply_game(game, sign=1):
+    """把一場比賽加進（sign=-1 時扣掉）對手打者累計，需由呼叫端 commit。"""
+    lines = batter_lines(game_id=game.id)
+    if not lines or not game.opponent:
+        return
+    rows = {(r.opponent, r.batter_name, r.pitcher_id): r
+            for r in OpponentBatterStats.query.filter(
+                OpponentBatterStats.opponent == game.opponent,
+                OpponentBatterStats.batter_name.in_({line['batter_name'] for line in lines}))}
+    for line in lines:
+        _add(rows, (game.opponent, line['batter_name'], line['pitcher_id']), line, sign)
+    if sign < 0:
+        for row in rows.values():
+            if not row.pa:
+                db.session.delete(row)
+
+
+def rebuild():
+    """由所有已完成紀錄的比賽重新計算對手打者累計，需由呼叫端 commit。"""
+    OpponentBatterStats.query.delete()
+    rows = {}
+    for line in batter_lines((Game.opponent,), recorded=True):
+        if line['opponent']:
+            _add(rows, (line['opponent'], line['batter_name'], line['pitcher_id']), line, 1)
+
+
+def _rates(line):
+    pa, ab = line['pa'], line['ab']
+    line['avg'] = '%.3f' % (line['hits'] / ab) if ab else '-'
+    line['k_pct'] = '%.1f%%' % (100 * line['k'] / pa) if pa else '-'
+    line['bb_pct'] = '%.1f%%' % (100 * line['bb'] / pa) if pa else '-'
+    line['pitches_per_pa'] = '%.1f' % (line['pitches'] / pa) if pa else '-'
+    return line
+
+
+def scouting_report(opponent):
+    """某個對手所有打者的合計與對我方各投手的分項，依打席數由多到少。
+
+    [{batter_name, pa, ab, hits, ..., avg, k_pct, bb_pct, pitches_per_pa, vs: [{pitcher_id, ...}]}]
+    """
+    batters = {}
+    for row in (OpponentBatterStats.query.filter_by(opponent=opponent)
+                .order_by(OpponentBatterStats.batter_name, OpponentBatterStats.pitcher_id)):
+        line = {name: getattr(row, name) for name in COUNTS}
+        total = batters.setdefault(row.batter_name, dict({name: 0 for name in COUNTS},
+                                                         batter_name=row.batter_name, vs=[]))
+        for name in COUNTS:
+            total[name] += line[name]
+        total['vs'].append(_rates(dict(line, pitcher_id=row.pitcher_id or None)))
+    report = [_rates(line) for line in batters.values()]
+    report.sort(key=lambda line: (-line['pa'], line['batter_name']))
+    for line in report:
+        line['vs'].sort(key=lambda vs: -vs['pa'])
+    return report
+
+
+def scouted_opponents():
+    return [o for (o,) in db.session.query(OpponentBatterStats.opponent).distinct()
+            .order_by(OpponentBatterStats.opponent)]
@@ -0,0 +1,123 @@
+"""跨場次（賽季、生涯）的打擊與投手數據。
+
+全部用 GROUP BY 在資料庫裡加總，不把每一筆 AtBatStat / DefenseStat 讀進 Python；
+計算規則與單場的 get_stats_table / calculate_pitcher_stats 相同。
+"""
+from datetime import date, datetime
+from sqlalchemy import case, func
+from models import db, Game, AtBatStat, DefenseStat
+from summary import format_ip
+from results import codes, RESULTS, CODES
+from advanced_stats import add_batting_rates, add_pitching_rates
+
+
+def _count(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _sum(column):
+    return func.coalesce(func.sum(column), 0)
+
+
+# 賽季＝比賽日期的年份
+GAME_SEASON = func.extract('year', Game.date)
+# 舊資料與表單可能出現的日期寫法
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y%m%d')
+
+
+def parse_date(value):
+    """'YYYY-MM-DD'（或 DATE_FORMATS 其中一種）轉成 date；空白或格式不對回傳 None。"""
+    if value is None or isinstance(value, date):
+        return value
+    value = str(value).strip()[:10]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def filter_games(query, start=None, end=None, tournament=None, season=None, recorded=None, game_id=None,
+                 opponent=None):
+    # start / end 可以是 date 或網址參數的字串，格式不對的就不篩選
+    if game_id is not None:
+        query = query.filter(Game.id == game_id)
+    if recorded is not None:
+        query = query.filter(Game.is_recorded == recorded)
+    if season:
+        query = query.filter(GAME_SEASON == int(season))
+    start, end = parse_date(start), parse_date(end)
+    if start:
+        query = query.filter(Game.date >= start)
+    if end:
+        query = query.filter(Game.date <= end)
+    if tournament:
+        query = query.filter(Game.tournament == tournament)
+    if opponent:
+        query = query.filter(Game.opponent == opponent)
+    return query
+
+
+def batting_lines(group_by=(), player_id=None, **filters):
+    query = (db.session.query(
+                *group_by,
+                func.count(func.distinct(AtBatStat.game_id)).label('games'),
+                func.count(AtBatStat.id).label('pa'),
+                _count(AtBatStat.result_code.in_(codes('is_ab'))).label('ab'),
+                _count(AtBatStat.result_code.in_(codes('is_hit'))).label('hit'),
+                _count(AtBatStat.result_code.in_(codes('is_hr'))).label('hr'),
+                _sum(AtBatStat.rbis).label('rbi'),
+                _count(AtBatStat.result_code == CODES['二安']).label('double'),
+                _count(AtBatStat.result_code == CODES['三安']).label('triple'),
+                _count(AtBatStat.result_code.in_(codes('is_bb'))).label('bb'),
+                _count(AtBatStat.result_code.in_(codes('is_hbp'))).label('hbp'),
+                _count(AtBatStat.result_code.in_(codes('is_k'))).label('k'),
+                _count(AtBatStat.result_code.in_(codes('is_sf'))).label('sf'))
+             .join(Game, Game.id == AtBatStat.game_id)
+             .filter(AtBatStat.player_id.isnot(None),
+                     AtBatStat.result_code.in_(codes('is_pa'))))
+    if player_id is not None:
+        query = query.filter(AtBatStat.player_id == player_id)
+    query = filter_games(query, **filters)
+    if group_by:
+        query = query.group_by(*group_by)
+    return [add_batting_rates(row._asdict()) for row in query.all()]
+
+
+def pitching_lines(group_by=(), player_id=None, **filters):
+    outs = case({r.code: r.outs for r in RESULTS if r.outs}, value=DefenseStat.result_code, else_=0)
+    query = (db.session.query(
+                *group_by,
+                func.count(func.distinct(DefenseStat.game_id)).label('games'),
+                _sum(outs).label('innings_outs'),
+                _count(DefenseStat.result_code.in_(codes('is_pa'))).label('batters'),
+                _sum(DefenseStat.pitch_count).label('pitch_count'),
+                _sum(DefenseStat.strike).label('strikes'),
+                _count(DefenseStat.result_code.in_(codes('is_hit'))).label('hits'),
+                _count(DefenseStat.result_code.in_(codes('is_hr'))).label('hr'),
+                _count(DefenseStat.result_code.in_(codes('is_bb'))).label('bb'),
+                _count(DefenseStat.result_code.in_(codes('is_hbp'))).label('hbp'),
+                _count(DefenseStat.result_code.in_(codes('is_k'))).label('k'),
+                _sum(DefenseStat.runs).label('run'))
+             .join(Game, Game.id == DefenseStat.game_id)
+             .filter(DefenseStat.pitcher_id.isnot(None)))
+    if player_id is not None:
+        query = query.filter(DefenseStat.pitcher_id == player_id)
+    query = filter_games(query, **filters)
+    if group_by:
+        query = query.group_by(*group_by)
+    lines = []
+    for row in query.all():
+        line = row._asdict()
+        line['ip'] = format_ip(line['innings_outs'])
+        lines.append(add_pitching_rates(line))
+    return lines
+
+
+def tournaments():
+    return [t for (t,) in db.session.query(Game.tournament).distinct().order_by(Game.tournament) if t]
+
+
+def opponents():
+    return [o for (o,) in db.session.query(Game.opponent).distinct().order_by(Game.opponent) if o]
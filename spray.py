@@ -0,0 +1,156 @@
+"""擊球落點（AtBatStat.position）統計與噴射圖。
+
+position 是紀錄時輸入的守備位置（'LF'、'游擊'、'7'……），先對應到 ZONES 的九個守備區。
+已完成紀錄的比賽在 finish_record 時把該場每位打者各區的安打／出局／失誤數加進
+PlayerSprayStats（跟 PlayerSeasonStats 同樣的時機，刪除比賽時扣回）。進行中的比賽不進累計，
+頁面讀累計列時再加上未完成紀錄比賽的原始紀錄（同時進行的只有一兩場，GROUP BY 很便宜），
+所以比賽中的落點馬上看得到，撤銷打席也不必回頭改累計；
+有日期區間或對手條件時累計列切不出來，才整個回頭用 GROUP BY 查原始紀錄。
+"""
+import math
+from sqlalchemy import case, func
+from models import db, Game, AtBatStat, PlayerSprayStats
+from results import RESULTS, codes
+from season_stats import filter_games, GAME_SEASON
+
+# (代號, 名稱, 其他寫法, 圖上的 x, y)；座標以本壘 (150, 285) 為原點、viewBox 300×300
+ZONES = [
+    ('P', '投手', ('1', '投', '投手'), 150, 232),
+    ('C', '捕手', ('2', '捕', '捕手'), 150, 272),
+    ('1B', '一壘', ('3', '一', '一壘'), 205, 222),
+    ('2B', '二壘', ('4', '二', '二壘'), 178, 186),
+    ('3B', '三壘', ('5', '三', '三壘'), 95, 222),
+    ('SS', '游擊', ('6', '游', '游擊'), 122, 186),
+    ('LF', '左外野', ('7', '左', '左外', '左外野'), 72, 128),
+    ('CF', '中外野', ('8', '中', '中外', '中外野'), 150, 100),
+    ('RF', '右外野', ('9', '右', '右外', '右外野'), 228, 128),
+]
+_ALIASES = {alias.upper(): code for code, _, aliases, _, _ in ZONES for alias in (code,) + aliases}
+
+# 有落點的打席：安打、失誤，以及三振以外的出局
+COUNTS = ('hits', 'outs', 'errors')
+HIT_CODES = codes('is_hit')
+OUT_CODES = [r.code for r in RESULTS if r.is_pa and r.outs and not r.is_k]
+ERROR_CODES = [r.code for r in RESULTS if r.is_pa and r.is_error]
+MAX_RADIUS = 26
+
+
+def zone_of(position):
+    """position 文字 -> 守備區代號；空白或認不得回傳 None。"""
+    return _ALIASES.get((position or '').strip().upper())
+
+
+def _count(codes_):
+    return func.coalesce(func.sum(case((AtBatStat.result_code.in_(codes_), 1), else_=0)), 0)
+
+
+def raw_lines(group_by=(), player_id=None, **filters):
+    """由原始紀錄加總：[{group_by..., zone, hits, outs, errors}]，同一區的不同寫法會合併。"""
+    query = (db.session.query(*group_by, AtBatStat.position,
+                              _count(HIT_CODES).label('hits'),
+                              _count(OUT_CODES).label('outs'),
+                              _count(ERROR_CODES).label('errors'))
+             .join(Game, Game.id == AtBatStat.game_id)
+             .filter(AtBatStat.player_id.isnot(None),
+                     AtBatStat.position.isnot(None), AtBatStat.position != '',
+                     AtBatStat.result_code.in_(HIT_CODES + OUT_CODES + ERROR_CODES)))
+    if isinstance(player_id, (list, tuple)):
+        query = query.filter(AtBatStat.player_id.in_(player_id))
+    elif player_id is not None:
+        query = query.filter(AtBatStat.player_id == player_id)
+    query = filter_games(query, **filters).group_by(*group_by, AtBatStat.position)
+    merged = {}
+    for row in query.all():
+        row = row._asdict()
+        zone = zone_of(row.pop('position'))
+        if zone is None:
+            continue
+        key = tuple(v for k, v in row.items() if k not in COUNTS) + (zone,)
+        line = merged.setdefault(key, dict(row, zone=zone, hits=0, outs=0, errors=0))
+        for name in COUNTS:
+            line[name] += row[name]
+    return list(merged.values())
+
+
+def _add(rows, key, line, sign):
+    row = rows.get(key)
+    if row is None:
+        player_id, season, tournament, zone = key
+        row = PlayerSprayStats(player_id=player_id, season=season, tournament=tournament, zone=zone,
+                               hits=0, outs=0, errors=0)
+        db.session.add(row)
+        rows[key] = row
+    for name in COUNTS:
+        setattr(row, name, getattr(row, name) + sign * line[name])
+
+
+def apply_game(game, sign=1):
+    """把一場比賽的落點加進（sign=-1 時扣掉）累計，只讀這一場的紀錄；需由呼叫端 commit。"""
+    season, tournament = game.date.year, game.tournament or ''
+    lines = raw_lines((AtBatStat.player_id,), game_id=game.id)
+    if not lines:
+        return
+    rows = {(r.player_id, r.season, r.tournament, r.zone): r
+            for r in PlayerSprayStats.query.filter(
+                PlayerSprayStats.player_id.in_({line['player_id'] for line in lines}),
+                PlayerSprayStats.season == season,
+                PlayerSprayStats.tournament == tournament)}
+    for line in lines:
+        _add(rows, (line['player_id'], season, tournament, line['zone']), line, sign)
+    if sign < 0:
+        for row in rows.values():
+            if not row.hits and not row.outs and not row.errors:
+                db.session.delete(row)
+
+
+def rebuild():
+    """由所有已完成紀錄的比賽重新計算落點累計，需由呼叫端 commit。"""
+    PlayerSprayStats.query.delete()
+    rows = {}
+    season = GAME_SEASON.label('season')
+    for line in raw_lines((AtBatStat.player_id, season, Game.tournament), recorded=True):
+        key = (line['player_id'], int(line['season'] or 0), line['tournament'] or '', line['zone'])
+        _add(rows, key, line, 1)
+
+
+def _rollup_lines(player_id=None, season=None, tournament=None):
+    query = db.session.query(PlayerSprayStats.zone,
+                             *[func.coalesce(func.sum(getattr(PlayerSprayStats, name)), 0).label(name)
+                               for name in COUNTS])
+    if player_id is not None:
+        query = query.filter(PlayerSprayStats.player_id == player_id)
+    if season:
+        query = query.filter(PlayerSprayStats.season == int(season))
+    if tournament:
+        query = query.filter(PlayerSprayStats.tournament == tournament)
+    return [row._asdict() for row in query.group_by(PlayerSprayStats.zone)]
+
+
+def spray_chart(player_id=None, start=None, end=None, opponent=None, **filters):
+    """噴射圖資料：ZONES 順序的 [{zone, label, x, y, r, hits, outs, errors, total, pct}]。
+
+    player_id 為 None 時是全隊；包含進行中的比賽。
+    """
+    if start or end or opponent:
+        lines = raw_lines((), player_id=player_id, start=start, end=end, opponent=opponent, **filters)
+    else:
+        lines = _rollup_lines(player_id, **filters) + raw_lines((), player_id=player_id, recorded=False,
+                                                                **filters)
+    by_zone = {}
+    for line in lines:
+        totals = by_zone.setdefault(line['zone'], dict.fromkeys(COUNTS, 0))
+        for name in COUNTS:
+            totals[name] += line[name]
+    chart = []
+    for code, label, _, x, y in ZONES:
+        line = by_zone.get(code, {})
+        hits, outs, errors = line.get('hits', 0), line.get('outs', 0), line.get('errors', 0)
+        chart.append({'zone': code, 'label': label, 'x': x, 'y': y,
+                      'hits': hits, 'outs': outs, 'errors': errors, 'total': hits + outs + errors})
+    grand_total = sum(z['total'] for z in chart)
+    biggest = max((z['total'] for z in chart), default=0)
+    for z in chart:
+        # 圓的面積與球數成正比
+        z['r'] = round(MAX_RADIUS * math.sqrt(z['total'] / biggest), 1) if biggest else 0
+        z['pct'] = '%.1f%%' % (100 * z['total'] / grand_total) if grand_total else '-'
+    return chart
@@ -0,0 +1,130 @@
+// 記錄員頁面的離線佇列：送出的 play 先存進 localStorage，再分批上傳到
+// /api/games/<id>/plays。收訊不好時可以繼續記錄，恢復連線後自動補傳；
+// 每筆 play 都有自己的 id，重送不會重複記錄。
+function PlayQueue(options) {
+  const key = 'yzu-plays-' + options.gameId;
+  const statusBox = document.getElementById(options.statusId);
+  let sending = false;
+  let timer = null;
+
+  function load() {
+    try { return JSON.parse(localStorage.getItem(key)) || []; } catch (e) { return []; }
+  }
+  function save(plays) { localStorage.setItem(key, JSON.stringify(plays)); }
+  function newId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+  }
+  function showStatus(text) {
+    if (statusBox) statusBox.textContent = text;
+  }
+  function schedule(delay) {
+    clearTimeout(timer);
+    timer = setTimeout(flush, delay);
+  }
+  function button(label, onClick) {
+    const b = document.createElement('button');
+    b.type = 'button';
+    b.textContent = label;
+    b.style.marginLeft = '6px';
+    b.addEventListener('click', onClick);
+    return b;
+  }
+  // 重送也不會成功的錯誤（比賽已完成紀錄、整批不合法……）：停止自動重送，
+  // 讓記錄員決定保留（之後送出新紀錄或重新整理頁面時再上傳）或丟棄
+  function stop(message) {
+    clearTimeout(timer);
+    const text = message + '（待上傳 ' + load().length + ' 筆）';
+    if (!statusBox) {
+      alert(text);
+      return;
+    }
+    statusBox.textContent = text;
+    statusBox.append(
+      button('保留', function() {
+        showStatus('已保留 ' + load().length + ' 筆，下次送出或重新整理頁面時再上傳');
+      }),
+      button('丟棄', function() {
+        if (!confirm('確定丟棄 ' + load().length + ' 筆尚未上傳的紀錄？')) return;
+        save([]);
+        showStatus('已丟棄尚未上傳的紀錄');
+      }));
+  }
+
+  function flush() {
+    const plays = load();
+    if (sending || plays.length === 0) return;
+    sending = true;
+    const batch = plays.slice(0, options.batchSize || 50);
+    showStatus('上傳中… 待上傳 ' + plays.length + ' 筆');
+    fetch(options.url, {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({plays: batch})
+    }).then(function(r) {
+      // 錯誤頁不一定是 JSON（例如比賽已被刪除的 404）
+      return r.json().catch(function() { return {}; })
+        .then(function(body) { return {status: r.status, body: body}; });
+    }).then(function(res) {
+      sending = false;
+      if (res.status === 200) {
+        const done = new Set(res.body.applied.concat(res.body.duplicates));
+        const rest = load().filter(function(p) { return !done.has(p.id); });
+        save(rest);
+        if (rest.length) {
+          schedule(0);
+        } else {
+          window.location = res.body.next_url;
+        }
+      } else if (res.status === 409 && res.body.retry) {
+        // 另一台裝置剛好同時寫入：已寫入的 play 會被略過，稍等一下整批重送
+        showStatus('比賽資料已更新，重新上傳中（待上傳 ' + load().length + ' 筆）');
+        schedule(200 + Math.random() * 800);
+      } else if (res.status === 422 && res.body.index != null) {
+        // 這筆不合法（例如已經三出局）：提醒記錄員後丟掉，其餘的繼續上傳
+        const bad = batch[res.body.index];
+        alert('有一筆紀錄無法寫入：' + res.body.error);
+        save(load().filter(function(p) { return p.id !== bad.id; }));
+        schedule(0);
+      } else if (res.status >= 500) {
+        showStatus('上傳失敗，稍後重試（待上傳 ' + load().length + ' 筆）');
+        schedule(5000);
+      } else {
+        stop('無法上傳：' + (res.body.error || 'HTTP ' + res.status));
+      }
+    }).catch(function() {
+      sending = false;
+      showStatus('離線中：待上傳 ' + load().length + ' 筆，恢復連線後自動上傳');
+      schedule(5000);
+    });
+  }
+
+  function enqueue(play) {
+    play.id = newId();
+    const plays = load();
+    plays.push(play);
+    save(plays);
+    showStatus('待上傳 ' + plays.length + ' 筆');
+    // 連續輸入時稍等一下，讓幾筆合併成一批
+    schedule(300);
+  }
+
+  window.addEventListener('online', function() { schedule(0); });
+  if (load().length) schedule(0);
+  return {enqueue: enqueue, flush: flush, pending: function() { return load().length; }};
+}
+
+// 讓表單送出（包含按鈕直接呼叫的 form.submit()）改成放進佇列；
+// toPlay 把表單轉成一筆 play，回傳 null 表示這次不送出
+function queueForm(form, queue, toPlay) {
+  function handle(e) {
+    if (e) e.preventDefault();
+    const play = toPlay(new FormData(form));
+    if (play) {
+      queue.enqueue(play);
+      form.reset();
+    }
+  }
+  form.submit = function() { handle(); };
+  form.addEventListener('submit', handle);
+}
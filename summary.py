@@ -0,0 +1,204 @@
+from flask import g
+from models import Player, AtBatStat, DefenseStat
+from results import BY_CODE, NOTE_RUNS_CODES, BUTTON_CODES
+
+
+def atbat_runs(ab):
+    # '對手失誤' / '暴投' 的得分存在 note 裡
+    runs = ab.rbis or 0
+    if ab.note and ab.result_code in NOTE_RUNS_CODES:
+        runs += int(ab.note)
+    return runs
+
+
+def resolve_players(ids):
+    """一次用 IN (...) 載入需要的球員，回傳 {id: Player}。
+
+    結果暫存在 flask.g，同一個 request 內已載入的球員不會再查詢。
+    """
+    players = g.setdefault('players_by_id', {})
+    missing = {pid for pid in ids if pid is not None and pid not in players}
+    if missing:
+        for p in Player.query.filter(Player.id.in_(missing)).all():
+            players[p.id] = p
+    return players
+
+
+def get_stats_table(atbats, players):
+    atbats = [ab for ab in atbats
+        if not (ab.order == -1 and ab.note == '防守失誤')
+        and ab.result_code not in NOTE_RUNS_CODES]
+    innings = sorted(set([a.inning for a in atbats]))
+    max_inning = max(innings) if innings else 9
+    groups = {}
+    total = {'ab': 0, 'hit': 0, 'hr': 0, 'rbi': 0, 'run': 0, 'inning_results': [0 for _ in range(max_inning)]}
+    for ab in atbats:
+        kind = BY_CODE[ab.result_code]
+        if not kind.is_pa:
+            continue
+        key = (ab.order, ab.player_id, ab.note or '', ab.position or '')
+        if key not in groups:
+            groups[key] = {
+                "order": ab.order,
+                "player": players.get(ab.player_id),
+                "note":"",
+                "position": ab.position or "",
+                "results": [""] * max_inning,
+                "ab": 0, "hit": 0, "hr": 0, "rbi": 0
+            }
+        idx = ab.inning - 1
+        groups[key]["results"][idx] += ("/" if groups[key]["results"][idx] else "") + (ab.result or "")
+        if kind.is_ab:
+            groups[key]["ab"] += 1
+            total['ab'] += 1
+        if kind.is_hit:
+            groups[key]["hit"] += 1
+            total['hit'] += 1
+        if kind.is_hr:
+            groups[key]["hr"] += 1
+            total['hr'] += 1
+        if ab.rbis:
+            groups[key]["rbi"] += ab.rbis
+            total['rbi'] += ab.rbis
+    stats_table = list(groups.values())
+    return stats_table, max_inning, total
+
+
+# 將局數（出局數）轉換為 1 2/3 這樣格式
+def format_ip(outs):
+    full = outs // 3
+    rem = outs % 3
+    return f"{full} {rem}/3" if rem else str(full)
+
+
+def calculate_pitcher_stats(defense_stats, players):
+    pitcher_groups = {}
+    for rec in defense_stats:
+        pid = rec.pitcher_id
+        if pid is None:
+            continue
+        if pid not in pitcher_groups:
+            pitcher_groups[pid] = {
+                'name': players[pid].name if pid in players else "",
+                'pitcher_id': pid,
+                'innings_outs': 0,          # 累出局數，最後自行轉為局數
+                'batters': 0,
+                'pitch_count': 0,
+                'strikes': 0,
+                'hits': 0,
+                'hr': 0,
+                'bb': 0,
+                'hbp': 0,
+                'k': 0,
+                'run': 0
+            }
+        kind = BY_CODE[rec.result_code]
+        line = pitcher_groups[pid]
+        line['batters'] += kind.is_pa
+        line['pitch_count'] += rec.pitch_count
+        line['strikes'] += rec.strike
+        line['run'] += rec.runs
+        line['innings_outs'] += kind.outs
+        line['hits'] += kind.is_hit
+        line['hr'] += kind.is_hr
+        line['bb'] += kind.is_bb
+        line['hbp'] += kind.is_hbp
+        line['k'] += kind.is_k
+    # 統計 Total
+    total = {
+        'name': "Total",
+        'innings_outs': 0, 'batters': 0, 'pitch_count': 0, 'strikes': 0, 'hits': 0, 'hr': 0,
+        'bb': 0, 'hbp': 0, 'k': 0, 'run': 0
+    }
+    for v in pitcher_groups.values():
+        for key in total.keys():
+            if key != 'name': total[key] += v[key]
+    for v in pitcher_groups.values():
+        v['ip'] = format_ip(v['innings_outs'])
+    total['ip'] = format_ip(total['innings_outs'])
+    return list(pitcher_groups.values()), total
+
+
+class GameSummary:
+    """一場比賽的完整數據（比分表、打擊、投手、每局用球數）。
+
+    每場比賽只讀一次 AtBatStat / DefenseStat，之後全部在記憶體內計算，
+    game_detail 與 export_game_excel 共用同一份結果。
+    """
+
+    def __init__(self, game, atbats, defense_stats, players):
+        self.game = game
+        self.stats_table, self.max_inning, self.total = get_stats_table(atbats, players)   # 打擊數據用
+        self.pitcher_stats, self.pitcher_total = calculate_pitcher_stats(defense_stats, players)   # 投手數據用
+
+        # ====== 比分表 =======
+        max_inning = self.max_inning
+        self.team_scores_per_inning = [0] * max_inning
+        self.opponent_scores_per_inning = [0] * max_inning
+        self.team_hits = 0
+        self.opponent_hits = 0
+        self.team_errors = 0
+        self.opponent_errors = 0
+        for ab in atbats:
+            if 1 <= ab.inning <= max_inning:
+                # 本隊 RBIs + '對手失誤'/'暴投' 的得分
+                self.team_scores_per_inning[ab.inning - 1] += atbat_runs(ab)
+            kind = BY_CODE[ab.result_code]
+            if kind.is_hit:
+                self.team_hits += 1
+            # 對手失誤：進攻時的 '對手失誤' + 下拉選單選的 '失誤'，排除自己防守時的註記
+            if kind.is_error and ab.note != '防守失誤':
+                self.opponent_errors += 1
+
+        self.defense_records = []
+        pitchers = {}
+        pitch_counts = {}
+        innings = set()
+        for r in defense_stats:
+            if 1 <= r.inning <= max_inning:
+                self.opponent_scores_per_inning[r.inning - 1] += r.runs or 0
+            kind = BY_CODE[r.result_code]
+            if kind.is_hit:
+                self.opponent_hits += 1
+            # 我方失誤 = '失誤'(下拉選單) + '防守失誤'(按鈕)
+            if kind.is_error:
+                self.team_errors += 1
+            innings.add(r.inning)
+            if r.pitcher_id:
+                if r.pitcher_id not in pitchers:
+                    pitcher = players.get(r.pitcher_id)
+                    pitchers[r.pitcher_id] = pitcher.name if pitcher else ""
+                key = (r.pitcher_id, r.inning)
+                pitch_counts[key] = pitch_counts.get(key, 0) + r.pitch_count
+            # '防守失誤' (按鈕) 或 '暴投' (按鈕) 不顯示在防守打席紀錄
+            if r.result_code in BUTTON_CODES:
+                continue
+            self.defense_records.append({
+                "inning": r.inning,
+                "pitcher": players.get(r.pitcher_id),
+                "batter_name": r.batter_name,
+                "strike": r.strike,
+                "ball": r.ball,
+                "pitch_count": r.pitch_count,
+                "result": r.result
+            })
+
+        # ==== 投手每局用球數 ====
+        # innings: 1,2,...N  pitcher_inning_data: list of {name, [n局,n局,...]}
+        self.pitcher_innings = sorted(innings)
+        self.pitcher_inning_data = []
+        for pid, pname in pitchers.items():
+            per_inning = [pitch_counts.get((pid, inn), 0) or "" for inn in self.pitcher_innings]
+            self.pitcher_inning_data.append({
+                "name": pname,
+                "data": per_inning
+            })
+
+    @classmethod
+    def load(cls, game):
+        atbats = AtBatStat.query.filter_by(game_id=game.id).order_by(AtBatStat.id).all()
+        defense_stats = (DefenseStat.query.filter_by(game_id=game.id)
+                         .order_by(DefenseStat.inning, DefenseStat.id).all())
+        players = resolve_players(
+            [ab.player_id for ab in atbats] + [ds.pitcher_id for ds in defense_stats])
+        return cls(game, atbats, defense_stats, players)
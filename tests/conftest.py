@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+import pytest
+
+# app.py 在 import 時就讀 DATABASE_URL，所以先指到暫存的 SQLite 檔
+_tmp = tempfile.mkdtemp(prefix='baseball-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['EXPORT_DIR'] = os.path.join(_tmp, 'exports')
+os.environ.pop('CACHE_REDIS_URL', None)
+
+from app import app as flask_app   # noqa: E402
+from models import db, Player, Game, GameBattingOrder   # noqa: E402
+import migrations   # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        migrations.upgrade()
+    yield flask_app
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def game_id(app):
+    """排好九棒、設定好投手的新比賽（先攻），回傳 id。"""
+    with app.app_context():
+        players = [Player(name=f'球員{i}', number=i, position='IF') for i in range(1, 10)]
+        db.session.add_all(players)
+        db.session.flush()
+        game = Game(date=date(2025, 5, 1), opponent='測試大學', tournament='測試盃', team_score=0,
+                    opponent_score=0, first_attack='A', current_pitcher_id=players[0].id)
+        db.session.add(game)
+        db.session.flush()
+        db.session.add_all(GameBattingOrder(game_id=game.id, player_id=p.id, order=i)
+                           for i, p in enumerate(players))
+        db.session.commit()
+        return game.id
@@ -0,0 +1,9 @@
+import benchmark
+
+
+def test_routes_stay_within_query_budgets(app):
+    # benchmark.py 的 QUERY_BUDGETS：寫出 N+1 查詢時這裡會失敗
+    benchmark.generate_season(app, games=10, seed=2)
+    results = benchmark.run_benchmarks(app, samples=3, seed=2)
+    assert set(results) == set(benchmark.QUERY_BUDGETS)
+    assert benchmark.report(results) == []
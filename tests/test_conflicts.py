@@ -0,0 +1,70 @@
+from unittest import mock
+from models import db, Game, AtBatStat
+import play_log
+
+
+def _bump_elsewhere(app, game_id):
+    # 模擬另一台裝置在這個 request 讀到比賽之後先寫入
+    with db.engine.begin() as conn:
+        conn.execute(db.text('UPDATE game SET data_version = data_version + 1, team_score = team_score + 1 '
+                             'WHERE id = :id'), {'id': game_id})
+
+
+def test_stale_form_post_is_retried_once(app, client, game_id):
+    capture = play_log.capture
+    calls = []
+
+    def capture_after_concurrent_write(game, *args, **kwargs):
+        if not calls:
+            _bump_elsewhere(app, game.id)
+        calls.append(game.id)
+        return capture(game, *args, **kwargs)
+
+    with mock.patch.object(play_log, 'capture', capture_after_concurrent_write):
+        r = client.post(f'/record_atbat/{game_id}/0/1', data={'result': '全壘', 'rbis': 1})
+    assert r.status_code == 302
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        # 兩邊的寫入都生效
+        assert (game.team_score, game.data_version) == (2, 2)
+        assert AtBatStat.query.filter_by(game_id=game_id).count() == 1
+
+
+def test_stale_form_post_returns_409(app, client, game_id):
+    capture = play_log.capture
+
+    def capture_after_concurrent_write(game, *args, **kwargs):
+        _bump_elsewhere(app, game.id)
+        return capture(game, *args, **kwargs)
+
+    with mock.patch.object(play_log, 'capture', capture_after_concurrent_write):
+        r = client.post(f'/record_atbat/{game_id}/0/1', data={'result': '全壘', 'rbis': 1})
+    assert r.status_code == 409
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        # 重做一次也撞到：只有另一台裝置的兩次寫入生效
+        assert (game.team_score, game.data_version) == (2, 2)
+        assert AtBatStat.query.filter_by(game_id=game_id).count() == 0
+
+
+def test_stale_batch_upload_returns_409_with_retry(app, client, game_id):
+    capture = play_log.capture
+
+    def capture_after_concurrent_write(game, *args, **kwargs):
+        if not getattr(capture_after_concurrent_write, 'done', False):
+            capture_after_concurrent_write.done = True
+            _bump_elsewhere(app, game.id)
+        return capture(game, *args, **kwargs)
+
+    plays = [{'id': 'x1', 'type': 'atbat', 'inning': 1, 'result': '全壘', 'rbis': 1}]
+    with mock.patch.object(play_log, 'capture', capture_after_concurrent_write):
+        r = client.post(f'/api/games/{game_id}/plays', json={'plays': plays})
+    assert r.status_code == 409
+    assert r.get_json()['retry'] is True
+
+    # 重送後依最新狀態寫入
+    r = client.post(f'/api/games/{game_id}/plays', json={'plays': plays})
+    assert r.status_code == 200
+    with app.app_context():
+        assert db.session.get(Game, game_id).team_score == 2
+
@@ -0,0 +1,15 @@
+import pytest
+from db_engine import engine_options, PROFILES
+
+URL = 'postgresql://scorer@localhost/baseball'
+
+
+def test_no_profile_keeps_sqlalchemy_defaults():
+    assert engine_options(URL, environ={}) == {}
+    assert engine_options(URL, environ={'DB_POOL_SIZE': '8'}) == {'pool_size': 8}
+
+
+def test_profiles_are_opt_in():
+    assert engine_options(URL, environ={'DB_PROFILE': 'web'}) == PROFILES['web']
+    with pytest.raises(ValueError):
+        engine_options(URL, environ={'DB_PROFILE': 'huge'})
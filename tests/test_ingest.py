@@ -0,0 +1,58 @@
+from models import db, Game, AtBatStat, PlayEvent
+
+
+def _counts(app, game_id):
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        return (AtBatStat.query.filter_by(game_id=game_id).count(),
+                PlayEvent.query.filter_by(game_id=game_id).count(),
+                game.team_score, game.next_batter_order)
+
+
+def _atbat(play_id, result='一安', rbis=0):
+    return {'id': play_id, 'type': 'atbat', 'inning': 1, 'result': result, 'rbis': rbis}
+
+
+def test_invalid_play_rejects_whole_batch(app, client, game_id):
+    before = _counts(app, game_id)
+    r = client.post(f'/api/games/{game_id}/plays', json={'plays': [_atbat('a1'), _atbat('a2', result='??')]})
+    assert r.status_code == 422
+    assert r.get_json()['index'] == 1
+    assert _counts(app, game_id) == before
+
+
+def test_third_out_closes_half_inning(app, client, game_id):
+    plays = [_atbat(f'k{i}', result='三振') for i in range(4)]
+    r = client.post(f'/api/games/{game_id}/plays', json={'plays': plays})
+    assert r.status_code == 422
+    assert r.get_json()['index'] == 3
+
+
+def test_missing_client_id(client, game_id):
+    r = client.post(f'/api/games/{game_id}/plays', json={'plays': [{'type': 'atbat', 'result': '一安'}]})
+    assert r.status_code == 422
+
+
+def test_resend_is_idempotent(app, client, game_id):
+    plays = [_atbat('p1'), _atbat('p2', result='全壘', rbis=2), _atbat('p3', result='三振')]
+    r = client.post(f'/api/games/{game_id}/plays', json={'plays': plays})
+    assert r.status_code == 200
+    assert r.get_json()['applied'] == ['p1', 'p2', 'p3']
+    after = _counts(app, game_id)
+    assert after == (3, 3, 2, 3)
+
+    r = client.post(f'/api/games/{game_id}/plays', json={'plays': plays + [_atbat('p4')]})
+    assert r.status_code == 200
+    assert r.get_json()['applied'] == ['p4']
+    assert r.get_json()['duplicates'] == ['p1', 'p2', 'p3']
+    assert _counts(app, game_id) == (4, 4, 2, 4)
+
+
+def test_defense_without_pitcher(app, client, game_id):
+    with app.app_context():
+        db.session.get(Game, game_id).current_pitcher_id = None
+        db.session.commit()
+    r = client.post(f'/api/games/{game_id}/plays',
+                    json={'plays': [_atbat('a1'), {'id': 'd1', 'type': 'defense', 'inning': 1, 'result': '三振'}]})
+    assert r.status_code == 422
+    assert r.get_json() == {'error': '尚未設定投手', 'index': 1}
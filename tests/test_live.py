@@ -0,0 +1,35 @@
+import threading
+import live
+
+
+def test_finished_game_is_pruned_after_waiters_leave():
+    broadcaster = live.Broadcaster()
+    broadcaster.publish(1, 3)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(broadcaster.wait(1, 3, timeout=5)))
+    waiter.start()
+    while not broadcaster._waiting:
+        pass
+    broadcaster.publish(1, 4, final=True)
+    waiter.join()
+    assert results == [4]
+    assert broadcaster._versions == {} and broadcaster._waiting == {}
+
+
+def test_deleted_game_ends_waiters():
+    broadcaster = live.Broadcaster()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(broadcaster.wait(2, 1, timeout=5)))
+    waiter.start()
+    while not broadcaster._waiting:
+        pass
+    broadcaster.close(2)
+    waiter.join()
+    assert results[0] > 1
+    assert broadcaster._versions == {}
+
+
+def test_build_locks_are_released(app, game_id):
+    with app.app_context():
+        assert live.get_snapshot(game_id)['version'] == 0
+    assert live._build_locks == {}
@@ -0,0 +1,47 @@
+import shutil
+import sqlite3
+from datetime import date
+from flask import Flask
+from sqlalchemy import inspect
+from models import db, Game, AtBatStat, GameInningState, PlayerSeasonStats
+from results import CODES
+import migrations
+
+
+def test_upgrade_baseline_database(tmp_path):
+    # 用版本庫裡的舊版資料庫（VARCHAR 日期、中文結果字串）升級到最新版本
+    path = tmp_path / 'baseline.db'
+    shutil.copy('instance/baseball.db', path)
+    conn = sqlite3.connect(path)
+    player_id = conn.execute("INSERT INTO player (name, number, position) VALUES ('舊資料', 99, 'C')").lastrowid
+    game_id = conn.execute("INSERT INTO game (date, opponent, team_score, opponent_score, first_attack, "
+                           "is_recorded, tournament, next_batter_order) "
+                           "VALUES ('2024/05/01', '舊對手', 1, 0, 'A', 1, '舊賽事', 1)").lastrowid
+    conn.execute('INSERT INTO at_bat_stat (game_id, player_id, "order", result, inning, rbis, position, note) '
+                 "VALUES (?, ?, 0, '一安', 1, 1, 'LF', '')", (game_id, player_id))
+    conn.commit()
+    conn.close()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        migrations.upgrade()
+        assert migrations.get_version() == migrations.MIGRATIONS[-1][0]
+
+        game = db.session.get(Game, game_id)
+        assert game.date == date(2024, 5, 1)
+        assert game.data_version == 0
+        atbat = AtBatStat.query.filter_by(game_id=game_id).one()
+        assert atbat.result_code == CODES['一安']
+        if sqlite3.sqlite_version_info >= (3, 35):
+            assert 'result' not in {c['name'] for c in inspect(db.engine).get_columns('at_bat_stat')}
+        state = GameInningState.query.filter_by(game_id=game_id, inning=1, half='A').one()
+        assert (state.hits, state.runs) == (1, 1)
+        line = PlayerSeasonStats.query.filter_by(player_id=player_id, season=2024).one()
+        assert (line.games, line.ab, line.hit, line.rbi) == (1, 1, 1, 1)
+
+        # 再跑一次不會重複套用
+        migrations.upgrade()
+        assert PlayerSeasonStats.query.filter_by(player_id=player_id).count() == 1
+        db.session.remove()
@@ -0,0 +1,55 @@
+from models import db, Game, AtBatStat, PlayEvent
+from game_state import get_inning_state
+import play_log
+
+# 每一筆 (局數, 結果, 打點)：三個半局、跨過 SNAPSHOT_EVERY 的快照
+PLAYS = [(inning, result, rbis)
+         for inning in (1, 2, 3)
+         for result, rbis in (('一安', 0), ('二安', 1), ('四壞', 0), ('三振', 0), ('全壘', 3),
+                              ('內滾', 0), ('觸身', 0), ('外飛', 1))]
+
+
+def _state(app, game_id, inning):
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        state = get_inning_state(game_id, inning, 'A')
+        return game.team_score, game.next_batter_order, state.outs if state else 0
+
+
+def test_undo_and_replay_match_recorded_states(app, client, game_id):
+    assert len(PLAYS) > play_log.SNAPSHOT_EVERY
+    history = []
+    for inning, result, rbis in PLAYS:
+        r = client.post(f'/record_atbat/{game_id}/0/{inning}', data={'result': result, 'rbis': rbis})
+        assert r.status_code == 302
+        history.append((inning, _state(app, game_id, inning)))
+
+    with app.app_context():
+        assert PlayEvent.query.filter_by(game_id=game_id).count() == len(PLAYS)
+        for seq, (inning, (score, next_order, _)) in enumerate(history, 1):
+            state = play_log.replay_state(game_id, seq)
+            assert (state['team_score'], state['next_batter_order']) == (score, next_order)
+
+    # 一筆一筆撤銷，每一步都回到記錄當時的比分與出局數
+    for seq in range(len(history) - 1, 0, -1):
+        assert client.get(f'/undo/{game_id}').status_code == 302
+        inning, expected = history[seq - 1]
+        assert _state(app, game_id, inning) == expected
+        with app.app_context():
+            state = play_log.replay_state(game_id)
+            assert (state['team_score'], state['next_batter_order']) == expected[:2]
+
+
+def test_legacy_undo_clamps_score(app, client, game_id):
+    # 沒有操作紀錄的舊比賽：比分比紀錄少時撤銷不會變成負數
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        db.session.add(AtBatStat(game_id=game_id, player_id=game.current_pitcher_id, order=0, result='全壘',
+                                 inning=1, rbis=3))
+        game.team_score = 1
+        db.session.commit()
+    assert client.get(f'/undo_atbat/{game_id}/0/1').status_code == 302
+    with app.app_context():
+        game = db.session.get(Game, game_id)
+        assert (game.team_score, game.data_version) == (0, 1)
+        assert AtBatStat.query.filter_by(game_id=game_id).count() == 0
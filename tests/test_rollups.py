@@ -0,0 +1,64 @@
+from models import db, GameBattingOrder, PlayerSeasonStats, PlayerSprayStats, OpponentBatterStats, BaseOutStats, PlayerBaseOutStats
+import rollups
+import spray
+
+ROLLUP_MODELS = (PlayerSeasonStats, PlayerSprayStats, OpponentBatterStats, BaseOutStats, PlayerBaseOutStats)
+
+
+def _rollup_rows(app):
+    with app.app_context():
+        return [sorted(tuple(getattr(row, c.key) for c in model.__table__.columns if c.key != 'id')
+                       for row in model.query) for model in ROLLUP_MODELS]
+
+
+def _atbat(client, game_id, result, rbis=0, position='LF', bases=0):
+    return client.post(f'/record_atbat/{game_id}/0/1',
+                       data={'result': result, 'rbis': rbis, 'position': position, 'bases': bases})
+
+
+def test_recorded_game_is_read_only(app, client, game_id):
+    assert _atbat(client, game_id, '一安').status_code == 302
+    assert client.post(f'/finish_record/{game_id}').status_code == 302
+    assert _atbat(client, game_id, '一安').status_code == 409
+    assert client.get(f'/undo/{game_id}').status_code == 409
+    r = client.post(f'/api/games/{game_id}/plays',
+                    json={'plays': [{'id': 'late', 'type': 'atbat', 'inning': 1, 'result': '一安'}]})
+    assert r.status_code == 409
+    assert r.get_json()['retry'] is False
+
+
+def test_reopen_and_finish_matches_rebuild(app, client, game_id):
+    _atbat(client, game_id, '二安', rbis=1)
+    _atbat(client, game_id, '外飛', position='CF')
+    client.post(f'/finish_record/{game_id}')
+    finished = _rollup_rows(app)
+
+    assert client.post(f'/reopen_record/{game_id}').status_code == 302
+    _atbat(client, game_id, '全壘', rbis=2, position='RF')
+    assert client.get(f'/undo/{game_id}').status_code == 302
+    _atbat(client, game_id, '三振')
+    client.post(f'/finish_record/{game_id}')
+    incremental = _rollup_rows(app)
+    assert incremental != finished
+
+    with app.app_context():
+        rollups.rebuild_rollups()
+        db.session.commit()
+    assert _rollup_rows(app) == incremental
+
+
+def test_spray_chart_includes_game_in_progress(app, client, game_id):
+    with app.app_context():
+        player_id = GameBattingOrder.query.filter_by(game_id=game_id, order=0).one().player_id
+
+    def zone_total(zone):
+        with app.app_context():
+            return {z['zone']: z['total'] for z in spray.spray_chart(player_id)}[zone]
+
+    _atbat(client, game_id, '二安', position='CF')
+    assert zone_total('CF') == 1
+    client.post(f'/finish_record/{game_id}')
+    assert zone_total('CF') == 1
+    client.post(f'/reopen_record/{game_id}')
+    assert client.get(f'/undo/{game_id}').status_code == 302
+    assert zone_total('CF') == 0
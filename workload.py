@@ -0,0 +1,74 @@
+"""投手跨場次的用球量與休息天數。
+
+以 GameInningPitcher（每場每局每位投手的用球數）依比賽日期加總，只查比賽日前
+LOOKBACK_DAYS 天內的比賽（game.date 與 (pitcher_id, game_id) 都有索引），
+資料累積多個賽季也只會讀到最近幾場。
+"""
+from datetime import timedelta
+from models import db, Game, GameInningPitcher
+
+LOOKBACK_DAYS = 14
+WINDOWS = (1, 3, 7)
+# (用球數下限, 之後需要休息的天數)，由大到小比對
+REST_RULES = [(76, 4), (61, 3), (46, 2), (31, 1), (0, 0)]
+# 連續出賽超過這個天數，隔天必須休息
+MAX_CONSECUTIVE_DAYS = 2
+
+
+def required_rest(pitches):
+    for minimum, days in REST_RULES:
+        if pitches >= minimum:
+            return days
+    return 0
+
+
+def daily_pitches(as_of, pitcher_ids=None):
+    """{pitcher_id: {日期: 用球數}}，範圍為 as_of 前 LOOKBACK_DAYS 天到 as_of 當天。"""
+    start = as_of - timedelta(days=LOOKBACK_DAYS)
+    query = (db.session.query(GameInningPitcher.pitcher_id, Game.date,
+                              db.func.sum(GameInningPitcher.pitch_count))
+             .join(Game, Game.id == GameInningPitcher.game_id)
+             .filter(Game.date >= start, Game.date <= as_of)
+             .group_by(GameInningPitcher.pitcher_id, Game.date))
+    if pitcher_ids is not None:
+        query = query.filter(GameInningPitcher.pitcher_id.in_(pitcher_ids))
+    days = {}
+    for pitcher_id, day, pitches in query:
+        if pitches:
+            days.setdefault(pitcher_id, {})[day] = pitches
+    return days
+
+
+def pitcher_workload(by_day, as_of):
+    """由單一投手的 {日期: 用球數} 算出近期用球量與 as_of 當天能否上場。"""
+    line = {f'last_{n}': sum(p for d, p in by_day.items() if (as_of - d).days < n) for n in WINDOWS}
+
+    # 連續出賽天數：今天有投就從今天往回數，否則從昨天
+    day = as_of if as_of in by_day else as_of - timedelta(days=1)
+    streak = 0
+    while day in by_day:
+        streak += 1
+        day -= timedelta(days=1)
+
+    # 能否上場只看今天以前的出賽
+    available_on = as_of
+    for d, pitches in by_day.items():
+        if d < as_of:
+            available_on = max(available_on, d + timedelta(days=required_rest(pitches) + 1))
+    prior_streak = streak - (1 if as_of in by_day else 0)
+    if prior_streak >= MAX_CONSECUTIVE_DAYS:
+        available_on = max(available_on, as_of + timedelta(days=1))
+
+    line.update(consecutive_days=streak,
+                last_pitched=max(by_day, default=None),
+                rest_days=(available_on - as_of).days,
+                available=available_on <= as_of)
+    return line
+
+
+def workload_for_game(game, pitcher_ids=None):
+    """以比賽日期為準，回傳 {pitcher_id: 用球量}；沒有近期出賽的投手也會有一列（全部為 0）。"""
+    as_of = game.date
+    days = daily_pitches(as_of, pitcher_ids)
+    ids = pitcher_ids if pitcher_ids is not None else days
+    return {pid: pitcher_workload(days.get(pid, {}), as_of) for pid in ids}